@@ -5,11 +5,51 @@ import {
   encryptEmbedding,
   decryptEmbedding,
 } from "../utils/cryptoEmbedding.js";
-import { encodeImageToEmbedding } from "../utils/faceAuthClient.js";
+import {
+  encodeImageToEmbedding,
+  encodeEnrollmentFrames,
+  identifyFace,
+  upsertFaceIdentity,
+  bulkUpsertFaceIdentities,
+} from "../utils/faceAuthClient.js";
 import { cosineSimilarity } from "../utils/cosine.js";
 import generatedAccessToken from "../utils/generatedAccessToken.js";
 import genertedRefreshToken from "../utils/generatedRefreshToken.js";
 
+// "scan" (mặc định): giải mã và so cosine với mọi template trong Mongo
+// "index": dùng index 1:N phía Python (/identify)
+const LOGIN_MODE = (process.env.FACE_LOGIN_MODE || "scan").toLowerCase();
+// "batch" (mặc định): gửi mọi frame trong 1 request /encode/enroll
+// "frames": gọi /encode cho từng frame rồi tự tính trung bình như cũ
+const ENROLL_MODE = (process.env.FACE_ENROLL_MODE || "batch").toLowerCase();
+let identityIndexSynced = false;
+
+// Đẩy toàn bộ template hiện có sang index Python (lần đầu / index trống)
+async function syncFaceIdentityIndex() {
+  const templates = await UserFaceTemplateModel.find(
+    {},
+    { userId: 1, embeddingEncB64: 1, ivB64: 1, tagB64: 1 }
+  );
+  const items = [];
+  for (const t of templates) {
+    try {
+      items.push({
+        userId: t.userId,
+        embedding: decryptEmbedding(t.embeddingEncB64, t.ivB64, t.tagB64),
+      });
+    } catch (e) {
+      console.error(
+        "[faceIdentitySync] decrypt failed for userId:",
+        String(t.userId),
+        e?.message
+      );
+    }
+  }
+  if (items.length) await bulkUpsertFaceIdentities(items);
+  identityIndexSynced = true;
+  console.log("[faceIdentitySync] pushed templates:", items.length);
+}
+
 function l2norm(vec) {
   let s = 0;
   for (let i = 0; i < vec.length; i++) s += vec[i] * vec[i];
@@ -18,6 +58,58 @@ function l2norm(vec) {
   return vec;
 }
 
+// Enroll cũ: gọi /encode từng frame, tự tính mean + L2
+async function enrollTemplateByFrames(files) {
+  const embeds = [];
+  let bestQuality = 0;
+  let modelVersion = "arcface_r100_onnx_v1";
+
+  for (const file of files) {
+    const mime = file.mimetype || "image/jpeg";
+    console.log("[Enroll] calling /encode for", mime, "size:", file.size);
+    const encResp = await encodeImageToEmbedding(file.buffer, mime);
+    const { embedding, modelVersion: mv, quality, error } = encResp || {};
+    if (error) console.error("[Enroll] /encode returned error:", error);
+
+    if (embedding && embedding.length) {
+      embeds.push(embedding);
+      if (quality > bestQuality) bestQuality = quality;
+      if (mv) modelVersion = mv;
+    } else {
+      console.warn("[Enroll] No face in one frame");
+    }
+  }
+
+  console.log("[Enroll] got embeddings:", embeds.length);
+  if (!embeds.length) return null;
+
+  // mean + L2
+  const dim = embeds[0].length;
+  const mean = new Float32Array(dim);
+  for (const e of embeds) {
+    for (let i = 0; i < dim; i++) mean[i] += e[i];
+  }
+  for (let i = 0; i < dim; i++) mean[i] /= embeds.length;
+  l2norm(mean);
+
+  return { mean, count: embeds.length, bestQuality, modelVersion };
+}
+
+// Enroll 1 request: Python chọn frame tốt nhất và trả về template đã L2-normalize
+async function enrollTemplateBatch(files) {
+  const resp = await encodeEnrollmentFrames(files);
+  const { embedding, modelVersion, quality, frames_used, rejected } =
+    resp || {};
+  console.log("[Enroll] frames used:", frames_used, "rejected:", rejected);
+  if (!embedding || !embedding.length) return null;
+  return {
+    mean: new Float32Array(embedding),
+    count: frames_used,
+    bestQuality: quality,
+    modelVersion: modelVersion || "arcface_r100_onnx_v1",
+  };
+}
+
 export async function faceEnrollController(req, res) {
   try {
     const userId = req.userId;
@@ -40,43 +132,19 @@ export async function faceEnrollController(req, res) {
       });
     }
 
-    const embeds = [];
-    let bestQuality = 0;
-    let modelVersion = "arcface_r100_onnx_v1";
-
-    for (const file of files) {
-      const mime = file.mimetype || "image/jpeg";
-      console.log("[Enroll] calling /encode for", mime, "size:", file.size);
-      const encResp = await encodeImageToEmbedding(file.buffer, mime);
-      const { embedding, modelVersion: mv, quality, error } = encResp || {};
-      if (error) console.error("[Enroll] /encode returned error:", error);
-
-      if (embedding && embedding.length) {
-        embeds.push(embedding);
-        if (quality > bestQuality) bestQuality = quality;
-        if (mv) modelVersion = mv;
-      } else {
-        console.warn("[Enroll] No face in one frame");
-      }
-    }
+    const template =
+      ENROLL_MODE === "frames"
+        ? await enrollTemplateByFrames(files)
+        : await enrollTemplateBatch(files);
 
-    console.log("[Enroll] got embeddings:", embeds.length);
-    if (!embeds.length) {
+    if (!template) {
       return res.status(400).json({
         message: "Không phát hiện khuôn mặt trong các ảnh đã gửi",
         error: true,
         success: false,
       });
     }
-
-    // mean + L2
-    const dim = embeds[0].length;
-    const mean = new Float32Array(dim);
-    for (const e of embeds) {
-      for (let i = 0; i < dim; i++) mean[i] += e[i];
-    }
-    for (let i = 0; i < dim; i++) mean[i] /= embeds.length;
-    l2norm(mean);
+    const { mean, count, bestQuality, modelVersion } = template;
 
     // MÃ HÓA: dễ nổ nếu key sai
     let enc;
@@ -105,8 +173,16 @@ export async function faceEnrollController(req, res) {
 
     await UserModel.updateOne({ _id: userId }, { faceEnrolled: true });
 
+    try {
+      await upsertFaceIdentity(String(userId), mean);
+    } catch (e) {
+      // Mongo vẫn là nguồn chuẩn; index sẽ được đồng bộ lại khi login
+      identityIndexSynced = false;
+      console.error("[Enroll] identity index upsert failed:", e?.message);
+    }
+
     return res.json({
-      message: `Đăng ký khuôn mặt thành công (${embeds.length} ảnh)`,
+      message: `Đăng ký khuôn mặt thành công (${count} ảnh)`,
       error: false,
       success: true,
       data: { quality: bestQuality, modelVersion },
@@ -136,6 +212,10 @@ export async function faceLoginController(req, res) {
         .json({ message: "No image provided", error: true, success: false });
     }
 
+    if (LOGIN_MODE === "index") {
+      return await faceLoginByIndex(req, res, file);
+    }
+
     // 1) Gọi Python: phải có đúng 1 mặt, nếu 0 hoặc >1 => báo lỗi
     const {
       embedding: probe,
@@ -211,45 +291,8 @@ export async function faceLoginController(req, res) {
       });
     }
 
-    // 4) Kiểm tra trạng thái user
-    const user = await UserModel.findById(best.userId);
-    if (!user) {
-      return res.status(401).json({
-        message: "Tài khoản không tồn tại",
-        error: true,
-        success: false,
-      });
-    }
-    if (user.status !== "Active") {
-      return res.status(401).json({
-        message: "Tài khoản chưa sẵn sàng. Liên hệ Admin.",
-        error: true,
-        success: false,
-      });
-    }
-
-    // 5) Cấp JWT + cookie
-    const accesstoken = await generatedAccessToken(user._id);
-    const refreshToken = await genertedRefreshToken(user._id);
-    await UserModel.updateOne(
-      { _id: user._id },
-      { last_login_date: new Date() }
-    );
-
-    res.cookie("accessToken", accesstoken, cookiesOption);
-    res.cookie("refreshToken", refreshToken, cookiesOption);
-
-    return res.json({
-      message: "Face login successfully",
-      error: false,
-      success: true,
-      data: {
-        accesstoken,
-        refreshToken,
-        score: best.score,
-        userId: String(user._id),
-      },
-    });
+    // 4) + 5) Kiểm tra trạng thái user, cấp JWT + cookie
+    return await issueFaceLogin(res, best);
   } catch (err) {
     console.error("[faceLoginCameraController] ERROR:", err);
     return res.status(500).json({
@@ -259,3 +302,84 @@ export async function faceLoginController(req, res) {
     });
   }
 }
+
+async function issueFaceLogin(res, best) {
+  // 4) Kiểm tra trạng thái user
+  const user = await UserModel.findById(best.userId);
+  if (!user) {
+    return res.status(401).json({
+      message: "Tài khoản không tồn tại",
+      error: true,
+      success: false,
+    });
+  }
+  if (user.status !== "Active") {
+    return res.status(401).json({
+      message: "Tài khoản chưa sẵn sàng. Liên hệ Admin.",
+      error: true,
+      success: false,
+    });
+  }
+
+  // 5) Cấp JWT + cookie
+  const accesstoken = await generatedAccessToken(user._id);
+  const refreshToken = await genertedRefreshToken(user._id);
+  await UserModel.updateOne(
+    { _id: user._id },
+    { last_login_date: new Date() }
+  );
+
+  res.cookie("accessToken", accesstoken, cookiesOption);
+  res.cookie("refreshToken", refreshToken, cookiesOption);
+
+  return res.json({
+    message: "Face login successfully",
+    error: false,
+    success: true,
+    data: {
+      accesstoken,
+      refreshToken,
+      score: best.score,
+      userId: String(user._id),
+    },
+  });
+}
+
+async function faceLoginByIndex(req, res, file) {
+  const mime = file.mimetype || "image/jpeg";
+  let result = await identifyFace(file.buffer, mime);
+  const { faces_count, quality } = result || {};
+
+  if (faces_count !== 1) {
+    const msg =
+      faces_count === 0
+        ? "Không phát hiện khuôn mặt. Vui lòng tiến gần camera hơn."
+        : "Phát hiện nhiều hơn 1 gương mặt. Chỉ cho phép 1 gương mặt trong khung hình.";
+    return res.status(400).json({
+      message: msg,
+      error: true,
+      success: false,
+      data: { faces_count },
+    });
+  }
+
+  if (!result.matches?.length && !identityIndexSynced) {
+    await syncFaceIdentityIndex();
+    result = await identifyFace(file.buffer, mime);
+  }
+
+  const top = result.matches?.[0];
+  const best = top
+    ? { userId: top.userId, score: top.score }
+    : { userId: null, score: -1 };
+  const threshold = Number(process.env.FACE_SIMILARITY_THRESHOLD || 0.65);
+  if (!best.userId || best.score < threshold) {
+    return res.status(401).json({
+      message: "Không tìm thấy người dùng phù hợp",
+      error: true,
+      success: false,
+      data: { score: best.score ?? 0, threshold, quality },
+    });
+  }
+  return await issueFaceLogin(res, best);
+}
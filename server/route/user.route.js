@@ -34,7 +34,7 @@ const faceLoginLimiter = rateLimit({
 userRouter.post(
   "/auth/face/enroll",
   auth,
-  upload.array("frames", 5),
+  upload.array("frames", 30),
   faceEnrollController
 );
 // Login via camera: public, cần email + frame ảnh
@@ -4,11 +4,61 @@ const baseURL = process.env.FACE_AUTH_BASE_URL;
 if (!baseURL) throw new Error("FACE_AUTH_BASE_URL missing");
 const client = axios.create({ baseURL, timeout: 15000 });
 
+// "binary" (mặc định): gửi thẳng buffer ảnh tới /encode/binary
+// "json": gửi image_b64 tới /encode như cũ
+const TRANSPORT = (process.env.FACE_AUTH_TRANSPORT || "binary").toLowerCase();
+
+// Định dạng embedding trả về: "f32" (mặc định, base64 float32 LE), "f16", "json" (list số)
+const VECTOR_FORMAT = (
+  process.env.FACE_AUTH_VECTOR_FORMAT || "f32"
+).toLowerCase();
+const vectorParams = () =>
+  VECTOR_FORMAT === "json" ? undefined : { vec: VECTOR_FORMAT };
+
+function halfToFloat(h) {
+  const sign = h & 0x8000 ? -1 : 1;
+  const exp = (h >> 10) & 0x1f;
+  const frac = h & 0x3ff;
+  if (exp === 0) return sign * 2 ** -14 * (frac / 1024);
+  if (exp === 0x1f) return frac ? NaN : sign * Infinity;
+  return sign * 2 ** (exp - 15) * (1 + frac / 1024);
+}
+
+// "f32le-b64" / "f16le-b64" -> Float32Array; list số giữ nguyên
+function decodeEmbedding(data) {
+  const encoding = data?.embeddingEncoding;
+  if (!data || !encoding || typeof data.embedding !== "string") return data;
+  const buf = Buffer.from(data.embedding, "base64");
+  let vec;
+  if (encoding.startsWith("f16")) {
+    vec = new Float32Array(buf.length / 2);
+    for (let i = 0; i < vec.length; i++) {
+      vec[i] = halfToFloat(buf.readUInt16LE(i * 2));
+    }
+  } else {
+    vec = new Float32Array(buf.length / 4);
+    for (let i = 0; i < vec.length; i++) vec[i] = buf.readFloatLE(i * 4);
+  }
+  const { embeddingEncoding, ...rest } = data;
+  return { ...rest, embedding: vec };
+}
+
 export async function encodeImageToEmbedding(fileBuffer, mime = "image/jpeg") {
   try {
-    const b64 = fileBuffer.toString("base64");
-    const { data } = await client.post("/encode", { image_b64: b64, mime });
-    return data;
+    if (TRANSPORT === "json") {
+      const b64 = fileBuffer.toString("base64");
+      const { data } = await client.post(
+        "/encode",
+        { image_b64: b64, mime },
+        { params: vectorParams() }
+      );
+      return decodeEmbedding(data);
+    }
+    const { data } = await client.post("/encode/binary", fileBuffer, {
+      headers: { "Content-Type": "application/octet-stream" },
+      params: vectorParams(),
+    });
+    return decodeEmbedding(data);
   } catch (e) {
     console.error(
       "[faceAuthClient] /encode failed:",
@@ -17,3 +67,77 @@ export async function encodeImageToEmbedding(fileBuffer, mime = "image/jpeg") {
     throw e;
   }
 }
+
+// Enroll 1 request: gửi mọi frame (ảnh hoặc clip) tới /encode/enroll,
+// Python lọc frame mờ/nghiêng/trùng và trả về template trung bình đã L2-normalize
+export async function encodeEnrollmentFrames(files) {
+  try {
+    const form = new FormData();
+    files.forEach((file, i) => {
+      form.append(
+        "frames",
+        new Blob([file.buffer], { type: file.mimetype || "image/jpeg" }),
+        file.originalname || `frame-${i}`
+      );
+    });
+    const { data } = await client.post("/encode/enroll", form, {
+      timeout: 60000,
+      params: vectorParams(),
+    });
+    return decodeEmbedding(data);
+  } catch (e) {
+    console.error(
+      "[faceAuthClient] /encode/enroll failed:",
+      e?.response?.data || e?.message
+    );
+    throw e;
+  }
+}
+
+// ===== Index 1:N phía Python (/identify, /identity/*) =====
+export async function identifyFace(fileBuffer, mime = "image/jpeg", topK) {
+  try {
+    if (TRANSPORT === "json") {
+      const b64 = fileBuffer.toString("base64");
+      const { data } = await client.post("/identify", {
+        image_b64: b64,
+        mime,
+        ...(topK ? { top_k: topK } : {}),
+      });
+      return data;
+    }
+    const { data } = await client.post("/identify/binary", fileBuffer, {
+      headers: { "Content-Type": "application/octet-stream" },
+      params: topK ? { top_k: topK } : undefined,
+    });
+    return data;
+  } catch (e) {
+    console.error(
+      "[faceAuthClient] /identify failed:",
+      e?.response?.data || e?.message
+    );
+    throw e;
+  }
+}
+
+export async function upsertFaceIdentity(userId, embedding) {
+  const { data } = await client.put(`/identity/${userId}`, {
+    embedding: Array.from(embedding),
+  });
+  return data;
+}
+
+export async function bulkUpsertFaceIdentities(items) {
+  const { data } = await client.post("/identity/bulk", {
+    items: items.map((it) => ({
+      user_id: String(it.userId),
+      embedding: Array.from(it.embedding),
+    })),
+  });
+  return data;
+}
+
+export async function removeFaceIdentity(userId) {
+  const { data } = await client.delete(`/identity/${userId}`);
+  return data;
+}
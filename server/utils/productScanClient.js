@@ -10,13 +10,18 @@ if (!baseURL) {
   )
 }
 
+// "binary" (mặc định): gửi thẳng buffer ảnh (application/octet-stream)
+// "json": gửi image_b64 như cũ
+const TRANSPORT = (process.env.PRODUCT_SCANNER_TRANSPORT || "binary").toLowerCase()
+
 const SCAN_ENDPOINT =
-  process.env.PRODUCT_SCANNER_ENDPOINT || "/api/v1/product/recognize"
+  process.env.PRODUCT_SCANNER_ENDPOINT ||
+  (TRANSPORT === "json"
+    ? "/api/v1/product/recognize"
+    : "/api/v1/product/recognize/binary")
 
 export const scanProductFrame = async (fileBuffer, mime = "image/jpeg") => {
   try {
-    const image_b64 = fileBuffer.toString("base64")
-
     const url = new URL(
       SCAN_ENDPOINT.startsWith("http")
         ? SCAN_ENDPOINT
@@ -26,14 +31,20 @@ export const scanProductFrame = async (fileBuffer, mime = "image/jpeg") => {
       baseURL
     ).toString()
 
-    const { data } = await axios.post(
-      url,
-      {
-        image_b64,
-        mime
-      },
-      { timeout: 20000 }
-    )
+    const { data } =
+      TRANSPORT === "json"
+        ? await axios.post(
+            url,
+            {
+              image_b64: fileBuffer.toString("base64"),
+              mime
+            },
+            { timeout: 20000 }
+          )
+        : await axios.post(url, fileBuffer, {
+            headers: { "Content-Type": "application/octet-stream" },
+            timeout: 20000
+          })
 
     return data
   } catch (error) {
@@ -1,8 +1,18 @@
+from core.catalog import catalog
+from core.config import settings
+from core.inference import init_pools
 from modules.face_auth.service import face_bootstrap
 from modules.product_recognition.service import product_bootstrap
+from modules.meal_assistant.service import meal_bootstrap
 
 def bootstrap_all():
     # Khởi tạo theo thứ tự, log lỗi module nào không cản trở module khác
+    try:
+        catalog.reload()
+    except Exception as exc:
+        print("[bootstrap] catalog failed:", exc)
+    catalog.start_watcher(settings.CATALOG_WATCH_INTERVAL_S)
+
     try:
         face_bootstrap()
     except Exception as exc:
@@ -12,3 +22,10 @@ def bootstrap_all():
         product_bootstrap()
     except Exception as exc:
         print("[bootstrap] product_recognition failed:", exc)
+
+    try:
+        meal_bootstrap()
+    except Exception as exc:
+        print("[bootstrap] meal_assistant failed:", exc)
+
+    init_pools()
@@ -0,0 +1,165 @@
+#serverAI/core/catalog.py
+"""
+Catalog sản phẩm dùng chung cho product_recognition và meal_assistant.
+
+Mỗi lần load tạo 1 CatalogSnapshot bất biến (có sẵn index theo reference_id, class name,
+category, tag) rồi gán thay snapshot cũ: request đang chạy giữ snapshot của nó,
+request mới thấy snapshot mới, không ai phải chờ lock.
+Reload qua file watcher (poll mtime) hoặc endpoint admin.
+"""
+from typing import Callable, Dict, List, Optional, Tuple
+from pathlib import Path
+import threading
+import time
+
+from core.config import settings
+from utils.file_utils import read_json
+
+
+def _normalize_item(raw: Dict) -> Optional[Dict]:
+    ref = str(raw.get("reference_id") or raw.get("id") or "").strip()
+    if not ref:
+        return None
+    return {
+        "referenceId": ref,
+        "name": raw.get("name", ""),
+        "category": raw.get("category", ""),
+        "subCategory": raw.get("subCategory", ""),
+        "unit": raw.get("unit", ""),
+        "stock": raw.get("stock", 0),
+        "price": raw.get("price", 0),
+        "discount": raw.get("discount", 0),
+        "description": raw.get("description", ""),
+        "image": raw.get("image", []),
+        "reference_image": raw.get("reference_image", []),
+        "tags": raw.get("tags", []),
+    }
+
+
+class CatalogSnapshot:
+    __slots__ = ("version", "loaded_at", "by_ref", "ref_by_class", "refs_by_category", "refs_by_tag")
+
+    def __init__(self, version: int, items: List[Dict], ref_by_class: Dict[str, str]):
+        self.version = version
+        self.loaded_at = time.time()
+        self.by_ref: Dict[str, Dict] = {item["referenceId"]: item for item in items}
+        self.ref_by_class: Dict[str, str] = ref_by_class
+        by_category: Dict[str, List[str]] = {}
+        by_tag: Dict[str, List[str]] = {}
+        for item in items:
+            ref = item["referenceId"]
+            for cat in (item.get("category"), item.get("subCategory")):
+                if cat:
+                    by_category.setdefault(str(cat).strip().lower(), []).append(ref)
+            for tag in item.get("tags") or []:
+                by_tag.setdefault(str(tag).strip().lower(), []).append(ref)
+        self.refs_by_category: Dict[str, Tuple[str, ...]] = {k: tuple(v) for k, v in by_category.items()}
+        self.refs_by_tag: Dict[str, Tuple[str, ...]] = {k: tuple(v) for k, v in by_tag.items()}
+
+    def get(self, reference_id: str) -> Optional[Dict]:
+        return self.by_ref.get(reference_id)
+
+    def resolve_class(self, cls_name: str) -> Optional[str]:
+        """class của model -> reference_id (qua class_to_reference.json hoặc class == reference_id)."""
+        if cls_name in self.ref_by_class:
+            return self.ref_by_class[cls_name]
+        if cls_name in self.by_ref:
+            return cls_name
+        return None
+
+    def by_category(self, category: str) -> List[Dict]:
+        return [self.by_ref[r] for r in self.refs_by_category.get(category.strip().lower(), ())]
+
+    def by_tag(self, tag: str) -> List[Dict]:
+        return [self.by_ref[r] for r in self.refs_by_tag.get(tag.strip().lower(), ())]
+
+    def stats(self) -> Dict:
+        return {
+            "version": self.version,
+            "loadedAt": self.loaded_at,
+            "items": len(self.by_ref),
+            "classMappings": len(self.ref_by_class),
+            "categories": len(self.refs_by_category),
+            "tags": len(self.refs_by_tag),
+        }
+
+
+class CatalogStore:
+    def __init__(self, catalog_path: str, class_map_path: Optional[str]):
+        self.catalog_path = catalog_path
+        self.class_map_path = class_map_path
+        self._snapshot = CatalogSnapshot(0, [], {})
+        self._reload_lock = threading.Lock()
+        self._listeners: List[Callable[[CatalogSnapshot], None]] = []
+        self._mtimes: Tuple[float, float] = (0.0, 0.0)
+        self._watcher: Optional[threading.Thread] = None
+
+    @property
+    def snapshot(self) -> CatalogSnapshot:
+        return self._snapshot
+
+    def add_listener(self, fn: Callable[[CatalogSnapshot], None]):
+        """fn(snapshot) được gọi sau mỗi lần reload thành công."""
+        self._listeners.append(fn)
+
+    def _current_mtimes(self) -> Tuple[float, float]:
+        def _mtime(path: Optional[str]) -> float:
+            if not path:
+                return 0.0
+            p = Path(path)
+            return p.stat().st_mtime if p.exists() else 0.0
+        return _mtime(self.catalog_path), _mtime(self.class_map_path)
+
+    def _load_class_map(self) -> Dict[str, str]:
+        path = self.class_map_path
+        if not path:
+            print("[catalog] No class_to_reference.json; assume class == reference_id")
+            return {}
+        p = Path(path)
+        if not p.exists():
+            print("[catalog] class map not found:", p)
+            return {}
+        try:
+            data = read_json(str(p))
+        except ValueError as exc:
+            print("[catalog] class map ignored:", exc)
+            return {}
+        if not isinstance(data, dict):
+            return {}
+        return {str(k): str(v) for k, v in data.items() if k is not None and v is not None}
+
+    def reload(self) -> CatalogSnapshot:
+        with self._reload_lock:
+            # Ghi nhận mtime trước: file lỗi sẽ không bị parse lại cho tới khi được sửa
+            self._mtimes = self._current_mtimes()
+            payload = read_json(self.catalog_path)
+            raw_items = payload.get("items", payload) if isinstance(payload, dict) else payload
+            items = [it for it in (_normalize_item(raw) for raw in raw_items) if it is not None]
+            snapshot = CatalogSnapshot(self._snapshot.version + 1, items, self._load_class_map())
+            self._snapshot = snapshot
+        print(f"[catalog] Loaded {len(snapshot.by_ref)} items (v{snapshot.version}), class→reference: {len(snapshot.ref_by_class)}")
+        for fn in list(self._listeners):
+            try:
+                fn(snapshot)
+            except Exception as exc:
+                print("[catalog] listener failed:", exc)
+        return snapshot
+
+    def _watch(self, interval: float):
+        while True:
+            time.sleep(interval)
+            try:
+                if self._current_mtimes() != self._mtimes:
+                    self.reload()
+            except Exception as exc:
+                # File đang ghi dở / JSON lỗi: giữ snapshot cũ, chờ lần ghi file tiếp theo
+                print("[catalog] reload failed:", exc)
+
+    def start_watcher(self, interval: float):
+        if interval <= 0 or self._watcher is not None:
+            return
+        self._watcher = threading.Thread(target=self._watch, args=(interval,), name="catalog-watcher", daemon=True)
+        self._watcher.start()
+
+
+catalog = CatalogStore(settings.PRODUCT_METADATA_PATH, settings.PRODUCT_CLASS_MAP_PATH)
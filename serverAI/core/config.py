@@ -1,6 +1,6 @@
 #serverAI/core/config.py
 from pydantic_settings import BaseSettings
-from typing import Optional, Dict
+from typing import Optional, Dict, List
 
 class Settings(BaseSettings):
     # App
@@ -15,19 +15,86 @@ class Settings(BaseSettings):
     PRODUCT_METADATA_PATH: str = "serverAI/data/product_catalog.json"
     PRODUCT_CLASS_MAP_PATH: Optional[str] = "serverAI/data/class_to_reference.json"
     PRODUCT_LABELS_PATH: Optional[str] = None
+    CATALOG_WATCH_INTERVAL_S: float = 2.0  # 0 = tắt file watcher, chỉ reload qua endpoint
     PRODUCT_RECOGNITION_THRESHOLD: float = 0.28
     PRODUCT_DETECTION_CONF: float = 0.25
     PRODUCT_DETECTION_IOU: float = 0.5
+    # ONNX Runtime (dùng khi PRODUCT_CLS_MODEL / PRODUCT_DET_MODEL là file .onnx)
+    PRODUCT_ORT_INTRA_OP_THREADS: int = 0  # 0 = mặc định của onnxruntime
+    PRODUCT_ORT_INTER_OP_THREADS: int = 0
+    PRODUCT_ORT_GRAPH_OPT_LEVEL: str = "all"  # disable | basic | extended | all
+    PRODUCT_ORT_EXECUTION_MODE: str = "sequential"  # sequential | parallel
+    PRODUCT_PREPROCESS_BACKEND: str = "pil"  # "pil" (khớp torchvision) | "cv2" (nhanh hơn, xấp xỉ)
+    # "classifier" (head đóng) | "embedding" (k-NN trên ảnh tham chiếu catalog)
+    PRODUCT_RECOGNITION_MODE: str = "classifier"
+    PRODUCT_EMBED_MODEL: str = "ViT-B-32"
+    PRODUCT_EMBED_PRETRAINED: str = "laion2b_s34b_b79k"
+    PRODUCT_EMBED_BATCH_SIZE: int = 32
+    PRODUCT_EMBED_TOP_K: int = 10
+    PRODUCT_EMBED_THRESHOLD: float = 0.75
+    PRODUCT_INDEX_PATH: str = "serverAI/data/vector/product_index.faiss"
+    PRODUCT_INDEX_META_PATH: str = "serverAI/data/vector/product_index_meta.json"
+    PRODUCT_REFERENCE_IMAGE_ROOT: str = "serverAI/data/images"
+    PRODUCT_MULTI_MAX_ITEMS: int = 20
+    PRODUCT_CACHE_ENABLED: bool = True
+    PRODUCT_CACHE_SIZE: int = 256
+    PRODUCT_CACHE_TTL_S: float = 2.0
+    PRODUCT_CACHE_MAX_HAMMING: int = 6  # dHash 64-bit
+    # WebSocket stream scan: chỉ chạy lại classifier khi box đổi nhiều / confidence giảm / quá hạn
+    PRODUCT_STREAM_IOU_THRESHOLD: float = 0.6
+    PRODUCT_STREAM_CONF_DECAY: float = 0.15
+    PRODUCT_STREAM_MAX_AGE_FRAMES: int = 30
+    PRODUCT_STREAM_STABLE_FRAMES: int = 3
+    PRODUCT_STREAM_LOST_FRAMES: int = 5
+    PRODUCT_BATCH_ENABLED: bool = True
+    PRODUCT_BATCH_MAX_SIZE: int = 16
+    PRODUCT_BATCH_MAX_WAIT_MS: float = 8.0
 
     # Meal assistant powered by Gemini + retrieval
     MEAL_RECIPES_PATH: str = "serverAI/data/recipes.json"
     MEAL_INDEX_PATH: str = "serverAI/data/vector/meal_index.faiss"
-    MEAL_METADATA_PATH: str = "serverAI/data/vector/meal_index_meta.json"
+    MEAL_METADATA_PATH: str = "serverAI/data/vector/meal_index_meta.bin"  # RecipeStore nhị phân (mmap); thiếu thì đọc .json cũ
     MEAL_FEEDBACK_PATH: str = "serverAI/data/logs/meal_feedback.jsonl"
+    MEAL_FEEDBACK_FLUSH_INTERVAL_S: float = 1.0
+    MEAL_FEEDBACK_BATCH_SIZE: int = 256
+    MEAL_FEEDBACK_QUEUE_SIZE: int = 10000     # đầy thì bỏ bản ghi mới (đếm trong stats)
+    MEAL_FEEDBACK_ROTATE_MB: float = 32.0     # xoay vòng khi file đạt kích thước này (0 = tắt)
+    MEAL_FEEDBACK_ROTATE_INTERVAL_S: float = 86400.0  # hoặc khi file cũ hơn (0 = tắt)
+    # Popularity tổng hợp từ feedback (tools/aggregate_meal_feedback.py); thay cột popularity tĩnh khi rerank
+    MEAL_POPULARITY_PATH: str = "serverAI/data/vector/meal_popularity.npz"
+    MEAL_POPULARITY_HALF_LIFE_DAYS: float = 30.0
+    MEAL_POPULARITY_PRIOR_WEIGHT: float = 5.0  # số feedback "ảo" mang giá trị popularity tĩnh
     MEAL_EMBEDDING_MODEL: str = "sentence-transformers/all-MiniLM-L6-v2"
     MEAL_TOP_K: int = 50
     MEAL_RETURN: int = 3
     MEAL_MIN_SIMILARITY: float = 0.15
+    MEAL_BUDGET_BUCKETS: List[float] = [50000, 100000, 200000, 500000]  # VND, dùng cho mask lọc ngân sách
+    MEAL_BUDGET_MAX_RATIO: Optional[float] = None  # đặt (vd 1.2) để loại món vượt ngân sách * ratio ngay lúc search
+    MEAL_QUERY_CACHE_SIZE: int = 1024        # LRU embedding câu truy vấn
+    MEAL_RESULT_CACHE_SIZE: int = 512        # cache kết quả retrieval + rerank
+    MEAL_RESULT_CACHE_TTL_S: float = 300.0
+    MEAL_INDEX_CHECK_INTERVAL_S: float = 5.0 # chu kỳ kiểm tra mtime index để tự nạp lại (0 = tắt)
+    MEAL_INDEX_MMAP: bool = True             # nạp FAISS index bằng mmap (chỉ đọc)
+    MEAL_RECORD_CACHE_SIZE: int = 2048       # số công thức đã decode giữ lại (LRU)
+    MEAL_ALLERGY_MASK_CACHE_SIZE: int = 256  # mask theo từ khoá dị ứng người dùng nhập (LRU)
+    # Chỉ mục từ vựng BM25 (tên món / tag / nguyên liệu), có dấu + bỏ dấu
+    MEAL_LEXICAL_ENABLED: bool = True
+    MEAL_LEXICAL_WEIGHT: float = 0.3         # trọng số BM25 khi trộn với điểm vector
+    MEAL_LEXICAL_FAST_COVERAGE: float = 1.0  # công thức chứa >= tỉ lệ này số âm tiết của truy vấn là "khớp chắc"
+    MEAL_LEXICAL_FAST_MIN_HITS: int = 3      # đủ số công thức khớp chắc (hoặc trùng tên món) thì bỏ qua embedding
+    MEAL_BM25_K1: float = 1.2
+    MEAL_BM25_B: float = 0.75
+    # Build index (tools/build_meal_index.py)
+    MEAL_EMBED_CACHE_PATH: str = "serverAI/data/vector/meal_embed_cache.npz"  # embedding theo hash nội dung
+    MEAL_EMBED_BATCH_SIZE: int = 64
+    MEAL_EMBED_WORKERS: int = 1              # >1: encode multi-process
+    MEAL_INDEX_TYPE: str = "auto"            # "auto" | "flat" | "ivf" | "hnsw"
+    MEAL_INDEX_AUTO_THRESHOLD: int = 20000   # auto: dưới ngưỡng dùng flat, từ ngưỡng trở lên dùng HNSW
+    MEAL_IVF_NLIST: int = 0                  # 0 = 4 * sqrt(N)
+    MEAL_IVF_NPROBE: int = 16                # áp dụng cả lúc build lẫn lúc nạp index
+    MEAL_HNSW_M: int = 32
+    MEAL_HNSW_EF_CONSTRUCTION: int = 200
+    MEAL_HNSW_EF_SEARCH: int = 64
     MEAL_RERANK_WEIGHTS: Dict[str, float] = {
         "semantic": 0.4,
         "preference": 0.25,
@@ -40,11 +107,65 @@ class Settings(BaseSettings):
     GEMINI_API_BASE: str = "https://generativelanguage.googleapis.com/v1beta"
     MEAL_PROMPT_LANGUAGE: str = "vi"
     MEAL_TEMPERATURE: float = 0.6
+    MEAL_LLM_PROVIDER: str = "gemini"    # "gemini" | "fake" (stream giả lập, không gọi mạng)
+    MEAL_FAKE_LLM_DELAY_MS: float = 30.0 # độ trễ giữa các token của LLM giả lập
+    # Cache câu trả lời LLM (SQLite)
+    MEAL_LLM_CACHE_ENABLED: bool = True
+    MEAL_LLM_CACHE_PATH: str = "serverAI/data/cache/meal_llm_cache.sqlite3"
+    MEAL_LLM_CACHE_MAX_MB: float = 64.0
+    MEAL_LLM_CACHE_TEMP_BUCKET: float = 0.2          # temperature làm tròn theo bước này khi tạo key
+    MEAL_LLM_CACHE_SEMANTIC: bool = False            # dùng lại câu trả lời của query gần nghĩa (cùng bộ món)
+    MEAL_LLM_CACHE_SEMANTIC_THRESHOLD: float = 0.92
+    MEAL_LLM_CACHE_SEMANTIC_CANDIDATES: int = 200
 
     # Face auth
     FACE_MODEL_NAME: str = "buffalo_l"
     FACE_DET_SIZE: str = "640,640"  # "w,h"
     FACE_CTX_ID: int = 0
+    # "insightface": FaceAnalysis mặc định; "cpu-int8": detection/recognition int8 từ FACE_INT8_DIR
+    FACE_RUNTIME: str = "insightface"
+    FACE_INT8_DIR: str = "serverAI/models/face_int8"
+    FACE_ORT_INTRA_OP_THREADS: int = 0   # 0 = để onnxruntime tự chọn
+    FACE_ORT_INTER_OP_THREADS: int = 0
+    FACE_ORT_GRAPH_OPT_LEVEL: str = "all"  # disable | basic | extended | all
+    FACE_ORT_EXECUTION_MODE: str = "sequential"  # sequential | parallel
+    # Profile = danh sách module InsightFace cần chạy (allowed_modules); None = toàn bộ model của pack.
+    # Chỉ các module của profile đang được endpoint dùng mới được load.
+    FACE_PROFILES: Dict[str, Optional[List[str]]] = {
+        "detect": ["detection"],
+        "recognize": ["detection", "recognition"],
+        "full": None,
+    }
+    FACE_ENDPOINT_PROFILES: Dict[str, str] = {
+        "encode": "recognize",
+        "identify": "recognize",
+        "enroll": "recognize",
+        "precheck": "detect",
+    }
+    FACE_PRECHECK_DET_SIZE: str = "320,320"  # det size nhỏ cho bước đếm mặt
+    FACE_ENCODE_PRECHECK: bool = False       # /encode, /identify: đếm mặt ở det size nhỏ trước, !=1 thì trả luôn
+    # Index 1:N (đăng nhập không cần biết user trước)
+    FACE_INDEX_PATH: str = "serverAI/data/vector/face_identity.npz"
+    FACE_INDEX_KEY_B64: Optional[str] = None  # AES-256-GCM (32 bytes, base64); None = lưu không mã hoá
+    FACE_IDENTIFY_TOP_K: int = 5
+    # Enroll từ video / nhiều frame
+    FACE_ENROLL_MAX_FRAMES: int = 30        # số frame tối đa lấy mẫu từ clip
+    FACE_ENROLL_TOP_N: int = 5              # số frame tốt nhất đưa qua recognition
+    FACE_ENROLL_MIN_SHARPNESS: float = 60.0 # variance of Laplacian của vùng mặt
+    FACE_ENROLL_MAX_YAW: float = 0.35       # lệch mũi so với tâm 2 mắt / khoảng cách 2 mắt
+    FACE_ENROLL_DUP_DIFF: float = 3.0       # chênh lệch trung bình (0-255) của thumbnail mặt để coi là trùng
+
+    # Inference pools: số worker, kích thước hàng đợi
+    INFER_POOLS: Dict[str, Dict[str, float]] = {
+        "face": {"workers": 2, "queue": 16},
+        "product": {"workers": 4, "queue": 32},
+        "meal": {"workers": 2, "queue": 16},
+    }
+    # Số thread torch/BLAS cho cả process (toàn cục, không tách theo pool); 0 = mặc định.
+    # Thread riêng từng model: FACE_ORT_INTRA_OP_THREADS / PRODUCT_ORT_INTRA_OP_THREADS
+    INFER_NUM_THREADS: int = 0
+    INFER_DEFAULT_TIMEOUT_S: float = 10.0
+    INFER_RETRY_AFTER_S: int = 1
 
     # Logging
     LOG_LEVEL: str = "INFO"
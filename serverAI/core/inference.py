@@ -0,0 +1,190 @@
+#serverAI/core/inference.py
+"""
+Lớp thực thi inference dùng chung cho các router.
+
+Mỗi model/module có 1 pool riêng (INFER_POOLS): số worker cố định, hàng đợi giới hạn.
+Hàng đợi đầy -> từ chối ngay (503 + Retry-After); job đã quá deadline khi tới lượt -> bỏ, không chạy (504).
+
+Số thread torch/BLAS là thiết lập toàn cục của process nên chỉ đặt 1 lần ở init_pools
+(INFER_NUM_THREADS), không đặt riêng theo pool. Giới hạn thread riêng cho từng model chỉ có
+ở onnxruntime (intra_op_num_threads của từng session: FACE_ORT_* / PRODUCT_ORT_*).
+"""
+from typing import Any, Callable, Dict, Optional
+import asyncio
+import queue
+import sys
+import threading
+import time
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+from core.config import settings
+
+_THREADPOOLCTL_ERROR: Optional[str] = None
+try:
+    from threadpoolctl import threadpool_limits
+except Exception as _e:
+    threadpool_limits = None
+    _THREADPOOLCTL_ERROR = str(_e)
+
+
+class InferenceRejected(Exception):
+    """Hàng đợi của pool đã đầy."""
+
+    def __init__(self, pool: str, retry_after: int):
+        super().__init__(f"Inference pool '{pool}' is busy")
+        self.pool = pool
+        self.retry_after = retry_after
+
+
+class InferenceExpired(Exception):
+    """Job hết deadline trước khi được xử lý."""
+
+    def __init__(self, pool: str):
+        super().__init__(f"Inference deadline exceeded in pool '{pool}'")
+        self.pool = pool
+
+
+def limit_process_threads(n: int):
+    """Giới hạn thread torch + BLAS/OpenMP cho cả process (0 = giữ mặc định)."""
+    if n <= 0:
+        return
+    torch = sys.modules.get("torch")
+    if torch is not None:
+        torch.set_num_threads(n)
+    if threadpool_limits is not None:
+        threadpool_limits(limits=n)
+    print(f"[inference] process threads={n}")
+
+
+class _Job:
+    __slots__ = ("fn", "args", "kwargs", "deadline", "future", "loop")
+
+    def __init__(self, fn, args, kwargs, deadline, future, loop):
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.deadline = deadline
+        self.future = future
+        self.loop = loop
+
+
+def _resolve(future: asyncio.Future, result: Any = None, exc: Optional[BaseException] = None):
+    if future.cancelled():
+        return
+    if exc is not None:
+        future.set_exception(exc)
+    else:
+        future.set_result(result)
+
+
+class InferencePool:
+    def __init__(self, name: str, workers: int, queue_size: int, timeout_s: float = 10.0):
+        self.name = name
+        self.workers = max(1, int(workers))
+        self.timeout_s = float(timeout_s)
+        self._queue: "queue.Queue[_Job]" = queue.Queue(maxsize=max(1, int(queue_size)))
+        self._lock = threading.Lock()
+        self._counters = {"submitted": 0, "rejected": 0, "expired": 0, "completed": 0, "failed": 0}
+        self._threads = [
+            threading.Thread(target=self._worker, name=f"infer-{name}-{i}", daemon=True)
+            for i in range(self.workers)
+        ]
+        for t in self._threads:
+            t.start()
+
+    def _count(self, key: str):
+        with self._lock:
+            self._counters[key] += 1
+
+    def _worker(self):
+        while True:
+            job = self._queue.get()
+            if job.future.cancelled():
+                continue
+            if time.monotonic() > job.deadline:
+                self._count("expired")
+                job.loop.call_soon_threadsafe(_resolve, job.future, None, InferenceExpired(self.name))
+                continue
+            try:
+                result = job.fn(*job.args, **job.kwargs)
+            except BaseException as exc:
+                self._count("failed")
+                job.loop.call_soon_threadsafe(_resolve, job.future, None, exc)
+                continue
+            self._count("completed")
+            job.loop.call_soon_threadsafe(_resolve, job.future, result)
+
+    async def run(self, fn: Callable, *args, timeout: Optional[float] = None, **kwargs) -> Any:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        deadline = time.monotonic() + (timeout if timeout is not None else self.timeout_s)
+        try:
+            self._queue.put_nowait(_Job(fn, args, kwargs, deadline, future, loop))
+        except queue.Full:
+            self._count("rejected")
+            raise InferenceRejected(self.name, settings.INFER_RETRY_AFTER_S)
+        self._count("submitted")
+        return await future
+
+    def stats(self) -> Dict:
+        with self._lock:
+            counters = dict(self._counters)
+        return {
+            "workers": self.workers,
+            "queueSize": self._queue.maxsize,
+            "queueDepth": self._queue.qsize(),
+            **counters,
+        }
+
+
+_pools: Dict[str, InferencePool] = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(name: str) -> InferencePool:
+    pool = _pools.get(name)
+    if pool is not None:
+        return pool
+    with _pools_lock:
+        pool = _pools.get(name)
+        if pool is None:
+            spec = settings.INFER_POOLS.get(name) or {}
+            pool = InferencePool(
+                name,
+                workers=int(spec.get("workers", 1)),
+                queue_size=int(spec.get("queue", 16)),
+                timeout_s=float(spec.get("timeout_s", settings.INFER_DEFAULT_TIMEOUT_S)),
+            )
+            _pools[name] = pool
+            print(f"[inference] pool '{name}': workers={pool.workers} queue={spec.get('queue', 16)}")
+    return pool
+
+
+def init_pools():
+    limit_process_threads(settings.INFER_NUM_THREADS)
+    for name in settings.INFER_POOLS:
+        get_pool(name)
+
+
+async def run_inference(pool: str, fn: Callable, *args, timeout: Optional[float] = None, **kwargs) -> Any:
+    return await get_pool(pool).run(fn, *args, timeout=timeout, **kwargs)
+
+
+def inference_stats() -> Dict:
+    return {name: pool.stats() for name, pool in list(_pools.items())}
+
+
+def install_exception_handlers(app: FastAPI):
+    @app.exception_handler(InferenceRejected)
+    async def _on_rejected(request: Request, exc: InferenceRejected):
+        return JSONResponse(
+            status_code=503,
+            content={"success": False, "message": str(exc)},
+            headers={"Retry-After": str(exc.retry_after)},
+        )
+
+    @app.exception_handler(InferenceExpired)
+    async def _on_expired(request: Request, exc: InferenceExpired):
+        return JSONResponse(status_code=504, content={"success": False, "message": str(exc)})
@@ -0,0 +1,55 @@
+#serverAI/core/onnx_runtime.py
+"""
+Tạo session ONNX Runtime (CPU) dùng chung cho face_auth và product_recognition:
+số thread intra/inter-op, mức tối ưu graph và execution mode lấy từ settings của từng module.
+"""
+from typing import Optional
+from pathlib import Path
+
+_ORT_ERROR: Optional[str] = None
+try:
+    import onnxruntime as ort
+except Exception as _e:
+    ort = None
+    _ORT_ERROR = str(_e)
+
+_GRAPH_OPT_LEVELS = {
+    "disable": "ORT_DISABLE_ALL",
+    "basic": "ORT_ENABLE_BASIC",
+    "extended": "ORT_ENABLE_EXTENDED",
+    "all": "ORT_ENABLE_ALL",
+}
+
+
+def make_session_options(
+    intra_op_threads: int = 0,
+    inter_op_threads: int = 0,
+    graph_opt_level: str = "all",
+    execution_mode: str = "sequential",
+):
+    if ort is None:
+        raise RuntimeError(f"onnxruntime unavailable: {_ORT_ERROR}")
+    opts = ort.SessionOptions()
+    if intra_op_threads > 0:
+        opts.intra_op_num_threads = intra_op_threads
+    if inter_op_threads > 0:
+        opts.inter_op_num_threads = inter_op_threads
+    level = _GRAPH_OPT_LEVELS.get(graph_opt_level.lower())
+    if level is None:
+        raise ValueError(f"Unknown graph optimization level: {graph_opt_level}")
+    opts.graph_optimization_level = getattr(ort.GraphOptimizationLevel, level)
+    opts.execution_mode = (
+        ort.ExecutionMode.ORT_PARALLEL
+        if execution_mode.lower() == "parallel"
+        else ort.ExecutionMode.ORT_SEQUENTIAL
+    )
+    return opts
+
+
+def load_onnx_session(path: str, session_options=None):
+    if ort is None:
+        raise RuntimeError(f"onnxruntime unavailable: {_ORT_ERROR}")
+    p = Path(path)
+    if not p.exists():
+        raise FileNotFoundError(f"ONNX model not found: {p}")
+    return ort.InferenceSession(str(p), sess_options=session_options, providers=["CPUExecutionProvider"])
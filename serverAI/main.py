@@ -4,19 +4,43 @@ import uvicorn
 
 from core.config import settings
 from core.bootstrap import bootstrap_all
+from core.inference import install_exception_handlers, inference_stats
+from core.catalog import catalog
+from utils.response_utils import default_response_class
 
 # Routers
 from modules.face_auth.router import router as face_router
 from modules.product_recognition.router import router as product_router
 from modules.meal_assistant.router import router as meal_assistant_router
 
-app = FastAPI(title=settings.APP_NAME, version=settings.APP_VERSION)
+app = FastAPI(
+    title=settings.APP_NAME,
+    version=settings.APP_VERSION,
+    default_response_class=default_response_class(),
+)
+install_exception_handlers(app)
 
 # Mount routers
 app.include_router(face_router, prefix="/api/v1", tags=["FaceAuth"])
 app.include_router(product_router, prefix="/api/v1", tags=["ProductRecognition"])
 app.include_router(meal_assistant_router, prefix="/api/v1", tags=["MealAssistant"])
 
+@app.get("/api/v1/inference/stats", tags=["Inference"])
+def _inference_stats():
+    return inference_stats()
+
+@app.get("/api/v1/catalog/stats", tags=["Catalog"])
+def _catalog_stats():
+    return catalog.snapshot.stats()
+
+@app.post("/api/v1/catalog/reload", tags=["Catalog"])
+def _catalog_reload():
+    try:
+        snapshot = catalog.reload()
+    except Exception as exc:
+        return {"success": False, "message": str(exc), **catalog.snapshot.stats()}
+    return {"success": True, **snapshot.stats()}
+
 @app.on_event("startup")
 def _startup():
     bootstrap_all()
@@ -0,0 +1,60 @@
+#serverAI/modules/face_auth/cpu_runtime.py
+"""
+Chế độ CPU cho face auth (FACE_RUNTIME=cpu-int8).
+
+Thay cho FaceAnalysis: chỉ load detection + recognition từ FACE_INT8_DIR
+(`detection.onnx`, `recognition.onnx` do tools/quantize_face_models.py tạo ra),
+session ONNX Runtime được cấu hình thread / execution mode / graph optimization.
+Giữ cùng giao diện `.models`, `.det_model`, `.prepare()` mà service/enroll đang dùng.
+"""
+from typing import Dict, List, Optional, Tuple
+from pathlib import Path
+
+from insightface.model_zoo.arcface_onnx import ArcFaceONNX
+from insightface.model_zoo.retinaface import RetinaFace
+
+from core.onnx_runtime import load_onnx_session, make_session_options
+
+SUPPORTED_MODULES = ("detection", "recognition")
+
+
+def face_session_options(intra_op: int, inter_op: int, graph_opt_level: str, execution_mode: str):
+    return make_session_options(
+        intra_op_threads=intra_op,
+        inter_op_threads=inter_op,
+        graph_opt_level=graph_opt_level,
+        execution_mode=execution_mode,
+    )
+
+
+def load_face_model(task: str, path: str, session_options=None):
+    session = load_onnx_session(path, session_options)
+    if task == "detection":
+        return RetinaFace(model_file=path, session=session)
+    if task == "recognition":
+        return ArcFaceONNX(model_file=path, session=session)
+    raise ValueError(f"Unsupported face module in CPU runtime: {task}")
+
+
+class CpuFaceApp:
+    def __init__(self, model_dir: str, allowed_modules: Optional[List[str]], session_options=None):
+        wanted = set(allowed_modules) if allowed_modules is not None else None
+        if wanted is None or not wanted.issubset(SUPPORTED_MODULES):
+            raise RuntimeError(
+                f"CPU face runtime only supports {SUPPORTED_MODULES}; "
+                f"requested {sorted(wanted) if wanted is not None else 'all modules'}"
+            )
+        self.models: Dict[str, object] = {}
+        for task in SUPPORTED_MODULES:
+            if task not in wanted:
+                continue
+            self.models[task] = load_face_model(task, str(Path(model_dir) / f"{task}.onnx"), session_options)
+        self.det_model = self.models["detection"]
+
+    def prepare(self, ctx_id: int, det_thresh: float = 0.5, det_size: Tuple[int, int] = (640, 640)):
+        # Session đã chỉ dùng CPUExecutionProvider; ctx_id giữ cho cùng chữ ký với FaceAnalysis
+        for task, model in self.models.items():
+            if task == "detection":
+                model.prepare(ctx_id, input_size=det_size, det_thresh=det_thresh)
+            else:
+                model.prepare(ctx_id)
@@ -0,0 +1,166 @@
+#serverAI/modules/face_auth/enroll.py
+"""
+Enroll khuôn mặt từ 1 clip video hoặc nhiều frame trong 1 request.
+
+- Lấy mẫu tối đa FACE_ENROLL_MAX_FRAMES frame (clip: bước đều trên toàn bộ video).
+- Chỉ chạy detector trên mỗi frame; loại frame không có / nhiều mặt, mờ (variance of
+  Laplacian), nghiêng (yaw ước lượng từ 5 landmark), trùng lặp (thumbnail gần giống).
+- Chỉ FACE_ENROLL_TOP_N frame tốt nhất được align và đưa qua recognition trong 1 batch,
+  trả về template trung bình đã L2-normalize (giống phần Node đang tự tính).
+"""
+from typing import Dict, List, Optional, Tuple
+import os
+import tempfile
+
+import cv2
+import numpy as np
+from insightface.utils import face_align
+
+from core.config import settings
+from modules.face_auth.service import get_face_app
+from utils.image_utils import decode_image_bytes
+
+_THUMB = 24
+
+
+class _Candidate:
+    __slots__ = ("image", "kps", "det_score", "sharpness", "thumb")
+
+    def __init__(self, image, kps, det_score, sharpness, thumb):
+        self.image = image
+        self.kps = kps
+        self.det_score = det_score
+        self.sharpness = sharpness
+        self.thumb = thumb
+
+    @property
+    def score(self) -> float:
+        # det_score ~ [0, 1]; sharpness bão hoà ở 4x ngưỡng để không lấn át detector
+        sharp = min(self.sharpness / (4.0 * max(settings.FACE_ENROLL_MIN_SHARPNESS, 1.0)), 1.0)
+        return 0.6 * self.det_score + 0.4 * sharp
+
+
+def _sample_video(data: bytes, max_frames: int) -> List[np.ndarray]:
+    # cv2.VideoCapture chỉ đọc từ file/URL
+    fd, path = tempfile.mkstemp(suffix=".bin")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        cap = cv2.VideoCapture(path)
+        total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT) or 0)
+        step = max(1, total // max_frames) if total > 0 else 1
+        frames: List[np.ndarray] = []
+        idx = 0
+        while len(frames) < max_frames:
+            ok = cap.grab()
+            if not ok:
+                break
+            if idx % step == 0:
+                ok, frame = cap.retrieve()
+                if ok and frame is not None:
+                    frames.append(frame)
+            idx += 1
+        cap.release()
+        return frames
+    finally:
+        os.remove(path)
+
+
+def decode_frames(parts: List[Tuple[bytes, str]], max_frames: int) -> List[np.ndarray]:
+    """Mỗi part là ảnh hoặc video; ảnh decode thẳng, còn lại thử đọc như video."""
+    frames: List[np.ndarray] = []
+    for data, content_type in parts:
+        if len(frames) >= max_frames:
+            break
+        img = None if content_type.startswith("video/") else decode_image_bytes(data)
+        if img is not None:
+            frames.append(img)
+        else:
+            frames.extend(_sample_video(data, max_frames - len(frames)))
+    return frames
+
+
+def _sharpness(gray_face: np.ndarray) -> float:
+    return float(cv2.Laplacian(gray_face, cv2.CV_64F).var())
+
+
+def _yaw(kps: np.ndarray) -> float:
+    """kps: 5x2 (mắt trái, mắt phải, mũi, mép trái, mép phải)."""
+    left_eye, right_eye, nose = kps[0], kps[1], kps[2]
+    eye_dist = float(np.linalg.norm(right_eye - left_eye)) or 1.0
+    return abs(float(nose[0] - (left_eye[0] + right_eye[0]) / 2.0)) / eye_dist
+
+
+def _face_crop(image: np.ndarray, bbox: np.ndarray) -> np.ndarray:
+    h, w = image.shape[:2]
+    x1, y1, x2, y2 = [int(v) for v in bbox[:4]]
+    x1, y1 = max(0, x1), max(0, y1)
+    x2, y2 = min(w, x2), min(h, y2)
+    return image[y1:y2, x1:x2]
+
+
+def _is_duplicate(thumb: np.ndarray, kept: List[_Candidate]) -> bool:
+    return any(float(np.mean(np.abs(thumb - c.thumb))) < settings.FACE_ENROLL_DUP_DIFF for c in kept)
+
+
+def enroll_from_frames(frames: List[np.ndarray], top_n: Optional[int] = None) -> Dict:
+    app = get_face_app()
+    top_n = max(1, top_n or settings.FACE_ENROLL_TOP_N)
+    rejected = {"no_face": 0, "multi_face": 0, "blurry": 0, "pose": 0, "duplicate": 0}
+    kept: List[_Candidate] = []
+
+    for image in frames:
+        bboxes, kpss = app.det_model.detect(image, max_num=0, metric="default")
+        if bboxes is None or len(bboxes) == 0:
+            rejected["no_face"] += 1
+            continue
+        if len(bboxes) > 1:
+            rejected["multi_face"] += 1
+            continue
+        kps = kpss[0]
+        if _yaw(kps) > settings.FACE_ENROLL_MAX_YAW:
+            rejected["pose"] += 1
+            continue
+        face = _face_crop(image, bboxes[0])
+        if face.size == 0:
+            rejected["no_face"] += 1
+            continue
+        gray = cv2.cvtColor(face, cv2.COLOR_BGR2GRAY)
+        sharpness = _sharpness(gray)
+        if sharpness < settings.FACE_ENROLL_MIN_SHARPNESS:
+            rejected["blurry"] += 1
+            continue
+        thumb = cv2.resize(gray, (_THUMB, _THUMB), interpolation=cv2.INTER_AREA).astype(np.float32)
+        if _is_duplicate(thumb, kept):
+            rejected["duplicate"] += 1
+            continue
+        kept.append(_Candidate(image, kps, float(bboxes[0][4]), sharpness, thumb))
+
+    result = {
+        "embedding": [],
+        "modelVersion": "arcface_r100_onnx_v1",
+        "quality": 0.0,
+        "frames_received": len(frames),
+        "frames_accepted": len(kept),
+        "frames_used": 0,
+        "rejected": rejected,
+    }
+    if not kept:
+        return result
+
+    best = sorted(kept, key=lambda c: c.score, reverse=True)[:top_n]
+    rec = app.models.get("recognition")
+    if rec is None:
+        raise RuntimeError("Recognition model not loaded; check FACE_ENDPOINT_PROFILES")
+    crops = [face_align.norm_crop(c.image, landmark=c.kps, image_size=rec.input_size[0]) for c in best]
+    feats = np.asarray(rec.get_feat(crops), dtype=np.float32)
+    feats /= np.linalg.norm(feats, axis=1, keepdims=True).clip(min=1e-12)
+    mean = feats.mean(axis=0)
+    mean /= float(np.linalg.norm(mean)) or 1.0
+
+    result.update({
+        "embedding": mean,
+        "quality": max(c.det_score for c in best),
+        "frames_used": len(best),
+    })
+    return result
@@ -0,0 +1,170 @@
+#serverAI/modules/face_auth/identity_index.py
+"""
+Index 1:N cho đăng nhập bằng khuôn mặt: FAISS inner-product trên embedding ArcFace đã L2-normalize
+(inner product == cosine). Lưu xuống đĩa dạng npz (user_ids + vectors), mã hoá AES-256-GCM nếu
+có FACE_INDEX_KEY_B64; khi khởi động đọc file và dựng lại index.
+"""
+from typing import Dict, List, Optional, Tuple
+from pathlib import Path
+import base64
+import io
+import os
+import threading
+
+import numpy as np
+
+_FAISS_ERROR: Optional[str] = None
+try:
+    import faiss
+except Exception as _e:
+    faiss = None
+    _FAISS_ERROR = str(_e)
+
+_CRYPTO_ERROR: Optional[str] = None
+try:
+    from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+except Exception as _e:
+    AESGCM = None
+    _CRYPTO_ERROR = str(_e)
+
+_NONCE_SIZE = 12
+
+
+def _l2_normalize(vec: np.ndarray) -> np.ndarray:
+    vec = np.asarray(vec, dtype=np.float32).reshape(-1)
+    norm = float(np.linalg.norm(vec)) or 1.0
+    return vec / norm
+
+
+class FaceIdentityIndex:
+    def __init__(self, path: str, key_b64: Optional[str] = None, dim: int = 512):
+        if faiss is None:
+            raise RuntimeError(f"faiss unavailable: {_FAISS_ERROR}")
+        self.path = Path(path)
+        self.dim = dim
+        self._key = self._parse_key(key_b64)
+        self._lock = threading.RLock()
+        # Tuần tự hoá save(): snapshot + ghi + replace, để bản cũ không đè bản mới
+        self._save_lock = threading.Lock()
+        self._index = faiss.IndexIDMap2(faiss.IndexFlatIP(dim))
+        self._vectors: Dict[str, np.ndarray] = {}
+        self._id_by_user: Dict[str, int] = {}
+        self._user_by_id: Dict[int, str] = {}
+        self._next_id = 0
+
+    @staticmethod
+    def _parse_key(key_b64: Optional[str]) -> Optional[bytes]:
+        if not key_b64:
+            return None
+        if AESGCM is None:
+            raise RuntimeError(f"cryptography unavailable: {_CRYPTO_ERROR}")
+        key = base64.b64decode(key_b64)
+        if len(key) != 32:
+            raise ValueError("FACE_INDEX_KEY_B64 must decode to 32 bytes")
+        return key
+
+    # ---------- persistence ----------
+    def _encode(self) -> bytes:
+        users = list(self._vectors)
+        vectors = np.stack([self._vectors[u] for u in users]) if users else np.zeros((0, self.dim), np.float32)
+        buf = io.BytesIO()
+        np.savez(buf, users=np.asarray(users, dtype=str), vectors=vectors)
+        raw = buf.getvalue()
+        if self._key is None:
+            return raw
+        nonce = os.urandom(_NONCE_SIZE)
+        return nonce + AESGCM(self._key).encrypt(nonce, raw, None)
+
+    def _decode(self, blob: bytes) -> Tuple[List[str], np.ndarray]:
+        if self._key is not None:
+            blob = AESGCM(self._key).decrypt(blob[:_NONCE_SIZE], blob[_NONCE_SIZE:], None)
+        data = np.load(io.BytesIO(blob), allow_pickle=False)
+        return [str(u) for u in data["users"]], np.asarray(data["vectors"], dtype=np.float32)
+
+    def save(self):
+        # Ghi đĩa ngoài self._lock nên search vẫn chạy trong lúc save
+        with self._save_lock:
+            with self._lock:
+                blob = self._encode()
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self.path.with_suffix(self.path.suffix + ".tmp")
+            tmp.write_bytes(blob)
+            os.replace(tmp, self.path)
+
+    def load(self) -> "FaceIdentityIndex":
+        if not self.path.exists():
+            print("[face-index] No index file yet:", self.path)
+            return self
+        users, vectors = self._decode(self.path.read_bytes())
+        with self._lock:
+            self._reset()
+            self._add_many(users, vectors)
+        print(f"[face-index] loaded {len(users)} identities")
+        return self
+
+    def _reset(self):
+        self._index = faiss.IndexIDMap2(faiss.IndexFlatIP(self.dim))
+        self._vectors.clear()
+        self._id_by_user.clear()
+        self._user_by_id.clear()
+        self._next_id = 0
+
+    # ---------- mutations ----------
+    def _add_many(self, users: List[str], vectors: np.ndarray):
+        if not users:
+            return
+        ids = np.arange(self._next_id, self._next_id + len(users), dtype=np.int64)
+        self._index.add_with_ids(np.ascontiguousarray(vectors, dtype=np.float32), ids)
+        for uid, i, vec in zip(users, ids.tolist(), vectors):
+            self._vectors[uid] = vec
+            self._id_by_user[uid] = i
+            self._user_by_id[i] = uid
+        self._next_id += len(users)
+
+    def _remove(self, user_id: str) -> bool:
+        i = self._id_by_user.pop(user_id, None)
+        if i is None:
+            return False
+        self._index.remove_ids(np.asarray([i], dtype=np.int64))
+        self._user_by_id.pop(i, None)
+        self._vectors.pop(user_id, None)
+        return True
+
+    def upsert(self, user_id: str, embedding) -> None:
+        vec = _l2_normalize(embedding)
+        if vec.shape[0] != self.dim:
+            raise ValueError(f"Embedding must have {self.dim} dims, got {vec.shape[0]}")
+        with self._lock:
+            self._remove(user_id)
+            self._add_many([user_id], vec[None, :])
+
+    def upsert_many(self, items: List[Tuple[str, List[float]]]) -> int:
+        count = 0
+        with self._lock:
+            for user_id, embedding in items:
+                self.upsert(user_id, embedding)
+                count += 1
+        return count
+
+    def remove(self, user_id: str) -> bool:
+        with self._lock:
+            return self._remove(user_id)
+
+    # ---------- query ----------
+    def search(self, embedding, top_k: int) -> List[Tuple[str, float]]:
+        vec = _l2_normalize(embedding)[None, :]
+        with self._lock:
+            if self._index.ntotal == 0:
+                return []
+            sims, ids = self._index.search(vec, min(top_k, self._index.ntotal))
+            return [
+                (self._user_by_id[i], float(s))
+                for s, i in zip(sims[0].tolist(), ids[0].tolist())
+                if i >= 0 and i in self._user_by_id
+            ]
+
+    def __len__(self) -> int:
+        return len(self._vectors)
+
+    def stats(self) -> Dict:
+        return {"identities": len(self), "dim": self.dim, "encrypted": self._key is not None}
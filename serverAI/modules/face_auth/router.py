@@ -1,10 +1,23 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, HTTPException, Request
 from pydantic import BaseModel
-from typing import List
+from typing import List, Optional
 import numpy as np
 
-from modules.face_auth.service import face_encode
-from utils.image_utils import decode_image_b64
+from core.config import settings
+from core.inference import run_inference
+from modules.face_auth.enroll import decode_frames, enroll_from_frames
+from modules.face_auth.service import (
+    endpoint_profile,
+    face_count,
+    face_encode,
+    identify,
+    identity_remove,
+    identity_upsert,
+    identity_upsert_many,
+)
+from utils.image_utils import decode_image_b64, decode_image_bytes
+from utils.response_utils import vector_response
+from utils.upload_utils import read_image_body, read_upload_parts
 
 router = APIRouter()
 
@@ -12,9 +25,21 @@ class EncodeBody(BaseModel):
     image_b64: str
     mime: str = "image/jpeg"
 
-@router.post("/encode")
-def encode(body: EncodeBody):
-    img = decode_image_b64(body.image_b64)
+class IdentifyBody(BaseModel):
+    image_b64: str
+    mime: str = "image/jpeg"
+    top_k: Optional[int] = None
+
+class IdentityBody(BaseModel):
+    embedding: List[float]
+
+class IdentityItem(IdentityBody):
+    user_id: str
+
+class IdentityBulkBody(BaseModel):
+    items: List[IdentityItem]
+
+def _encode_image(img, endpoint: str = "encode") -> dict:
     if img is None:
         return {
             "embedding": [],
@@ -23,7 +48,17 @@ def encode(body: EncodeBody):
             "faces_count": 0,
         }
 
-    faces = face_encode(img)
+    if settings.FACE_ENCODE_PRECHECK:
+        faces_count = face_count(img)
+        if faces_count != 1:
+            return {
+                "embedding": [],
+                "modelVersion": "arcface_r100_onnx_v1",
+                "quality": 0.0,
+                "faces_count": faces_count,
+            }
+
+    faces = face_encode(img, profile=endpoint_profile(endpoint))
     faces_count = len(faces)
     if faces_count != 1:
         return {
@@ -34,7 +69,8 @@ def encode(body: EncodeBody):
         }
 
     best = faces[0]
-    emb = best.normed_embedding.tolist()
+    # Giữ ndarray; vector_response quyết định list float hay mã hoá nhị phân
+    emb = best.normed_embedding
     quality = float(best.det_score)
     return {
         "embedding": emb,
@@ -42,3 +78,94 @@ def encode(body: EncodeBody):
         "quality": quality,
         "faces_count": faces_count,
     }
+
+def _identify_image(img, top_k: Optional[int]) -> dict:
+    encoded = _encode_image(img, endpoint="identify")
+    if len(encoded["embedding"]) == 0:
+        return {**encoded, "matches": []}
+    k = max(1, top_k or settings.FACE_IDENTIFY_TOP_K)
+    matches = identify(encoded["embedding"], k)
+    return {
+        "modelVersion": encoded["modelVersion"],
+        "quality": encoded["quality"],
+        "faces_count": encoded["faces_count"],
+        "matches": [{"userId": uid, "score": score} for uid, score in matches],
+    }
+
+def _identity_call(fn, *args):
+    try:
+        return fn(*args)
+    except RuntimeError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.post("/encode")
+async def encode(body: EncodeBody, request: Request):
+    """Embedding trả về dạng list float; `?vec=f32|f16` hoặc Accept (msgpack / `vec=`) để nhận dạng nén."""
+    result = await run_inference("face", lambda: _encode_image(decode_image_b64(body.image_b64)))
+    return vector_response(request, result)
+
+@router.post("/encode/binary")
+async def encode_binary(request: Request):
+    """Giống /encode nhưng nhận ảnh multipart (field `file`) hoặc application/octet-stream."""
+    data = await read_image_body(request)
+    result = await run_inference("face", lambda: _encode_image(decode_image_bytes(data)))
+    return vector_response(request, result)
+
+def _precheck_image(img) -> dict:
+    return {"faces_count": face_count(img) if img is not None else 0}
+
+@router.post("/precheck")
+async def precheck(body: EncodeBody):
+    """Chỉ đếm số mặt (detector ở FACE_PRECHECK_DET_SIZE), không chạy recognition."""
+    return await run_inference("face", lambda: _precheck_image(decode_image_b64(body.image_b64)))
+
+@router.post("/precheck/binary")
+async def precheck_binary(request: Request):
+    data = await read_image_body(request)
+    return await run_inference("face", lambda: _precheck_image(decode_image_bytes(data)))
+
+@router.post("/encode/enroll")
+async def encode_enroll(request: Request, top_n: Optional[int] = None):
+    """
+    Enroll trong 1 request: multipart nhiều file ở field `frames` (ảnh hoặc clip video),
+    hoặc body là 1 clip video. Trả về template trung bình đã L2-normalize.
+    """
+    parts = await read_upload_parts(request)
+    if not parts:
+        raise HTTPException(status_code=400, detail="No frames provided")
+
+    def _run():
+        frames = decode_frames(parts, settings.FACE_ENROLL_MAX_FRAMES)
+        return enroll_from_frames(frames, top_n)
+
+    return vector_response(request, await run_inference("face", _run))
+
+@router.post("/identify")
+async def identify_face(body: IdentifyBody):
+    """Encode ảnh 1 lần rồi tìm top-k user gần nhất trong index (cosine)."""
+    img = decode_image_b64(body.image_b64)
+    return await run_inference("face", lambda: _identity_call(_identify_image, img, body.top_k))
+
+@router.post("/identify/binary")
+async def identify_face_binary(request: Request, top_k: Optional[int] = None):
+    data = await read_image_body(request)
+    return await run_inference("face", lambda: _identity_call(_identify_image, decode_image_bytes(data), top_k))
+
+@router.put("/identity/{user_id}")
+def upsert_identity(user_id: str, body: IdentityBody):
+    """Thêm/cập nhật template (embedding trung bình lúc enroll) của user."""
+    total = _identity_call(identity_upsert, user_id, body.embedding)
+    return {"success": True, "userId": user_id, "identities": total}
+
+@router.post("/identity/bulk")
+def upsert_identities(body: IdentityBulkBody):
+    """Nạp lại nhiều template một lúc (đồng bộ từ DB)."""
+    total = _identity_call(identity_upsert_many, [(it.user_id, it.embedding) for it in body.items])
+    return {"success": True, "upserted": len(body.items), "identities": total}
+
+@router.delete("/identity/{user_id}")
+def remove_identity(user_id: str):
+    removed = _identity_call(identity_remove, user_id)
+    return {"success": True, "userId": user_id, "removed": removed}
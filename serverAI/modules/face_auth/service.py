@@ -1,10 +1,16 @@
 #serverAI/modules/face_auth/service.py
-from typing import Optional, Tuple, List
+from typing import Dict, Optional, Tuple, List
 import numpy as np
 from insightface.app import FaceAnalysis
+from insightface.app.common import Face
 from core.config import settings
+from modules.face_auth.identity_index import FaceIdentityIndex
+from modules.face_auth.cpu_runtime import CpuFaceApp, face_session_options
 
 _face_app: Optional[FaceAnalysis] = None
+_profile_modules: Dict[str, Optional[List[str]]] = {}
+_precheck_det_size: Tuple[int, int] = (320, 320)
+_identity_index: Optional[FaceIdentityIndex] = None
 
 def _parse_det_size(s: str) -> Tuple[int, int]:
     try:
@@ -13,18 +19,108 @@ def _parse_det_size(s: str) -> Tuple[int, int]:
     except Exception:
         return (640, 640)
 
+def _allowed_modules() -> Optional[List[str]]:
+    """Hợp các module của những profile đang được endpoint dùng; None nếu có profile cần toàn bộ."""
+    modules = {"detection"}
+    for endpoint, profile in settings.FACE_ENDPOINT_PROFILES.items():
+        if profile not in settings.FACE_PROFILES:
+            raise ValueError(f"Unknown face profile '{profile}' for endpoint '{endpoint}'")
+        wanted = settings.FACE_PROFILES[profile]
+        if wanted is None:
+            return None
+        modules.update(wanted)
+    return sorted(modules)
+
 def face_bootstrap():
-    global _face_app
+    global _face_app, _profile_modules, _precheck_det_size
     if _face_app is not None:
         return
     det_w, det_h = _parse_det_size(settings.FACE_DET_SIZE)
-    app = FaceAnalysis(name=settings.FACE_MODEL_NAME)
+    allowed = _allowed_modules()
+    if settings.FACE_RUNTIME.lower() == "cpu-int8":
+        opts = face_session_options(
+            settings.FACE_ORT_INTRA_OP_THREADS,
+            settings.FACE_ORT_INTER_OP_THREADS,
+            settings.FACE_ORT_GRAPH_OPT_LEVEL,
+            settings.FACE_ORT_EXECUTION_MODE,
+        )
+        app = CpuFaceApp(settings.FACE_INT8_DIR, allowed, session_options=opts)
+        source = settings.FACE_INT8_DIR
+    else:
+        app = FaceAnalysis(name=settings.FACE_MODEL_NAME, allowed_modules=allowed)
+        source = settings.FACE_MODEL_NAME
     app.prepare(ctx_id=settings.FACE_CTX_ID, det_size=(det_w, det_h))
     _face_app = app
-    print("[face-auth] InsightFace ready:", settings.FACE_MODEL_NAME)
+    _profile_modules = dict(settings.FACE_PROFILES)
+    _precheck_det_size = _parse_det_size(settings.FACE_PRECHECK_DET_SIZE)
+    print(f"[face-auth] InsightFace ready ({settings.FACE_RUNTIME}):", source, "modules:", sorted(app.models))
+    _init_identity_index()
+
+def _init_identity_index():
+    global _identity_index
+    try:
+        _identity_index = FaceIdentityIndex(settings.FACE_INDEX_PATH, settings.FACE_INDEX_KEY_B64).load()
+    except Exception as e:
+        _identity_index = None
+        print("[face-auth] identity index disabled:", e)
 
-def face_encode(bgr_image: np.ndarray):
+def get_identity_index() -> FaceIdentityIndex:
+    if _identity_index is None:
+        raise RuntimeError("Face identity index not initialized")
+    return _identity_index
+
+def get_face_app() -> FaceAnalysis:
     if _face_app is None:
         raise RuntimeError("Face service not initialized")
-    faces = _face_app.get(bgr_image)
+    return _face_app
+
+def endpoint_profile(endpoint: str) -> str:
+    return settings.FACE_ENDPOINT_PROFILES.get(endpoint, "full")
+
+def face_encode(bgr_image: np.ndarray, profile: str = "full", det_size: Optional[Tuple[int, int]] = None):
+    """
+    Giống FaceAnalysis.get nhưng chỉ chạy các module của `profile` trên mỗi mặt
+    (vd. "recognize" bỏ qua landmark_3d/landmark_2d/genderage).
+    """
+    app = get_face_app()
+    bboxes, kpss = app.det_model.detect(bgr_image, input_size=det_size, max_num=0, metric="default")
+    if bboxes is None or bboxes.shape[0] == 0:
+        return []
+    wanted = _profile_modules.get(profile)
+    models = [
+        model for taskname, model in app.models.items()
+        if taskname != "detection" and (wanted is None or taskname in wanted)
+    ]
+    faces = []
+    for i in range(bboxes.shape[0]):
+        face = Face(bbox=bboxes[i, 0:4], kps=kpss[i] if kpss is not None else None, det_score=bboxes[i, 4])
+        for model in models:
+            model.get(bgr_image, face)
+        faces.append(face)
     return faces  # list of Face objects (InsightFace)
+
+def face_count(bgr_image: np.ndarray) -> int:
+    """Chỉ chạy detector ở FACE_PRECHECK_DET_SIZE để đếm số mặt."""
+    return len(face_encode(bgr_image, profile=endpoint_profile("precheck"), det_size=_precheck_det_size))
+
+def identity_upsert(user_id: str, embedding: List[float]) -> int:
+    index = get_identity_index()
+    index.upsert(user_id, embedding)
+    index.save()
+    return len(index)
+
+def identity_upsert_many(items: List[Tuple[str, List[float]]]) -> int:
+    index = get_identity_index()
+    index.upsert_many(items)
+    index.save()
+    return len(index)
+
+def identity_remove(user_id: str) -> bool:
+    index = get_identity_index()
+    removed = index.remove(user_id)
+    if removed:
+        index.save()
+    return removed
+
+def identify(embedding, top_k: int) -> List[Tuple[str, float]]:
+    return get_identity_index().search(embedding, top_k)
@@ -0,0 +1,151 @@
+from __future__ import annotations
+
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+
+
+class RecipeView:
+    """
+    Ứng viên sau retrieval: trỏ tới dict công thức dùng chung (không copy) và giữ các
+    điểm tính theo request. `.get()` / `[]` đọc field của view trước, rồi tới công thức.
+    """
+
+    __slots__ = ("row", "recipe", "semantic_score", "inventory", "score")
+    _FIELDS = frozenset(("semantic_score", "inventory", "score"))
+
+    def __init__(self, row: int, recipe: Dict, semantic_score: float, inventory: float):
+        self.row = row
+        self.recipe = recipe
+        self.semantic_score = semantic_score
+        self.inventory = inventory
+        self.score: Optional[float] = None
+
+    def get(self, key: str, default=None):
+        if key in self._FIELDS:
+            value = getattr(self, key)
+            return default if value is None else value
+        return self.recipe.get(key, default)
+
+    def __getitem__(self, key: str):
+        if key in self._FIELDS:
+            value = getattr(self, key)
+            if value is None:
+                raise KeyError(key)
+            return value
+        return self.recipe[key]
+
+    def __contains__(self, key: str) -> bool:
+        if key in self._FIELDS:
+            return getattr(self, key) is not None
+        return key in self.recipe
+
+
+class RecipeColumns:
+    """
+    Dạng cột của metadata công thức, dựng 1 lần khi nạp metadata:
+    popularity / freshness / budget / promo dạng mảng NumPy và ma trận thưa (CSR)
+    công thức × reference_id nguyên liệu để tính độ phủ tồn kho cho cả lô ứng viên.
+    Mảng có thể là view chỉ đọc trên mmap của RecipeStore.
+    """
+
+    _ARRAYS = ("popularity", "freshness", "promo", "has_budget", "budget", "indptr", "indices", "n_ingredients")
+
+    def __init__(self, arrays: Dict[str, np.ndarray], vocab: Iterable[str]):
+        self.popularity = arrays["popularity"]
+        self.freshness = arrays["freshness"]
+        self.promo = arrays["promo"]
+        self.has_budget = arrays["has_budget"]
+        self.budget = arrays["budget"]
+        self.indptr = arrays["indptr"]
+        self.indices = arrays["indices"]
+        self.n_ingredients = arrays["n_ingredients"]
+        self.size = int(self.popularity.shape[0])
+        self.vocab: Dict[str, int] = {ref: i for i, ref in enumerate(vocab)}
+
+    def arrays(self) -> Dict[str, np.ndarray]:
+        return {name: getattr(self, name) for name in self._ARRAYS}
+
+    @classmethod
+    def from_store(cls, store) -> "RecipeColumns":
+        return cls(store.arrays, store.header.get("vocab", []))
+
+    @classmethod
+    def from_recipes(cls, recipes: List[Dict]) -> "RecipeColumns":
+        n = len(recipes)
+        arrays = {
+            "popularity": np.array([r.get("popularity", 0.5) for r in recipes], dtype=np.float64),
+            "freshness": np.array([r.get("freshness", 0.5) for r in recipes], dtype=np.float64),
+            "promo": np.array([1.0 if r.get("promo") else 0.0 for r in recipes], dtype=np.float64),
+            "has_budget": np.array([bool(r.get("budget")) for r in recipes], dtype=bool),
+            "budget": np.array([r.get("budget") or 0 for r in recipes], dtype=np.float64),
+        }
+
+        vocab: Dict[str, int] = {}
+        indptr = [0]
+        indices: List[int] = []
+        n_ingredients = np.zeros(n, dtype=np.float64)
+        for i, recipe in enumerate(recipes):
+            ingredients = recipe.get("ingredients") or []
+            n_ingredients[i] = len(ingredients)
+            for ing in ingredients:
+                ref = ing.get("reference_id")
+                if ref is None:
+                    continue
+                indices.append(vocab.setdefault(ref, len(vocab)))
+            indptr.append(len(indices))
+        arrays["indptr"] = np.asarray(indptr, dtype=np.int64)
+        arrays["indices"] = np.asarray(indices, dtype=np.int64)
+        arrays["n_ingredients"] = n_ingredients
+        return cls(arrays, vocab)
+
+    def _available_vector(self, available_refs: Iterable[str]) -> np.ndarray:
+        avail = np.zeros(len(self.vocab), dtype=np.float64)
+        ids = [self.vocab[r] for r in set(available_refs) if r in self.vocab]
+        if ids:
+            avail[ids] = 1.0
+        return avail
+
+    def coverage(self, rows: np.ndarray, available_refs: Iterable[str]) -> np.ndarray:
+        """Tỉ lệ nguyên liệu đang có trong available_refs của từng công thức `rows`."""
+        rows = np.asarray(rows, dtype=np.int64)
+        if rows.size == 0:
+            return np.zeros(0, dtype=np.float64)
+        starts = self.indptr[rows]
+        lens = self.indptr[rows + 1] - starts
+        total = int(lens.sum())
+        if total == 0:
+            return np.zeros(rows.size, dtype=np.float64)
+        # Chỉ số các phần tử CSR của những hàng được chọn, nối liên tiếp
+        entry = np.repeat(starts - np.cumsum(lens) + lens, lens) + np.arange(total)
+        hits = self._available_vector(available_refs)[self.indices[entry]]
+        have = np.bincount(np.repeat(np.arange(rows.size), lens), weights=hits, minlength=rows.size)
+        n_ing = self.n_ingredients[rows]
+        return np.divide(have, n_ing, out=np.zeros(rows.size, dtype=np.float64), where=n_ing > 0)
+
+    def scores(
+        self,
+        rows: np.ndarray,
+        semantic: np.ndarray,
+        inventory: np.ndarray,
+        nlu_budget: Optional[float],
+        weights: Dict[str, float],
+    ) -> np.ndarray:
+        """
+        score = min(1, Σ weight * thành phần) với semantic, preference (tồn kho + thưởng tới 0.4 khi
+        budget món dưới ngân sách), popularity, freshness, promo; tính cho cả lô.
+        """
+        preference = inventory.astype(np.float64, copy=True)
+        if nlu_budget:
+            has_budget = self.has_budget[rows]
+            diff = np.maximum(nlu_budget - self.budget[rows], 0)
+            bonus = np.minimum(diff / (nlu_budget + 1e-6), 0.4)
+            preference = np.where(has_budget, preference + bonus, preference)
+        score = (
+            weights.get("semantic", 0.4) * semantic
+            + weights.get("preference", 0.25) * preference
+            + weights.get("popularity", 0.2) * self.popularity[rows]
+            + weights.get("freshness", 0.1) * self.freshness[rows]
+            + weights.get("promo", 0.05) * self.promo[rows]
+        )
+        return np.minimum(score, 1.0)
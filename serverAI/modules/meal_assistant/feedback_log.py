@@ -0,0 +1,228 @@
+from __future__ import annotations
+
+import atexit
+import json
+import os
+import queue
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows: chỉ khoá trong process
+    fcntl = None
+
+
+def rotated_files(path: str) -> List[Path]:
+    """Các file đã xoay vòng (`<tên>.<YYYYmmddTHHMMSS.ffffff>-<pid>`) theo thứ tự thời gian, rồi tới file đang ghi."""
+    active = Path(path)
+    files = sorted(
+        p for p in active.parent.glob(active.name + ".*")
+        if p.is_file() and not p.name.endswith(".lock")
+    )
+    if active.exists():
+        files.append(active)
+    return files
+
+
+def iter_records(path: str) -> Iterator[Dict]:
+    """Đọc tuần tự mọi bản ghi feedback (kể cả file đã xoay vòng); bỏ qua dòng hỏng."""
+    for file in rotated_files(path):
+        with file.open("r", encoding="utf-8", errors="replace") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    continue
+
+
+class FeedbackLogWriter:
+    """
+    Ghi feedback dạng JSONL ở background: request chỉ đưa bản ghi vào hàng đợi, 1 thread
+    gom lô và ghi sau mỗi `flush_interval_s` hoặc khi đủ `batch_size` bản ghi.
+
+    Nhiều worker cùng ghi 1 file: mỗi lô là 1 lệnh write trên fd O_APPEND, nằm trong flock
+    của file `<tên>.lock`; xoay vòng (theo kích thước hoặc tuổi file) cũng làm trong khoá đó,
+    worker khác thấy inode đổi thì mở lại file mới. Lô ghi lỗi (đầy đĩa, không mở được file
+    khoá...) được giữ lại và ghi lại ở lần flush sau, không bị mất.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        flush_interval_s: float = 1.0,
+        batch_size: int = 256,
+        queue_size: int = 10000,
+        rotate_bytes: int = 32 * 1024 * 1024,
+        rotate_interval_s: float = 0.0,
+    ):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.flush_interval_s = max(0.01, float(flush_interval_s))
+        self.batch_size = max(1, int(batch_size))
+        self.rotate_bytes = int(rotate_bytes)
+        self.rotate_interval_s = float(rotate_interval_s)
+        self._queue: "queue.Queue[Dict]" = queue.Queue(maxsize=max(1, int(queue_size)))
+        self._pending: List[Dict] = []  # lô ghi lỗi, chờ ghi lại (tối đa batch_size bản ghi)
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._io_lock = threading.Lock()
+        self._fd: Optional[int] = None
+        self._ino: Optional[int] = None
+        self._started_at: Dict[int, float] = {}  # inode -> ts bản ghi đầu tiên
+        self._counters = {"written": 0, "dropped": 0, "flushes": 0, "rotations": 0, "errors": 0, "retries": 0}
+        self._last_flush: Optional[float] = None
+        self._thread = threading.Thread(target=self._run, name="meal-feedback-writer", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    # ---------- API ----------
+    def append(self, record: Dict) -> bool:
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            self._counters["dropped"] += 1
+            return False
+        if self._queue.qsize() >= self.batch_size:
+            self._wake.set()
+        return True
+
+    def flush(self):
+        with self._io_lock:
+            self._drain()
+
+    def close(self):
+        if self._stop.is_set():
+            return
+        self._stop.set()
+        self._wake.set()
+        self._thread.join(timeout=5)
+        try:
+            self.flush()
+        except Exception as exc:
+            with self._io_lock:
+                lost = len(self._pending) + self._queue.qsize()
+                self._pending = []
+            self._counters["errors"] += 1
+            self._counters["dropped"] += lost
+            print(f"[meal-feedback] final flush failed, {lost} records dropped:", exc)
+        with self._io_lock:
+            if self._fd is not None:
+                os.close(self._fd)
+                self._fd = None
+
+    def stats(self) -> Dict:
+        return {
+            "path": str(self.path),
+            "queued": self._queue.qsize(),
+            "pending": len(self._pending),
+            **self._counters,
+            "lastFlushAt": self._last_flush,
+        }
+
+    # ---------- background ----------
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.wait(self.flush_interval_s)
+            self._wake.clear()
+            try:
+                with self._io_lock:
+                    self._drain()
+            except Exception as exc:
+                self._counters["errors"] += 1
+                print("[meal-feedback] flush failed:", exc)
+
+    def _drain(self):
+        while True:
+            batch, self._pending = self._pending, []
+            if batch:
+                self._counters["retries"] += 1
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            if not batch:
+                return
+            payload = "".join(json.dumps(r, ensure_ascii=False) + "\n" for r in batch).encode("utf-8")
+            try:
+                self._write(payload, batch[0].get("ts"))
+            except Exception:
+                # Giữ nguyên lô (và thứ tự) để ghi lại ở lần flush sau
+                self._pending = batch
+                raise
+            self._counters["written"] += len(batch)
+            self._counters["flushes"] += 1
+            self._last_flush = time.time()
+
+    # ---------- file ----------
+    def _open(self):
+        if self._fd is not None:
+            os.close(self._fd)
+        self._fd = os.open(str(self.path), os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        self._ino = os.fstat(self._fd).st_ino
+
+    def _write(self, payload: bytes, first_ts: Optional[float]):
+        lock_fd = os.open(str(self.path) + ".lock", os.O_WRONLY | os.O_CREAT, 0o644)
+        try:
+            if fcntl is not None:
+                fcntl.flock(lock_fd, fcntl.LOCK_EX)
+            # File có thể đã bị worker khác xoay vòng / xoá
+            try:
+                current_ino = os.stat(self.path).st_ino
+            except FileNotFoundError:
+                current_ino = None
+            if self._fd is None or current_ino != self._ino:
+                self._open()
+            if self._should_rotate(first_ts):
+                self._rotate()
+            st = os.fstat(self._fd)
+            if st.st_size == 0:
+                self._started_at[st.st_ino] = first_ts or time.time()
+            os.write(self._fd, payload)
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_fd, fcntl.LOCK_UN)
+            os.close(lock_fd)
+
+    def _file_started_at(self, ino: int) -> Optional[float]:
+        started = self._started_at.get(ino)
+        if started is None:
+            try:
+                with self.path.open("r", encoding="utf-8") as f:
+                    started = json.loads(f.readline()).get("ts")
+            except (OSError, ValueError, AttributeError):
+                started = None
+            if started is not None:
+                self._started_at[ino] = started
+        return started
+
+    def _should_rotate(self, now_ts: Optional[float]) -> bool:
+        st = os.fstat(self._fd)
+        if st.st_size == 0:
+            return False
+        if self.rotate_bytes > 0 and st.st_size >= self.rotate_bytes:
+            return True
+        if self.rotate_interval_s > 0:
+            started = self._file_started_at(st.st_ino)
+            now = now_ts or time.time()
+            return started is not None and now - started >= self.rotate_interval_s
+        return False
+
+    def _rotate(self):
+        now = time.time()
+        stamp = time.strftime("%Y%m%dT%H%M%S", time.localtime(now)) + f".{int(now % 1 * 1e6):06d}"
+        target = self.path.with_name(f"{self.path.name}.{stamp}-{os.getpid()}")
+        seq = 0
+        while target.exists():  # không bao giờ ghi đè file đã xoay vòng
+            seq += 1
+            target = self.path.with_name(f"{self.path.name}.{stamp}-{os.getpid()}-{seq}")
+        os.replace(self.path, target)
+        self._started_at.pop(self._ino, None)
+        self._counters["rotations"] += 1
+        self._open()
@@ -0,0 +1,141 @@
+from __future__ import annotations
+
+from typing import Dict, List, Optional, Sequence
+
+import faiss
+import numpy as np
+
+from .cache import LRUCache
+
+
+class RecipeFilterIndex:
+    """
+    Mask lọc công thức tính sẵn khi nạp metadata, đẩy thẳng vào FAISS (IDSelectorBitmap)
+    để top-k trả về luôn là k công thức hợp lệ.
+
+    - diet: 1 mask bool cho mỗi nhãn chế độ ăn; nhiều nhãn -> OR (giống _match_diet cũ).
+    - allergen: giữ ngữ nghĩa cũ (chuỗi con trong danh sách allergen đã nối + lowercase);
+      mask của từng từ khoá dị ứng được nhớ lại trong LRU có giới hạn (từ khoá do người dùng nhập).
+    - budget: mảng ngân sách + mask theo bucket để lọc nhanh theo trần ngân sách.
+    """
+
+    def __init__(
+        self,
+        diet_masks: Dict[str, np.ndarray],
+        allergen_texts: Sequence[str],
+        budgets: np.ndarray,
+        budget_buckets: List[float],
+        allergy_cache_size: int = 256,
+    ):
+        self.size = int(budgets.shape[0])
+        self.diet_masks = diet_masks
+        self._allergen_text = allergen_texts
+        self._allergy_masks = LRUCache(allergy_cache_size)
+        self.budgets = budgets
+        self.budget_edges = np.asarray(sorted(budget_buckets), dtype=np.float64)
+        # bucket b chứa các công thức có budget trong (edges[b-1], edges[b]]; bucket cuối là phần vượt edge lớn nhất
+        bucket_ids = np.searchsorted(self.budget_edges, self.budgets, side="left")
+        self.budget_bucket_masks = [bucket_ids == b for b in range(len(self.budget_edges) + 1)]
+
+    @classmethod
+    def from_recipes(
+        cls, recipes: List[Dict], budget_buckets: List[float], allergy_cache_size: int = 256
+    ) -> "RecipeFilterIndex":
+        size = len(recipes)
+        diet_masks: Dict[str, np.ndarray] = {}
+        for i, recipe in enumerate(recipes):
+            for diet in recipe.get("diet", []):
+                diet_masks.setdefault(diet, np.zeros(size, dtype=bool))[i] = True
+        allergen_texts = [" ".join(r.get("allergens", [])).lower() for r in recipes]
+        budgets = np.array([float(r.get("budget") or 0.0) for r in recipes], dtype=np.float64)
+        return cls(diet_masks, allergen_texts, budgets, budget_buckets, allergy_cache_size)
+
+    @classmethod
+    def from_store(cls, store, budget_buckets: List[float], allergy_cache_size: int = 256) -> "RecipeFilterIndex":
+        """Dựng từ CSR diet + cột budget + chuỗi allergen đã build sẵn trong RecipeStore."""
+        size = len(store)
+        indptr = store.arrays["diet_indptr"]
+        indices = store.arrays["diet_indices"]
+        rows = np.repeat(np.arange(size), np.diff(indptr))
+        diet_masks: Dict[str, np.ndarray] = {}
+        for label_id, label in enumerate(store.header.get("diets", [])):
+            mask = np.zeros(size, dtype=bool)
+            mask[rows[indices == label_id]] = True
+            diet_masks[label] = mask
+        return cls(diet_masks, store.allergen_texts, store.arrays["budget"], budget_buckets, allergy_cache_size)
+
+    def diet_mask(self, diets: List[str]) -> Optional[np.ndarray]:
+        if not diets:
+            return None
+        mask = np.zeros(self.size, dtype=bool)
+        for diet in diets:
+            found = self.diet_masks.get(diet)
+            if found is not None:
+                mask |= found
+        return mask
+
+    def _allergy_mask(self, allergy: str) -> np.ndarray:
+        key = allergy.lower()
+        mask = self._allergy_masks.get(key)
+        if mask is None:
+            mask = np.fromiter((key in text for text in self._allergen_text), dtype=bool, count=self.size)
+            self._allergy_masks.put(key, mask)
+        return mask
+
+    def allergen_mask(self, allergies: List[str]) -> Optional[np.ndarray]:
+        """True = công thức KHÔNG chứa dị ứng nào trong danh sách."""
+        if not allergies:
+            return None
+        excluded = np.zeros(self.size, dtype=bool)
+        for allergy in allergies:
+            excluded |= self._allergy_mask(allergy)
+        return ~excluded
+
+    def budget_mask(self, max_budget: Optional[float]) -> Optional[np.ndarray]:
+        if max_budget is None:
+            return None
+        # Bucket nằm trọn dưới trần: lấy nguyên mask; chỉ bucket chứa trần mới so từng giá trị
+        boundary = int(np.searchsorted(self.budget_edges, max_budget, side="left"))
+        mask = np.zeros(self.size, dtype=bool)
+        for b in range(boundary):
+            mask |= self.budget_bucket_masks[b]
+        partial = self.budget_bucket_masks[boundary]
+        mask |= partial & (self.budgets <= max_budget)
+        return mask
+
+    def build(self, diets: List[str], allergies: List[str], max_budget: Optional[float] = None) -> Optional[np.ndarray]:
+        """AND các mask; None nếu không có điều kiện lọc nào."""
+        result = None
+        for mask in (self.diet_mask(diets), self.allergen_mask(allergies), self.budget_mask(max_budget)):
+            if mask is None:
+                continue
+            result = mask.copy() if result is None else result & mask
+        return result
+
+
+def search_params(index: faiss.Index, **kwargs) -> faiss.SearchParameters:
+    """
+    SearchParameters đúng kiểu cho index (IVF / HNSW bắt buộc lớp con riêng), mang theo
+    nprobe / efSearch hiện tại của index vì params sẽ ghi đè giá trị đặt trên index.
+    """
+    if isinstance(index, faiss.IndexIVF):
+        return faiss.SearchParametersIVF(nprobe=index.nprobe, **kwargs)
+    if isinstance(index, faiss.IndexHNSW):
+        return faiss.SearchParametersHNSW(efSearch=index.hnsw.efSearch, **kwargs)
+    return faiss.SearchParameters(**kwargs)
+
+
+class _BitmapSelector:
+    """Giữ bitmap numpy sống cùng IDSelectorBitmap (FAISS chỉ giữ con trỏ)."""
+
+    def __init__(self, mask: np.ndarray, index: Optional[faiss.Index] = None):
+        self.bitmap = np.packbits(mask, bitorder="little")
+        self.selector = faiss.IDSelectorBitmap(mask.shape[0], faiss.swig_ptr(self.bitmap))
+        if index is None:
+            self.params = faiss.SearchParameters(sel=self.selector)
+        else:
+            self.params = search_params(index, sel=self.selector)
+
+
+def selector_params(mask: np.ndarray, index: Optional[faiss.Index] = None) -> _BitmapSelector:
+    return _BitmapSelector(mask, index)
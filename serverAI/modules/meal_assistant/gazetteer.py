@@ -0,0 +1,219 @@
+from __future__ import annotations
+
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Dict, Hashable, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from .text_norm import fold, has_diacritics, normalize
+
+_NUMBER_CHARS = frozenset("0123456789.,")
+
+
+class AhoCorasick:
+    """Automaton Aho-Corasick mức ký tự: tìm mọi pattern trong 1 lượt duyệt văn bản."""
+
+    def __init__(self):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[List[Tuple[int, object]]] = [[]]  # (độ dài pattern, payload)
+        self._built = False
+
+    def __len__(self) -> int:
+        return len(self._goto)
+
+    def add(self, pattern: str, payload: object):
+        if not pattern:
+            return
+        state = 0
+        for ch in pattern:
+            nxt = self._goto[state].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[state][ch] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+            state = nxt
+        self._out[state].append((len(pattern), payload))
+        self._built = False
+
+    def build(self):
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in self._goto[state].items():
+                queue.append(nxt)
+                fail = self._fail[state]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[nxt] = self._goto[fail].get(ch, 0)
+                self._out[nxt] = self._out[nxt] + self._out[self._fail[nxt]]
+        self._built = True
+
+    def iter(self, text: str) -> Iterator[Tuple[int, int, object]]:
+        """(start, end, payload) của mọi lần xuất hiện, end không bao gồm."""
+        if not self._built:
+            self.build()
+        goto, fail, out = self._goto, self._fail, self._out
+        state = 0
+        for i, ch in enumerate(text):
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            for length, payload in out[state]:
+                yield i + 1 - length, i + 1, payload
+
+
+@dataclass
+class GazetteerMatches:
+    ingredients: List[str] = field(default_factory=list)     # tên nguyên liệu / sản phẩm chuẩn
+    reference_ids: List[str] = field(default_factory=list)   # reference_id catalog tương ứng
+    diets: List[str] = field(default_factory=list)
+    intents: List[str] = field(default_factory=list)          # theo thứ tự ưu tiên của bảng từ khoá
+    servings: Optional[int] = None
+    budget: Optional[float] = None
+
+
+def _parse_number(raw: str) -> Optional[float]:
+    raw = raw.strip(".,")
+    if not raw:
+        return None
+    parts = raw.replace(",", ".").split(".")
+    # "100.000" / "1,500,000": dấu phân cách hàng nghìn
+    if len(parts) > 1 and all(len(p) == 3 for p in parts[1:]) and 1 <= len(parts[0]) <= 3:
+        return float("".join(parts))
+    try:
+        return float(raw.replace(",", "."))
+    except ValueError:
+        return None
+
+
+def _fold_aligned(text: str) -> str:
+    """Bỏ dấu từng ký tự, giữ nguyên độ dài để vị trí khớp dùng chung cho 2 dạng."""
+    return "".join((fold(ch) or ch)[0] for ch in text)
+
+
+def _compatible(query_span: str, pattern: str) -> bool:
+    """Ký tự gõ có dấu phải trùng đúng pattern; ký tự gõ không dấu khớp mọi dạng có dấu của nó."""
+    return all(q == p or not has_diacritics(q) for q, p in zip(query_span, pattern))
+
+
+class Gazetteer:
+    """
+    Từ điển thực thể biên dịch 1 lần thành automaton Aho-Corasick: tên sản phẩm catalog,
+    tên nguyên liệu trong công thức, từ khoá chế độ ăn / ý định và đơn vị khẩu phần / tiền.
+
+    Mỗi pattern có 2 automaton như chỉ mục từ vựng: dạng có dấu (phân biệt "cá" / "cà",
+    "bò" / "bơ") và dạng bỏ dấu. Khớp bỏ dấu chỉ được nhận ở đoạn người dùng gõ không dấu
+    (ký tự có dấu trong câu vẫn phải trùng pattern), và thua khớp có dấu cùng vị trí.
+    `scan` giữ các khớp dài nhất không chồng nhau, chỉ nhận khớp trọn từ.
+    """
+
+    def __init__(self, key: Hashable = None):
+        self.key = key
+        self._accented = AhoCorasick()
+        self._folded = AhoCorasick()
+        self._intent_rank: Dict[str, int] = {}
+        self.counts: Dict[str, int] = {}
+
+    def _add(self, kind: str, surface: str, value):
+        pattern = " ".join(normalize(surface).split())
+        if pattern:
+            self._accented.add(pattern, (kind, value, pattern))
+            self._folded.add(_fold_aligned(pattern), (kind, value, pattern))
+            self.counts[kind] = self.counts.get(kind, 0) + 1
+
+    @classmethod
+    def compile(
+        cls,
+        products: Iterable[Tuple[str, str]],
+        ingredients: Iterable[Tuple[str, Optional[str]]],
+        diets: Dict[str, Sequence[str]],
+        intents: Dict[str, Sequence[str]],
+        serving_units: Sequence[str],
+        budget_units: Dict[str, float],
+        key: Hashable = None,
+    ) -> "Gazetteer":
+        gz = cls(key)
+        for name, ref in ingredients:
+            gz._add("ingredient", name, (normalize(" ".join(name.split())), ref))
+        for name, ref in products:
+            gz._add("ingredient", name, (normalize(" ".join(name.split())), ref))
+        for label, keywords in diets.items():
+            for kw in keywords:
+                gz._add("diet", kw, label)
+        for rank, (label, keywords) in enumerate(intents.items()):
+            gz._intent_rank[label] = rank
+            for kw in keywords:
+                gz._add("intent", kw, label)
+        for unit in serving_units:
+            gz._add("servings", unit, 1.0)
+        for unit, multiplier in budget_units.items():
+            gz._add("budget", unit, multiplier)
+        gz._accented.build()
+        gz._folded.build()
+        return gz
+
+    @staticmethod
+    def _number_before(text: str, start: int) -> Optional[float]:
+        i = start
+        while i > 0 and text[i - 1] == " ":
+            i -= 1
+        j = i
+        while j > 0 and text[j - 1] in _NUMBER_CHARS:
+            j -= 1
+        if j == i or (j > 0 and text[j - 1].isalnum()):
+            return None
+        return _parse_number(text[j:i])
+
+    def _matches(self, automaton: AhoCorasick, text: str, rank: int, accented: Optional[str] = None) -> Iterator[tuple]:
+        for start, end, (kind, value, pattern) in automaton.iter(text):
+            if end < len(text) and text[end].isalnum():
+                continue
+            if accented is not None and not _compatible(accented[start:end], pattern):
+                continue
+            if kind in ("servings", "budget"):
+                # đơn vị phải đi ngay sau 1 số ("2 người", "150k", "1,5 triệu")
+                number = self._number_before(text, start)
+                if number is None:
+                    continue
+                yield start, end, rank, kind, value, number
+            elif start == 0 or not text[start - 1].isalnum():
+                yield start, end, rank, kind, value, None
+
+    def scan(self, query: str) -> GazetteerMatches:
+        text = " ".join(normalize(query).split())
+        folded = _fold_aligned(text)
+        found = []
+        if folded != text:
+            found.extend(self._matches(self._accented, text, 0))
+        found.extend(self._matches(self._folded, folded, 1, text))
+
+        result = GazetteerMatches()
+        intents = set()
+        last_end = -1
+        # khớp dài nhất bên trái nhất (cùng vị trí: dạng có dấu trước), bỏ các khớp chồng lên khớp đã nhận
+        for start, end, _, kind, value, number in sorted(found, key=lambda m: (m[0], m[0] - m[1], m[2])):
+            if start < last_end:
+                continue
+            last_end = end
+            if kind == "ingredient":
+                name, ref = value
+                if name not in result.ingredients:
+                    result.ingredients.append(name)
+                if ref and ref not in result.reference_ids:
+                    result.reference_ids.append(ref)
+            elif kind == "diet":
+                if value not in result.diets:
+                    result.diets.append(value)
+            elif kind == "intent":
+                intents.add(value)
+            elif kind == "servings" and result.servings is None:
+                result.servings = int(number)
+            elif kind == "budget" and result.budget is None:
+                result.budget = number * value
+        result.intents = sorted(intents, key=lambda label: self._intent_rank.get(label, len(self._intent_rank)))
+        return result
+
+    def stats(self) -> Dict:
+        return {"states": len(self._accented) + len(self._folded), "patterns": dict(self.counts)}
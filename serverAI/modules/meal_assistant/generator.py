@@ -1,6 +1,8 @@
 from __future__ import annotations
 
+import time
 from functools import lru_cache
+from typing import Iterator
 
 import google.generativeai as genai
 
@@ -41,27 +43,75 @@ def _get_gemini_model():
     return genai.GenerativeModel(settings.GEMINI_MODEL)
 
 
-def call_gemini(recipes: list[dict], query: str, language: str, temperature: float) -> str:
-    model = _get_gemini_model()
-    if model is None:
-        return "(Chưa cấu hình GEMINI_API_KEY nên trả về gợi ý dạng JSON)"
-
-    structured = build_structured_block(recipes)
-    prompt = _PROMPT.format(
-        structured=structured,
+def build_prompt(recipes: list[dict], query: str, language: str) -> str:
+    return _PROMPT.format(
+        structured=build_structured_block(recipes),
         query=query,
         language=language,
         count=len(recipes),
     )
 
-    resp = model.generate_content(
-        prompt,
-        generation_config={
-            "temperature": temperature,
-            "max_output_tokens": 512,
-        },
-    )
+
+def _generation_config(temperature: float) -> dict:
+    return {
+        "temperature": temperature,
+        "max_output_tokens": 512,
+    }
+
+
+def call_gemini(recipes: list[dict], query: str, language: str, temperature: float) -> str:
+    model = _get_gemini_model()
+    if model is None:
+        return "(Chưa cấu hình GEMINI_API_KEY nên trả về gợi ý dạng JSON)"
+
+    prompt = build_prompt(recipes, query, language)
+    resp = model.generate_content(prompt, generation_config=_generation_config(temperature))
     text = getattr(resp, "text", None)
     if text:
         return text.strip()
     return "Gemini không trả nội dung"
+
+
+def stream_gemini(recipes: list[dict], query: str, language: str, temperature: float) -> Iterator[str]:
+    """Như call_gemini nhưng trả từng đoạn text ngay khi Gemini sinh ra."""
+    model = _get_gemini_model()
+    if model is None:
+        yield "(Chưa cấu hình GEMINI_API_KEY nên trả về gợi ý dạng JSON)"
+        return
+
+    prompt = build_prompt(recipes, query, language)
+    resp = model.generate_content(prompt, generation_config=_generation_config(temperature), stream=True)
+    produced = False
+    for chunk in resp:
+        try:
+            text = chunk.text
+        except ValueError:
+            # chunk không có text (bị chặn / chỉ chứa metadata)
+            continue
+        if text:
+            produced = True
+            yield text
+    if not produced:
+        yield "Gemini không trả nội dung"
+
+
+def stream_fake(recipes: list[dict], query: str, language: str, temperature: float) -> Iterator[str]:
+    """LLM giả lập cho môi trường offline / test: đọc lại khối structured theo từng từ."""
+    delay = settings.MEAL_FAKE_LLM_DELAY_MS / 1000.0
+    text = f"Gợi ý cho \"{query}\":\n" + build_structured_block(recipes)
+    for i, word in enumerate(text.split(" ")):
+        if delay > 0:
+            time.sleep(delay)
+        yield word if i == 0 else " " + word
+
+
+def stream_llm(recipes: list[dict], query: str, language: str, temperature: float) -> Iterator[str]:
+    if settings.MEAL_LLM_PROVIDER.lower() == "fake":
+        return stream_fake(recipes, query, language, temperature)
+    return stream_gemini(recipes, query, language, temperature)
+
+
+def call_llm(recipes: list[dict], query: str, language: str, temperature: float) -> str:
+    if settings.MEAL_LLM_PROVIDER.lower() == "fake":
+        return "".join(stream_fake(recipes, query, language, temperature))
+    return call_gemini(recipes, query, language, temperature)
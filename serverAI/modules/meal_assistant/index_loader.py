@@ -1,28 +1,291 @@
 from __future__ import annotations
 
-import json
+import threading
+import time
+from dataclasses import dataclass, replace
 from pathlib import Path
-from typing import List, Tuple
+from typing import Callable, List, Optional, Tuple
 
 import faiss
 import numpy as np
 from sentence_transformers import SentenceTransformer
 
 from core.config import settings
+from .cache import LRUCache
+from .columns import RecipeColumns
+from .filters import RecipeFilterIndex, selector_params
+from .lexical import LexicalIndex
+from .recipe_store import RecipeStore
 
-_index = None
-_metadata = None
+
+class IndexMismatchError(RuntimeError):
+    """FAISS index và metadata trên đĩa không cùng 1 lần build (vd build tool đang ghi dở)."""
+
+
+@dataclass(frozen=True)
+class MealIndexBundle:
+    """
+    Mọi thứ dựng từ 1 cặp (FAISS index, metadata) nhất quán. Nạp lại = dựng bundle mới rồi
+    gán thay 1 lần; request lấy bundle 1 lần và dùng đến hết, không bao giờ trộn index mới
+    với mask / cột của metadata cũ.
+    """
+
+    version: int      # tăng mỗi lần nạp lại index + metadata
+    generation: int   # tăng mỗi lần thay bundle (kể cả chỉ đổi popularity); dùng trong key cache kết quả
+    index: faiss.Index
+    store: RecipeStore
+    filters: RecipeFilterIndex
+    columns: RecipeColumns
+    lexical: Optional[LexicalIndex]
+
+    def search(self, query: str, top_k: int, mask: Optional[np.ndarray] = None) -> List[Tuple[int, float]]:
+        """mask: bool theo id công thức; chỉ các id True được FAISS xét (IDSelectorBitmap)."""
+        vector = embed_query(query)
+        if mask is not None and not mask.any():
+            return []
+        if mask is None or mask.all():
+            sims, idxs = self.index.search(vector, top_k)
+        else:
+            selector = selector_params(mask, self.index)
+            sims, idxs = self.index.search(vector, top_k, params=selector.params)
+        pairs = []
+        for score, idx in zip(sims[0], idxs[0]):
+            if idx < 0:
+                continue
+            pairs.append((int(idx), float(score)))
+        return pairs
+
+
+_bundle: Optional[MealIndexBundle] = None
 _embedder = None
+_index_version = 0
+_generation = 0
+_index_mtimes: Tuple[float, ...] = (0.0, 0.0)
+# popularity từ feedback đổi độc lập với index: chỉ dựng lại cột, không nạp lại index/metadata
+_popularity_mtime = 0.0
+_rejected_mtimes: Optional[Tuple[float, ...]] = None
+_last_check = 0.0
+_reload_lock = threading.Lock()
+_reload_listeners: List[Callable[[int], None]] = []
+_popularity_listeners: List[Callable[[], None]] = []
+
+_query_cache = LRUCache(settings.MEAL_QUERY_CACHE_SIZE)
+
+
+def normalize_query(text: str) -> str:
+    return " ".join(text.strip().lower().split())
+
+
+def _mtime(path: str) -> float:
+    p = Path(path)
+    return p.stat().st_mtime if p.exists() else 0.0
+
+
+def _current_mtimes() -> Tuple[float, ...]:
+    return _mtime(settings.MEAL_INDEX_PATH), _mtime(str(_metadata_path()))
+
+
+def _metadata_path() -> Path:
+    """File nhị phân MEAL_METADATA_PATH; chưa build lại thì dùng meal_index_meta.json cũ cùng thư mục."""
+    path = Path(settings.MEAL_METADATA_PATH)
+    legacy = path.with_suffix(".json")
+    if not path.exists() and legacy.exists():
+        return legacy
+    return path
+
+
+def add_reload_listener(fn: Callable[[int], None]):
+    """fn(version) được gọi sau khi index được build lại / nạp lại."""
+    _reload_listeners.append(fn)
+
+
+def add_popularity_listener(fn: Callable[[], None]):
+    """fn() được gọi sau khi file popularity (tools/aggregate_meal_feedback.py) đổi."""
+    _popularity_listeners.append(fn)
+
+
+def _notify(listeners: List[Callable], *args):
+    for fn in list(listeners):
+        try:
+            fn(*args)
+        except Exception as exc:
+            print("[meal-index] listener failed:", exc)
+
+
+# ---------- build ----------
+def _load_faiss_index(path: Path) -> Tuple[faiss.Index, int]:
+    if not path.exists():
+        raise FileNotFoundError(f"FAISS index not found: {path}. Hãy chạy tools/build_meal_index.py")
+    size = path.stat().st_size
+    return tune_index(faiss.read_index(str(path), _read_flags())), size
+
+
+def _open_store() -> RecipeStore:
+    path = _metadata_path()
+    if not path.exists():
+        raise FileNotFoundError(f"Metadata not found: {path}. Hãy chạy tools/build_meal_index.py")
+    store = RecipeStore.open(str(path), settings.MEAL_RECORD_CACHE_SIZE)
+    print(f"[meal-index] metadata: {len(store)} recipes ({store.codec}) <- {path}")
+    return store
+
+
+def _check_consistent(index: faiss.Index, index_bytes: int, store: RecipeStore):
+    """Metadata ghi kèm kích thước file index lúc build; lệch nghĩa là index và metadata khác lần build."""
+    expected = store.header.get("index_bytes")
+    if index.ntotal != len(store) or (expected is not None and int(expected) != index_bytes):
+        raise IndexMismatchError(
+            f"FAISS index ({index.ntotal} vectors, {index_bytes} bytes) does not match metadata "
+            f"({len(store)} recipes, index_bytes={expected}); chạy lại tools/build_meal_index.py"
+        )
+
 
+def _build_columns(store: RecipeStore) -> RecipeColumns:
+    columns = RecipeColumns.from_store(store)
+    popularity = _load_popularity(store)
+    if popularity is not None:
+        columns.popularity = popularity
+    return columns
 
-def load_metadata():
-    global _metadata
-    if _metadata is None:
-        path = Path(settings.MEAL_METADATA_PATH)
-        if not path.exists():
-            raise FileNotFoundError(f"Metadata not found: {path}. Hãy chạy tools/build_meal_index.py")
-        _metadata = json.loads(path.read_text(encoding="utf-8"))
-    return _metadata
+
+def _build_bundle(version: int, generation: int) -> MealIndexBundle:
+    store = _open_store()
+    index, index_bytes = _load_faiss_index(Path(settings.MEAL_INDEX_PATH))
+    _check_consistent(index, index_bytes, store)
+    lexical = None
+    if settings.MEAL_LEXICAL_ENABLED:
+        lexical = LexicalIndex.from_store(store, settings.MEAL_BM25_K1, settings.MEAL_BM25_B)
+        if lexical is None:
+            print("[meal-index] metadata chưa có chỉ mục từ vựng; chạy lại tools/build_meal_index.py")
+    return MealIndexBundle(
+        version=version,
+        generation=generation,
+        index=index,
+        store=store,
+        filters=RecipeFilterIndex.from_store(
+            store, settings.MEAL_BUDGET_BUCKETS, settings.MEAL_ALLERGY_MASK_CACHE_SIZE
+        ),
+        columns=_build_columns(store),
+        lexical=lexical,
+    )
+
+
+def _swap_in() -> MealIndexBundle:
+    """Dựng bundle mới từ đĩa và thay bundle hiện tại; gọi khi đang giữ _reload_lock."""
+    global _bundle, _index_version, _generation, _index_mtimes, _popularity_mtime, _rejected_mtimes
+    mtimes = _current_mtimes()
+    popularity_mtime = _mtime(settings.MEAL_POPULARITY_PATH)
+    bundle = _build_bundle(_index_version + 1, _generation + 1)
+    _bundle = bundle
+    _index_version, _generation = bundle.version, bundle.generation
+    _index_mtimes, _popularity_mtime, _rejected_mtimes = mtimes, popularity_mtime, None
+    return bundle
+
+
+def _after_reload(version: int):
+    _query_cache.clear()
+    _notify(_reload_listeners, version)
+    print(f"[meal-index] index reloaded (v{version})")
+
+
+def reload_index() -> int:
+    """Nạp lại index + metadata ngay; lỗi (thiếu file / không khớp) thì giữ bundle đang dùng và raise."""
+    with _reload_lock:
+        version = _swap_in().version
+    _after_reload(version)
+    return version
+
+
+def _swap_popularity():
+    """Chỉ dựng lại RecipeColumns (đọc popularity mới); gọi khi đang giữ _reload_lock."""
+    global _bundle, _generation, _popularity_mtime
+    _popularity_mtime = _mtime(settings.MEAL_POPULARITY_PATH)
+    if _bundle is not None:
+        _generation += 1
+        _bundle = replace(_bundle, columns=_build_columns(_bundle.store), generation=_generation)
+
+
+def _after_popularity():
+    _notify(_popularity_listeners)
+    print("[meal-index] popularity reloaded")
+
+
+def reload_popularity():
+    """Đọc lại popularity; index, metadata và chỉ mục từ vựng giữ nguyên."""
+    with _reload_lock:
+        _swap_popularity()
+    _after_popularity()
+
+
+def _maybe_reload():
+    """
+    Phát hiện tools/build_meal_index.py / aggregate_meal_feedback.py vừa ghi lại file
+    (kiểm tra mtime tối đa mỗi MEAL_INDEX_CHECK_INTERVAL_S). Build tool ghi index trước,
+    metadata sau: trong khoảng giữa 2 file không khớp nhau nên giữ bundle cũ và thử lại lần sau.
+    """
+    global _last_check, _rejected_mtimes
+    interval = settings.MEAL_INDEX_CHECK_INTERVAL_S
+    now = time.monotonic()
+    if _bundle is None or interval <= 0 or now - _last_check < interval:
+        return
+    # Thread khác đang nạp lại: dùng bundle hiện tại, không chờ
+    if not _reload_lock.acquire(blocking=False):
+        return
+    reloaded: Optional[int] = None
+    popularity_changed = False
+    try:
+        _last_check = now
+        mtimes = _current_mtimes()
+        if mtimes != _index_mtimes:
+            try:
+                reloaded = _swap_in().version
+            except (FileNotFoundError, IndexMismatchError) as exc:
+                if mtimes != _rejected_mtimes:
+                    print("[meal-index] keep current index:", exc)
+                _rejected_mtimes = mtimes
+        elif _mtime(settings.MEAL_POPULARITY_PATH) != _popularity_mtime:
+            _swap_popularity()
+            popularity_changed = True
+    finally:
+        _reload_lock.release()
+    if reloaded is not None:
+        _after_reload(reloaded)
+    elif popularity_changed:
+        _after_popularity()
+
+
+def get_bundle() -> MealIndexBundle:
+    """Bundle index + metadata hiện tại; nạp lần đầu khi được gọi."""
+    _maybe_reload()
+    bundle = _bundle
+    if bundle is None:
+        with _reload_lock:
+            bundle = _bundle if _bundle is not None else _swap_in()
+    return bundle
+
+
+def index_version() -> int:
+    _maybe_reload()
+    return _index_version
+
+
+def _load_popularity(store: RecipeStore) -> Optional[np.ndarray]:
+    """Mảng popularity từ feedback; bỏ qua nếu không khớp metadata hiện tại (số công thức / recipes_hash)."""
+    path = Path(settings.MEAL_POPULARITY_PATH)
+    if not path.exists():
+        return None
+    try:
+        with np.load(path, allow_pickle=False) as data:
+            popularity = np.asarray(data["popularity"], dtype=np.float64)
+            recipes_hash = str(data["recipes_hash"]) if "recipes_hash" in data else ""
+    except Exception as exc:
+        print("[meal-index] popularity ignored:", exc)
+        return None
+    expected = store.header.get("recipes_hash") or ""
+    if popularity.shape != (len(store),) or (expected and recipes_hash and recipes_hash != expected):
+        print(f"[meal-index] popularity ignored: built for another recipe set ({path})")
+        return None
+    print(f"[meal-index] popularity <- {path}")
+    return popularity
 
 
 def get_embedder() -> SentenceTransformer:
@@ -32,22 +295,41 @@ def get_embedder() -> SentenceTransformer:
     return _embedder
 
 
-def load_index() -> faiss.Index:
-    global _index
-    if _index is None:
-        path = Path(settings.MEAL_INDEX_PATH)
-        if not path.exists():
-            raise FileNotFoundError(f"FAISS index not found: {path}. Hãy chạy tools/build_meal_index.py")
-        _index = faiss.read_index(str(path))
-    return _index
-
-
-def search(query: str, top_k: int) -> List[Tuple[int, float]]:
-    model = get_embedder()
-    index = load_index()
-    vector = model.encode([query], normalize_embeddings=True)
-    sims, idxs = index.search(np.array(vector, dtype=np.float32), top_k)
-    pairs = []
-    for score, idx in zip(sims[0], idxs[0]):
-        pairs.append((int(idx), float(score)))
-    return pairs
+def _read_flags() -> int:
+    """mmap index thay vì đọc hết vào RAM (MMAP_IFC: cả mã vector của index flat/HNSW, FAISS >= 1.10)."""
+    if not settings.MEAL_INDEX_MMAP:
+        return 0
+    flags = faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY
+    return flags | getattr(faiss, "IO_FLAG_MMAP_IFC", 0)
+
+
+def tune_index(index: faiss.Index) -> faiss.Index:
+    """Áp nprobe (IVF) / efSearch (HNSW) từ settings; index flat giữ nguyên."""
+    if isinstance(index, faiss.IndexIVF):
+        index.nprobe = settings.MEAL_IVF_NPROBE
+        print(f"[meal-index] IVF nlist={index.nlist} nprobe={index.nprobe}")
+    elif isinstance(index, faiss.IndexHNSW):
+        index.hnsw.efSearch = settings.MEAL_HNSW_EF_SEARCH
+        print(f"[meal-index] HNSW efSearch={index.hnsw.efSearch}")
+    return index
+
+
+def embed_query(query: str) -> np.ndarray:
+    """Embedding (1, dim) của câu truy vấn, cache LRU theo text đã chuẩn hoá."""
+    key = normalize_query(query)
+    vector = _query_cache.get(key)
+    if vector is None:
+        vector = np.array(get_embedder().encode([key], normalize_embeddings=True), dtype=np.float32)
+        vector.setflags(write=False)
+        _query_cache.put(key, vector)
+    return vector
+
+
+def query_cache_stats():
+    return _query_cache.stats()
+
+
+def record_cache_stats():
+    """LRU công thức đã decode; None nếu metadata chưa được nạp."""
+    bundle = _bundle
+    return bundle.store.cache_stats() if bundle is not None else None
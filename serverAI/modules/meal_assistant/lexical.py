@@ -0,0 +1,179 @@
+from __future__ import annotations
+
+import math
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from .text_norm import fold, has_diacritics, is_stopword, tokenize
+
+# Trọng số tf theo field khi đánh chỉ mục
+FIELD_WEIGHTS = {"name": 3.0, "tags": 1.5, "ingredients": 2.0}
+_FOLDED = "~"  # tiền tố term dạng bỏ dấu
+_EXACT = "="   # tiền tố term "tên món chính xác" (dạng bỏ dấu của cả tên)
+
+
+def _grams(tokens: List[str]) -> List[str]:
+    """unigram + bigram âm tiết (tiếng Việt: 1 từ thường gồm 2 âm tiết, vd "thịt bò")."""
+    return tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+
+
+def exact_key(text: str) -> str:
+    return _EXACT + " ".join(fold(" ".join(tokenize(text))).split())
+
+
+def _recipe_fields(recipe: Dict) -> Iterable[Tuple[str, str]]:
+    yield "name", recipe.get("name", "")
+    for tag in recipe.get("tags", []):
+        yield "tags", tag
+    for ing in recipe.get("ingredients", []):
+        yield "ingredients", ing.get("name", "")
+
+
+@dataclass
+class LexicalHits:
+    rows: np.ndarray      # id công thức, điểm giảm dần
+    scores: np.ndarray    # BM25 / BM25 lớn nhất, trong [0, 1]
+    coverage: np.ndarray  # tỉ lệ âm tiết của truy vấn có trong công thức
+    exact: np.ndarray     # tên món trùng khớp nguyên văn (bỏ dấu)
+
+    def similarity(self) -> np.ndarray:
+        """Điểm cùng thang với cosine: 1.0 nếu trùng tên, còn lại trung bình coverage và BM25 chuẩn hoá."""
+        return np.where(self.exact, 1.0, 0.5 * self.coverage + 0.5 * self.scores)
+
+    def confident(self, min_coverage: float, min_hits: int) -> bool:
+        if self.exact.any():
+            return True
+        return int((self.coverage >= min_coverage).sum()) >= min_hits
+
+    def pairs(self) -> List[Tuple[int, float]]:
+        return list(zip(self.rows.tolist(), self.similarity().tolist()))
+
+
+class LexicalIndex:
+    """
+    Chỉ mục ngược BM25 trên tên món, tag và tên nguyên liệu.
+
+    Mỗi unigram/bigram được đánh chỉ mục 2 lần: dạng có dấu và dạng bỏ dấu (tiền tố "~").
+    Truy vấn gõ có dấu -> so khớp dạng có dấu (phân biệt "bò" / "bó"); gõ không dấu -> dạng bỏ dấu.
+    Postings lưu dạng CSR (term -> các công thức + tf có trọng số field), build cùng FAISS index
+    và nằm trong RecipeStore nên được mmap như các cột khác.
+    """
+
+    def __init__(self, arrays: Dict[str, np.ndarray], terms: Iterable[str], k1: float = 1.2, b: float = 0.75):
+        self.indptr = arrays["lex_indptr"]
+        self.rows = arrays["lex_rows"]
+        self.tf = arrays["lex_tf"]
+        self.doc_len = arrays["lex_doclen"]
+        self.size = int(self.doc_len.shape[0])
+        self.avgdl = float(self.doc_len.mean()) if self.size else 0.0
+        self.term_ids: Dict[str, int] = {t: i for i, t in enumerate(terms)}
+        self.k1 = k1
+        self.b = b
+
+    def arrays(self) -> Dict[str, np.ndarray]:
+        return {"lex_indptr": self.indptr, "lex_rows": self.rows, "lex_tf": self.tf, "lex_doclen": self.doc_len}
+
+    @property
+    def terms(self) -> List[str]:
+        return list(self.term_ids)
+
+    @classmethod
+    def from_store(cls, store, k1: float = 1.2, b: float = 0.75) -> Optional["LexicalIndex"]:
+        terms = store.header.get("lexical_terms")
+        if terms is None:
+            return None
+        return cls(store.arrays, terms, k1, b)
+
+    @classmethod
+    def from_recipes(cls, recipes: List[Dict]) -> "LexicalIndex":
+        postings: Dict[str, Dict[int, float]] = {}
+        doc_len = np.zeros(len(recipes), dtype=np.float32)
+        for row, recipe in enumerate(recipes):
+            for field, text in _recipe_fields(recipe):
+                tokens = tokenize(text)
+                if not tokens:
+                    continue
+                weight = FIELD_WEIGHTS[field]
+                doc_len[row] += weight * len(tokens)
+                folded = [fold(t) for t in tokens]
+                for term in _grams(tokens) + [_FOLDED + g for g in _grams(folded)]:
+                    slot = postings.setdefault(term, {})
+                    slot[row] = slot.get(row, 0.0) + weight
+            postings.setdefault(exact_key(recipe.get("name", "")), {})[row] = 1.0
+
+        terms = list(postings)
+        indptr = np.zeros(len(terms) + 1, dtype=np.int64)
+        rows: List[int] = []
+        tfs: List[float] = []
+        for i, term in enumerate(terms):
+            for row, tf in sorted(postings[term].items()):
+                rows.append(row)
+                tfs.append(tf)
+            indptr[i + 1] = len(rows)
+        arrays = {
+            "lex_indptr": indptr,
+            "lex_rows": np.asarray(rows, dtype=np.int32),
+            "lex_tf": np.asarray(tfs, dtype=np.float32),
+            "lex_doclen": doc_len,
+        }
+        return cls(arrays, terms)
+
+    def _postings(self, term: str) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        tid = self.term_ids.get(term)
+        if tid is None:
+            return None
+        start, end = int(self.indptr[tid]), int(self.indptr[tid + 1])
+        return self.rows[start:end], self.tf[start:end]
+
+    def query_terms(self, text: str) -> Tuple[List[str], List[str]]:
+        """(unigram, unigram + bigram) của truy vấn theo dạng có dấu / bỏ dấu, đã bỏ từ đệm."""
+        tokens = [t for t in tokenize(text) if not t[0].isdigit()]
+        folded_query = not any(has_diacritics(t) for t in tokens)
+        # Có dấu: so từ đệm nguyên dạng ("tỏi" khác "tôi"); không dấu mới so dạng bỏ dấu
+        tokens = [t for t in tokens if not is_stopword(t, folded_query)]
+        if folded_query:
+            tokens = [_FOLDED + t for t in tokens]
+            bigrams = [f"{a} {b[len(_FOLDED):]}" for a, b in zip(tokens, tokens[1:])]
+        else:
+            bigrams = [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+        return tokens, tokens + bigrams
+
+    def search(self, text: str, top_k: int, mask: Optional[np.ndarray] = None) -> Optional[LexicalHits]:
+        unigrams, terms = self.query_terms(text)
+        if not unigrams or not self.size:
+            return None
+        scores = np.zeros(self.size, dtype=np.float64)
+        matched = np.zeros(self.size, dtype=np.float64)
+        for term in terms:
+            found = self._postings(term)
+            if found is None:
+                continue
+            rows, tf = found
+            idf = math.log(1.0 + (self.size - rows.size + 0.5) / (rows.size + 0.5))
+            norm = self.k1 * (1.0 - self.b + self.b * self.doc_len[rows] / (self.avgdl or 1.0))
+            # rows của 1 term là duy nhất nên cộng theo chỉ số là đủ
+            scores[rows] += idf * tf * (self.k1 + 1.0) / (tf + norm)
+        for term in set(unigrams):
+            found = self._postings(term)
+            if found is not None:
+                matched[found[0]] += unigrams.count(term)
+        if mask is not None:
+            scores[~mask] = 0.0
+        candidates = np.flatnonzero(scores > 0)
+        if candidates.size == 0:
+            return None
+        if candidates.size > top_k:
+            candidates = candidates[np.argpartition(-scores[candidates], top_k - 1)[:top_k]]
+        order = candidates[np.argsort(-scores[candidates], kind="stable")]
+        exact = np.zeros(order.size, dtype=bool)
+        found = self._postings(exact_key(text))
+        if found is not None:
+            exact = np.isin(order, found[0])
+        return LexicalHits(
+            rows=order,
+            scores=scores[order] / scores[order[0]],
+            coverage=matched[order] / len(unigrams),
+            exact=exact,
+        )
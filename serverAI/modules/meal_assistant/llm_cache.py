@@ -0,0 +1,179 @@
+from __future__ import annotations
+
+import hashlib
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS llm_cache (
+    key TEXT PRIMARY KEY,
+    recipe_hash TEXT NOT NULL,
+    query_norm TEXT NOT NULL,
+    query_vec BLOB,
+    response TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    last_hit REAL NOT NULL,
+    hits INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_llm_cache_recipe ON llm_cache(recipe_hash);
+CREATE INDEX IF NOT EXISTS idx_llm_cache_last_hit ON llm_cache(last_hit);
+"""
+
+
+def _sha256(*parts: str) -> str:
+    h = hashlib.sha256()
+    for part in parts:
+        h.update(part.encode("utf-8"))
+        h.update(b"\x1f")
+    return h.hexdigest()
+
+
+class LLMResponseCache:
+    """
+    Cache câu trả lời LLM trên SQLite.
+
+    Key chính xác = hash(structured block, query đã chuẩn hoá, language, bucket temperature, model).
+    Tra cứu ngữ nghĩa (tuỳ chọn): cùng recipe_hash (structured block + language + bucket + model
+    + embedding model), lấy câu trả lời của query đã cache có cosine embedding >= semantic_threshold.
+    Tổng kích thước vượt max_bytes thì xoá bản ghi lâu không được dùng nhất. Nhiều worker dùng
+    chung 1 file nên tổng kích thước luôn đọc từ SQLite, không đếm riêng trong process.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        max_bytes: int,
+        temp_bucket: float = 0.2,
+        semantic_threshold: Optional[float] = None,
+        semantic_candidates: int = 200,
+    ):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = int(max_bytes)
+        self.temp_bucket = float(temp_bucket) if temp_bucket > 0 else 0.0
+        self.semantic_threshold = semantic_threshold
+        self.semantic_candidates = int(semantic_candidates)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        self._counters = {"exactHits": 0, "semanticHits": 0, "misses": 0, "puts": 0, "evictions": 0}
+
+    @property
+    def semantic_enabled(self) -> bool:
+        return self.semantic_threshold is not None
+
+    def _bucket(self, temperature: float) -> str:
+        if not self.temp_bucket:
+            return f"{temperature:.3f}"
+        return str(int(round(temperature / self.temp_bucket)))
+
+    def keys(
+        self, structured: str, query_norm: str, language: str, temperature: float, model: str, embed_model: str = ""
+    ) -> Tuple[str, str]:
+        """
+        (key chính xác, recipe_hash dùng cho tra cứu ngữ nghĩa). recipe_hash gồm cả embedding model:
+        đổi model thì query_vec cũ khác chiều / khác không gian, không được so với probe mới.
+        """
+        base = _sha256(structured, language, self._bucket(temperature), model)
+        return _sha256(base, query_norm), _sha256(base, embed_model)
+
+    def _total_bytes(self) -> int:
+        return int(self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM llm_cache").fetchone()[0])
+
+    def _touch(self, key: str):
+        self._conn.execute("UPDATE llm_cache SET hits = hits + 1, last_hit = ? WHERE key = ?", (time.time(), key))
+
+    def get(self, key: str, recipe_hash: str, query_vec: Optional[np.ndarray] = None) -> Tuple[Optional[str], Optional[str]]:
+        """Trả về (response, "exact" | "semantic") hoặc (None, None)."""
+        with self._lock:
+            row = self._conn.execute("SELECT response FROM llm_cache WHERE key = ?", (key,)).fetchone()
+            if row is not None:
+                self._touch(key)
+                self._counters["exactHits"] += 1
+                return row[0], "exact"
+            if self.semantic_enabled and query_vec is not None:
+                rows = self._conn.execute(
+                    "SELECT key, query_vec, response FROM llm_cache "
+                    "WHERE recipe_hash = ? AND query_vec IS NOT NULL ORDER BY last_hit DESC LIMIT ?",
+                    (recipe_hash, self.semantic_candidates),
+                ).fetchall()
+                probe = np.asarray(query_vec, dtype=np.float32).reshape(-1)
+                # Bỏ vector khác chiều (bản ghi cũ, trước khi key có embedding model)
+                rows = [r for r in rows if len(r[1]) == probe.nbytes]
+                if rows:
+                    mat = np.stack([np.frombuffer(r[1], dtype=np.float32) for r in rows])
+                    sims = mat @ probe
+                    best = int(np.argmax(sims))
+                    if float(sims[best]) >= self.semantic_threshold:
+                        self._touch(rows[best][0])
+                        self._counters["semanticHits"] += 1
+                        return rows[best][2], "semantic"
+            self._counters["misses"] += 1
+            return None, None
+
+    def put(self, key: str, recipe_hash: str, query_norm: str, response: str, query_vec: Optional[np.ndarray] = None):
+        vec_blob = None
+        if query_vec is not None:
+            vec_blob = np.asarray(query_vec, dtype=np.float32).reshape(-1).tobytes()
+        size = len(response.encode("utf-8")) + len(query_norm.encode("utf-8")) + (len(vec_blob) if vec_blob else 0)
+        now = time.time()
+        with self._lock:
+            # Insert + kiểm tra tổng + evict trong 1 transaction ghi (BEGIN IMMEDIATE khoá ghi cả file
+            # giữa các process), nên giới hạn max_bytes đúng cho mọi worker cùng lúc
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO llm_cache "
+                    "(key, recipe_hash, query_norm, query_vec, response, size, created_at, last_hit, hits) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, 0)",
+                    (key, recipe_hash, query_norm, vec_blob, response, size, now, now),
+                )
+                total = self._total_bytes()
+                if total > self.max_bytes:
+                    self._evict(total)
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._counters["puts"] += 1
+
+    def _evict(self, total: int):
+        # Xoá theo last_hit tăng dần tới khi còn ~90% giới hạn để không phải evict sau mỗi lần put
+        target = int(self.max_bytes * 0.9)
+        while total > target:
+            rows = self._conn.execute("SELECT key, size FROM llm_cache ORDER BY last_hit ASC LIMIT 64").fetchall()
+            if not rows:
+                break
+            for key, size in rows:
+                if total <= target:
+                    break
+                self._conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+                total -= size
+                self._counters["evictions"] += 1
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM llm_cache")
+
+    def stats(self) -> Dict:
+        with self._lock:
+            entries, total = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM llm_cache").fetchone()
+            counters = dict(self._counters)
+        lookups = counters["exactHits"] + counters["semanticHits"] + counters["misses"]
+        hits = counters["exactHits"] + counters["semanticHits"]
+        return {
+            "entries": int(entries),
+            "bytes": int(total),
+            "maxBytes": self.max_bytes,
+            "semantic": self.semantic_enabled,
+            **counters,
+            "hitRate": round(hits / lookups, 4) if lookups else 0.0,
+        }
@@ -1,9 +1,13 @@
 from __future__ import annotations
 
-import re
+import threading
 from dataclasses import dataclass, field
 from typing import List, Optional
 
+from core.catalog import catalog
+from .gazetteer import Gazetteer
+from .index_loader import IndexMismatchError, MealIndexBundle, get_bundle
+
 
 DIET_KEYWORDS = {
     "healthy": ["healthy", "eat clean", "nhẹ nhàng"],
@@ -18,6 +22,19 @@ INTENT_KEYWORDS = {
     "add_to_cart": ["thêm giỏ", "đặt"],
 }
 
+SERVING_UNITS = ["người", "khẩu", "phần", "suất"]
+
+BUDGET_UNITS = {
+    "k": 1000,
+    "nghìn": 1000,
+    "ngàn": 1000,
+    "triệu": 1_000_000,
+    "tr": 1_000_000,
+    "vnd": 1,
+    "đ": 1,
+    "đồng": 1,
+}
+
 
 @dataclass
 class NLUResult:
@@ -27,47 +44,61 @@ class NLUResult:
     diet_tags: List[str] = field(default_factory=list)
     allergies: List[str] = field(default_factory=list)
     budget: Optional[float] = None
+    query: str = ""  # câu truy vấn gốc (lowercase), dùng cho chỉ mục từ vựng
+    ingredient_refs: List[str] = field(default_factory=list)  # reference_id catalog của nguyên liệu đã nhận ra
+
+
+_gazetteer: Optional[Gazetteer] = None
+_gazetteer_lock = threading.Lock()
+
+
+def _compile_gazetteer(key, bundle: Optional[MealIndexBundle]) -> Gazetteer:
+    snapshot = catalog.snapshot
+    ingredient_names = bundle.store.header.get("ingredient_names", []) if bundle is not None else []
+    gz = Gazetteer.compile(
+        products=[(item.get("name", ""), ref) for ref, item in snapshot.by_ref.items()],
+        ingredients=[(name, ref) for name, ref in ingredient_names],
+        diets=DIET_KEYWORDS,
+        intents=INTENT_KEYWORDS,
+        serving_units=SERVING_UNITS,
+        budget_units=BUDGET_UNITS,
+        key=key,
+    )
+    print(f"[meal-nlu] gazetteer compiled: {gz.stats()}")
+    return gz
+
+
+def get_gazetteer() -> Gazetteer:
+    """Biên dịch lại khi catalog hoặc index công thức đổi phiên bản."""
+    global _gazetteer
+    try:
+        bundle = get_bundle()
+    except (FileNotFoundError, IndexMismatchError):
+        bundle = None
+    key = (catalog.snapshot.version, bundle.version if bundle is not None else 0)
+    gz = _gazetteer
+    if gz is None or gz.key != key:
+        with _gazetteer_lock:
+            if _gazetteer is None or _gazetteer.key != key:
+                _gazetteer = _compile_gazetteer(key, bundle)
+            gz = _gazetteer
+    return gz
 
 
 def interpret(query: str, explicit_servings: Optional[int], explicit_budget: Optional[float], diet_tags: List[str], allergies: List[str]) -> NLUResult:
     q = query.lower()
-    intent = "suggest"
-    for label, kws in INTENT_KEYWORDS.items():
-        if any(kw in q for kw in kws):
-            intent = label
-            break
-
-    servings = explicit_servings
-    if servings is None:
-        match = re.search(r"(\d+)\s*(người|khẩu|phần)", q)
-        if match:
-            servings = int(match.group(1))
-
-    budget = explicit_budget
-    if budget is None:
-        match = re.search(r"(\d+[.,]?\d*)\s*(k|nghìn|ngan|triệu|vnd|đ)", q)
-        if match:
-            value = float(match.group(1).replace(",", "."))
-            unit = match.group(2)
-            if unit in {"k", "nghìn", "ngan"}:
-                budget = value * 1000
-            elif unit == "triệu":
-                budget = value * 1_000_000
-            else:
-                budget = value
+    found = get_gazetteer().scan(q)
 
     detected_diets = set(diet_tags)
-    for label, kws in DIET_KEYWORDS.items():
-        if any(kw in q for kw in kws):
-            detected_diets.add(label)
-
-    ingredients = re.findall(r"\b([a-zA-ZÀ-ỹ0-9-]+)\b", q)
+    detected_diets.update(found.diets)
 
     return NLUResult(
-        intent=intent,
-        ingredients=[w for w in ingredients if len(w) > 3],
-        servings=servings,
+        intent=found.intents[0] if found.intents else "suggest",
+        ingredients=found.ingredients,
+        servings=explicit_servings if explicit_servings is not None else found.servings,
         diet_tags=list(detected_diets),
         allergies=allergies,
-        budget=budget,
+        budget=explicit_budget if explicit_budget is not None else found.budget,
+        query=" ".join(q.split()),
+        ingredient_refs=found.reference_ids,
     )
@@ -0,0 +1,220 @@
+from __future__ import annotations
+
+import json
+import mmap
+import os
+import struct
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from .cache import LRUCache
+
+_MSGPACK_ERROR: Optional[str] = None
+try:
+    import msgpack
+except Exception as _e:
+    msgpack = None
+    _MSGPACK_ERROR = str(_e)
+
+MAGIC = b"MEALMETA"
+FORMAT_VERSION = 3  # 2: thêm postings BM25 (lex_*); 3: thêm ingredient_names cho gazetteer NLU
+_PREFIX = struct.Struct("<8sII")  # magic, version, độ dài header JSON
+_ALIGN = 64
+
+
+def _encode_record(recipe: Dict, codec: str) -> bytes:
+    if codec == "msgpack":
+        return msgpack.packb(recipe, use_bin_type=True)
+    return json.dumps(recipe, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def _decode_record(raw: bytes, codec: str) -> Dict:
+    if codec == "msgpack":
+        if msgpack is None:
+            raise RuntimeError(f"Metadata dùng msgpack nhưng chưa cài msgpack: {_MSGPACK_ERROR}")
+        return msgpack.unpackb(raw, raw=False)
+    return json.loads(raw)
+
+
+def _pack_blobs(items: List[bytes]) -> Tuple[np.ndarray, np.ndarray]:
+    offsets = np.zeros(len(items) + 1, dtype=np.uint64)
+    if items:
+        offsets[1:] = np.cumsum([len(b) for b in items])
+    return offsets, np.frombuffer(b"".join(items), dtype=np.uint8)
+
+
+class _BlobColumn:
+    """Dãy bản ghi bytes (offsets + data) đọc thẳng từ buffer, không copy."""
+
+    def __init__(self, offsets: np.ndarray, data: np.ndarray):
+        self._offsets = offsets
+        self._data = data
+
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+
+    def raw(self, row: int) -> bytes:
+        start, end = int(self._offsets[row]), int(self._offsets[row + 1])
+        return self._data[start:end].tobytes()
+
+    def __getitem__(self, row: int) -> str:
+        return self.raw(row).decode("utf-8")
+
+    def __iter__(self):
+        for row in range(len(self)):
+            yield self[row]
+
+
+class RecipeStore:
+    """
+    Metadata công thức dạng nhị phân, mmap được:
+
+        MAGIC | version | len(header) | header JSON | các section mảng NumPy (căn 64 byte)
+
+    - Mỗi công thức là 1 bản ghi msgpack (JSON nếu thiếu msgpack) trong `rec_data`, vị trí theo
+      `rec_offsets`; chỉ decode khi công thức lọt vào danh sách ứng viên (`recipe(row)`).
+    - Cột số (popularity, budget, ...), CSR nguyên liệu / diet, chuỗi allergen và postings BM25
+      được build sẵn nên RecipeColumns / RecipeFilterIndex / LexicalIndex dựng trực tiếp trên mmap,
+      không parse toàn bộ công thức.
+    Trang mmap nằm trong page cache dùng chung giữa các worker.
+    """
+
+    def __init__(self, header: Dict, arrays: Dict[str, np.ndarray], buffer=None, record_cache_size: int = 1024):
+        self.header = header
+        self.arrays = arrays
+        self.codec = header.get("codec", "json")
+        self._buffer = buffer  # giữ mmap sống cùng các mảng frombuffer
+        self._records = _BlobColumn(arrays["rec_offsets"], arrays["rec_data"])
+        self.allergen_texts = _BlobColumn(arrays["allergen_offsets"], arrays["allergen_data"])
+        self._cache = LRUCache(record_cache_size)
+
+    def __len__(self) -> int:
+        return int(self.header.get("count", 0))
+
+    @property
+    def meta(self) -> Dict:
+        return {k: v for k, v in self.header.items() if k not in ("sections", "vocab", "diets", "lexical_terms", "ingredient_names")}
+
+    def recipe(self, row: int) -> Dict:
+        recipe = self._cache.get(row)
+        if recipe is None:
+            recipe = _decode_record(self._records.raw(row), self.codec)
+            self._cache.put(row, recipe)
+        return recipe
+
+    def cache_stats(self) -> Dict:
+        return self._cache.stats()
+
+    # ---------- build ----------
+    @classmethod
+    def from_recipes(cls, recipes: List[Dict], extra: Optional[Dict] = None, record_cache_size: int = 1024) -> "RecipeStore":
+        from .columns import RecipeColumns
+        from .lexical import LexicalIndex
+
+        codec = "msgpack" if msgpack is not None else "json"
+        columns = RecipeColumns.from_recipes(recipes)
+        lexical = LexicalIndex.from_recipes(recipes)
+        rec_offsets, rec_data = _pack_blobs([_encode_record(r, codec) for r in recipes])
+        allergen_offsets, allergen_data = _pack_blobs(
+            [" ".join(r.get("allergens", [])).lower().encode("utf-8") for r in recipes]
+        )
+        ingredient_names: Dict[Tuple[str, Optional[str]], None] = {}
+        for recipe in recipes:
+            for ing in recipe.get("ingredients", []):
+                if ing.get("name"):
+                    ingredient_names[(ing["name"], ing.get("reference_id"))] = None
+        diets: Dict[str, int] = {}
+        diet_indptr = [0]
+        diet_indices: List[int] = []
+        for recipe in recipes:
+            for diet in recipe.get("diet", []):
+                diet_indices.append(diets.setdefault(diet, len(diets)))
+            diet_indptr.append(len(diet_indices))
+
+        arrays = {
+            "rec_offsets": rec_offsets,
+            "rec_data": rec_data,
+            "allergen_offsets": allergen_offsets,
+            "allergen_data": allergen_data,
+            "diet_indptr": np.asarray(diet_indptr, dtype=np.int64),
+            "diet_indices": np.asarray(diet_indices, dtype=np.int32),
+            **columns.arrays(),
+            **lexical.arrays(),
+        }
+        header = {
+            **(extra or {}),
+            "format_version": FORMAT_VERSION,
+            "count": len(recipes),
+            "codec": codec,
+            "vocab": list(columns.vocab),
+            "diets": list(diets),
+            "lexical_terms": lexical.terms,
+            "ingredient_names": [list(pair) for pair in ingredient_names],
+        }
+        return cls(header, arrays, record_cache_size=record_cache_size)
+
+    def write(self, path: str):
+        """Ghi file tạm rồi os.replace: worker đang mmap file cũ vẫn đọc inode cũ an toàn."""
+        sections = {}
+        offset = 0
+        for name, arr in self.arrays.items():
+            offset = -(-offset // _ALIGN) * _ALIGN
+            sections[name] = {"offset": offset, "dtype": arr.dtype.str, "shape": list(arr.shape)}
+            offset += arr.nbytes
+        header = {**self.header, "sections": sections}
+        header_bytes = json.dumps(header, ensure_ascii=False).encode("utf-8")
+        data_start = -(-(_PREFIX.size + len(header_bytes)) // _ALIGN) * _ALIGN
+
+        target = Path(path)
+        target.parent.mkdir(parents=True, exist_ok=True)
+        tmp = target.with_name(target.name + ".tmp")
+        with open(tmp, "wb") as f:
+            f.write(_PREFIX.pack(MAGIC, FORMAT_VERSION, len(header_bytes)))
+            f.write(header_bytes)
+            for name, arr in self.arrays.items():
+                f.seek(data_start + sections[name]["offset"])
+                f.write(np.ascontiguousarray(arr).tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, target)
+
+    # ---------- load ----------
+    @staticmethod
+    def read_header(path: str) -> Optional[Dict]:
+        """Chỉ đọc header (None nếu không phải file nhị phân của RecipeStore)."""
+        with open(path, "rb") as f:
+            prefix = f.read(_PREFIX.size)
+            if len(prefix) < _PREFIX.size:
+                return None
+            magic, _, header_len = _PREFIX.unpack(prefix)
+            if magic != MAGIC:
+                return None
+            return json.loads(f.read(header_len))
+
+    @classmethod
+    def open(cls, path: str, record_cache_size: int = 1024) -> "RecipeStore":
+        """mmap file nhị phân; file JSON cũ (meal_index_meta.json) được chuyển đổi trong bộ nhớ."""
+        with open(path, "rb") as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                f.seek(0)
+                payload = json.load(f)
+                extra = {k: v for k, v in payload.items() if k != "recipes"}
+                return cls.from_recipes(payload.get("recipes", []), extra, record_cache_size)
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, header_len = _PREFIX.unpack_from(buffer, 0)
+        if version > FORMAT_VERSION:
+            raise ValueError(f"Unsupported recipe metadata version {version} in {path}")
+        header = json.loads(bytes(buffer[_PREFIX.size:_PREFIX.size + header_len]))
+        data_start = -(-(_PREFIX.size + header_len) // _ALIGN) * _ALIGN
+        arrays = {}
+        for name, sec in header["sections"].items():
+            dtype = np.dtype(sec["dtype"])
+            count = int(np.prod(sec["shape"])) if sec["shape"] else 1
+            if count == 0:
+                arrays[name] = np.zeros(sec["shape"], dtype=dtype)
+                continue
+            arr = np.frombuffer(buffer, dtype=dtype, count=count, offset=data_start + sec["offset"])
+            arrays[name] = arr.reshape(sec["shape"])
+        return cls(header, arrays, buffer=buffer, record_cache_size=record_cache_size)
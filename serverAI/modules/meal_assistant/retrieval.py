@@ -1,50 +1,82 @@
 from __future__ import annotations
 
-from typing import Dict, List
+import threading
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
 
 from core.config import settings
-from .index_loader import load_metadata, search
+from .columns import RecipeView
+from .index_loader import MealIndexBundle
+from .lexical import LexicalHits
 from .nlu import NLUResult
 
+# Số request theo nhánh retrieval: lexical (bỏ qua embedding) / fused (BM25 + vector) / vector
+_route_counts: Dict[str, int] = {"lexical": 0, "fused": 0, "vector": 0}
+_route_lock = threading.Lock()
+
+
+def _count_route(route: str):
+    with _route_lock:
+        _route_counts[route] += 1
+
+
+def retrieval_stats() -> Dict[str, int]:
+    with _route_lock:
+        return dict(_route_counts)
+
+
+def _fuse(pairs: List[Tuple[int, float]], hits: LexicalHits) -> List[Tuple[int, float]]:
+    """
+    Trộn tuyến tính (1 - w) * cosine + w * điểm từ vựng. Công thức chỉ có ở nhánh BM25 dùng cosine
+    nhỏ nhất của top-k vector làm cận trên (nó nằm ngoài top-k nên cosine không lớn hơn).
+    """
+    weight = settings.MEAL_LEXICAL_WEIGHT
+    lexical = dict(zip(hits.rows.tolist(), hits.similarity().tolist()))
+    floor = min((score for _, score in pairs), default=0.0)
+    fused = {idx: (1.0 - weight) * score + weight * lexical.get(idx, 0.0) for idx, score in pairs}
+    for idx, lex in lexical.items():
+        if idx not in fused:
+            fused[idx] = (1.0 - weight) * floor + weight * lex
+    ranked = sorted(fused.items(), key=lambda item: item[1], reverse=True)
+    return ranked[: settings.MEAL_TOP_K]
+
+
+def _lexical_hits(bundle: MealIndexBundle, text: str, mask: Optional[np.ndarray]) -> Optional[LexicalHits]:
+    if bundle.lexical is None or not text:
+        return None
+    return bundle.lexical.search(text, settings.MEAL_TOP_K, mask)
+
 
-def _match_diet(recipe: Dict, diets: List[str]) -> bool:
-    if not diets:
-        return True
-    recipe_diets = set(recipe.get("diet", []))
-    return bool(recipe_diets.intersection(diets))
-
-
-def _contains_allergens(recipe: Dict, allergies: List[str]) -> bool:
-    if not allergies:
-        return False
-    recipe_allergens = " ".join(recipe.get("allergens", [])).lower()
-    return any(a.lower() in recipe_allergens for a in allergies)
-
-
-def _inventory_coverage(recipe: Dict, available_refs: List[str]) -> float:
-    if not recipe.get("ingredients"):
-        return 0.0
-    have = sum(1 for ing in recipe["ingredients"] if ing.get("reference_id") in available_refs)
-    return have / len(recipe["ingredients"])
-
-
-def retrieve_candidates(nlu: NLUResult, available_refs: List[str]) -> List[Dict]:
-    meta = load_metadata()
-    recipes = meta.get("recipes", [])
-    pairs = search(" ".join(nlu.ingredients) or nlu.intent, settings.MEAL_TOP_K)
-    results = []
-    for idx, score in pairs:
-        if idx < 0 or idx >= len(recipes):
-            continue
-        recipe = recipes[idx]
-        if score < settings.MEAL_MIN_SIMILARITY:
-            continue
-        if not _match_diet(recipe, nlu.diet_tags):
-            continue
-        if _contains_allergens(recipe, nlu.allergies):
-            continue
-        recipe_copy = dict(recipe)
-        recipe_copy["semantic_score"] = score
-        recipe_copy["inventory"] = _inventory_coverage(recipe, available_refs)
-        results.append(recipe_copy)
-    return results
+def retrieve_candidates(nlu: NLUResult, available_refs: List[str], bundle: MealIndexBundle) -> List[RecipeView]:
+    """bundle lấy 1 lần cho cả request: index, mask, cột và metadata luôn cùng 1 lần build."""
+    store = bundle.store
+    max_budget = None
+    if settings.MEAL_BUDGET_MAX_RATIO and nlu.budget:
+        max_budget = nlu.budget * settings.MEAL_BUDGET_MAX_RATIO
+    # Lọc diet / dị ứng / ngân sách ngay trong FAISS nên top-k luôn gồm công thức hợp lệ
+    mask = bundle.filters.build(nlu.diet_tags, nlu.allergies, max_budget)
+    # Nguyên liệu do gazetteer nhận ra; không nhận ra gì thì embed cả câu truy vấn
+    vector_query = " ".join(nlu.ingredients) or nlu.query or nlu.intent
+    hits = _lexical_hits(bundle, nlu.query or vector_query, mask)
+    if hits is not None and hits.confident(settings.MEAL_LEXICAL_FAST_COVERAGE, settings.MEAL_LEXICAL_FAST_MIN_HITS):
+        # Trùng tên món / đủ công thức chứa toàn bộ từ khoá: không cần forward pass của embedder
+        pairs = hits.pairs()
+        _count_route("lexical")
+    else:
+        pairs = bundle.search(vector_query, settings.MEAL_TOP_K, mask)
+        if hits is not None:
+            pairs = _fuse(pairs, hits)
+        _count_route("fused" if hits is not None else "vector")
+    pairs = [
+        (idx, score) for idx, score in pairs
+        if 0 <= idx < len(store) and score >= settings.MEAL_MIN_SIMILARITY
+    ]
+    if not pairs:
+        return []
+    rows = np.fromiter((idx for idx, _ in pairs), dtype=np.int64, count=len(pairs))
+    coverage = bundle.columns.coverage(rows, available_refs)
+    return [
+        RecipeView(idx, store.recipe(idx), score, float(inv))
+        for (idx, score), inv in zip(pairs, coverage.tolist())
+    ]
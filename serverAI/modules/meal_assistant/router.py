@@ -1,16 +1,41 @@
 from fastapi import APIRouter
+from fastapi.responses import StreamingResponse
 
+from core.inference import run_inference
 from .schemas import MealAssistantRequest, MealAssistantFeedback
-from .service import suggest, log_feedback
+from .service import suggest, log_feedback, cache_stats, reload_meal_index, prepare_suggestions, stream_suggestions
 
 router = APIRouter()
 
 
 @router.post("/meal-assistant/suggest")
-def meal_assistant_endpoint(body: MealAssistantRequest):
-    return suggest(body)
+async def meal_assistant_endpoint(body: MealAssistantRequest):
+    return await run_inference("meal", suggest, body)
+
+
+@router.post("/meal-assistant/suggest/stream")
+async def meal_assistant_stream_endpoint(body: MealAssistantRequest):
+    """Như /suggest nhưng trả text/event-stream: suggestions trước, sau đó token LLM, cuối cùng done."""
+    # Chạy retrieval trước khi mở stream để lỗi quá tải vẫn trả 503/504 bình thường
+    prepared = await run_inference("meal", prepare_suggestions, body)
+    return StreamingResponse(
+        stream_suggestions(prepared),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 
 @router.post("/meal-assistant/feedback")
 def meal_assistant_feedback(body: MealAssistantFeedback):
     return log_feedback(body)
+
+
+@router.get("/meal-assistant/stats")
+def meal_assistant_stats():
+    return cache_stats()
+
+
+@router.post("/meal-assistant/index/reload")
+def meal_assistant_reload_index():
+    """Gọi sau khi chạy tools/build_meal_index.py để bỏ index + cache cũ ngay (không chờ kiểm tra mtime)."""
+    return reload_meal_index()
@@ -23,6 +23,8 @@ class MealAssistantProduct(BaseModel):
     name: Optional[str] = None
     reason: Optional[str] = None
     quantity: Optional[str] = None
+    price: Optional[float] = None
+    inStock: Optional[bool] = None
 
 
 class MealAssistantSuggestion(BaseModel):
@@ -42,6 +44,7 @@ class MealAssistantResponse(BaseModel):
     prompt: str
     nlu: Dict[str, Optional[str]] = Field(default_factory=dict)
     retrievalDebug: Dict[str, List[Dict]] = Field(default_factory=dict)
+    llmCache: Optional[str] = Field(default=None, description="exact | semantic khi câu trả lời lấy từ cache")
     error: Optional[str] = None
 
 
@@ -1,34 +1,223 @@
 from __future__ import annotations
 
+import asyncio
 import json
-from pathlib import Path
+import threading
+import time
+from dataclasses import dataclass
+from typing import AsyncIterator, Optional
 
+from core.catalog import catalog
 from core.config import settings
 from .schemas import MealAssistantRequest, MealAssistantResponse, MealAssistantFeedback, MealAssistantSuggestion, MealAssistantProduct
-from .nlu import interpret
-from .retrieval import retrieve_candidates
+from .nlu import get_gazetteer, interpret
+from .retrieval import retrieval_stats, retrieve_candidates
 from .rerank import rerank
-from .generator import call_gemini, build_structured_block
+from .generator import build_structured_block, call_llm, stream_llm
+from .nlu import NLUResult
+from .cache import LRUCache, SingleFlight
+from .index_loader import (
+    IndexMismatchError,
+    add_popularity_listener,
+    add_reload_listener,
+    embed_query,
+    get_bundle,
+    index_version,
+    normalize_query,
+    query_cache_stats,
+    record_cache_stats,
+    reload_index,
+)
+from .llm_cache import LLMResponseCache
+from .feedback_log import FeedbackLogWriter
 
+# Cache kết quả retrieval + rerank: (candidates, ranked) theo NLU đã chuẩn hoá + sản phẩm đang có
+_result_cache = LRUCache(settings.MEAL_RESULT_CACHE_SIZE, settings.MEAL_RESULT_CACHE_TTL_S)
+_result_flight = SingleFlight()
+add_reload_listener(lambda _version: _result_cache.clear())
+add_popularity_listener(_result_cache.clear)
 
-def _build_products(recipe: dict) -> list[MealAssistantProduct]:
+_llm_cache: Optional[LLMResponseCache] = None
+_llm_cache_lock = threading.Lock()
+_feedback_writer: Optional[FeedbackLogWriter] = None
+_feedback_lock = threading.Lock()
+
+
+def _result_key(generation: int, nlu: NLUResult, available_products: list[str]) -> tuple:
+    # servings không ảnh hưởng retrieval/rerank nên không đưa vào key
+    return (
+        generation,
+        nlu.intent,
+        nlu.query,
+        tuple(nlu.ingredients),
+        tuple(sorted(set(nlu.diet_tags))),
+        tuple(sorted({a.strip().lower() for a in nlu.allergies})),
+        nlu.budget,
+        tuple(sorted(set(available_products))),
+    )
+
+
+def _retrieve_ranked(nlu: NLUResult, available_products: list[str]) -> tuple[list[dict], list[dict]]:
+    """Kết quả dùng chung giữa các request: chỉ đọc, không sửa các dict trả về."""
+    bundle = get_bundle()
+    key = _result_key(bundle.generation, nlu, available_products)
+    cached = _result_cache.get(key)
+    if cached is not None:
+        return cached
+
+    def _compute():
+        candidates = retrieve_candidates(nlu, available_products, bundle)
+        ranked = rerank(candidates, nlu.budget, bundle.columns)
+        result = (candidates, ranked)
+        _result_cache.put(key, result)
+        return result
+
+    return _result_flight.do(key, _compute)
+
+
+def _get_llm_cache() -> Optional[LLMResponseCache]:
+    global _llm_cache
+    if not settings.MEAL_LLM_CACHE_ENABLED:
+        return None
+    if _llm_cache is None:
+        with _llm_cache_lock:
+            if _llm_cache is None:
+                _llm_cache = LLMResponseCache(
+                    settings.MEAL_LLM_CACHE_PATH,
+                    max_bytes=int(settings.MEAL_LLM_CACHE_MAX_MB * 1024 * 1024),
+                    temp_bucket=settings.MEAL_LLM_CACHE_TEMP_BUCKET,
+                    semantic_threshold=settings.MEAL_LLM_CACHE_SEMANTIC_THRESHOLD if settings.MEAL_LLM_CACHE_SEMANTIC else None,
+                    semantic_candidates=settings.MEAL_LLM_CACHE_SEMANTIC_CANDIDATES,
+                )
+    return _llm_cache
+
+
+def _llm_model_tag() -> Optional[str]:
+    """Định danh model sinh câu trả lời; None khi chỉ có câu trả lời giữ chỗ (chưa cấu hình key) -> không cache."""
+    provider = settings.MEAL_LLM_PROVIDER.lower()
+    if provider == "fake":
+        return "fake"
+    if not settings.GEMINI_API_KEY:
+        return None
+    return f"{provider}:{settings.GEMINI_MODEL}"
+
+
+def _llm_cache_entry(prepared: "PreparedSuggestion") -> Optional[dict]:
+    cache = _get_llm_cache()
+    model = _llm_model_tag()
+    if cache is None or model is None:
+        return None
+    query_norm = normalize_query(prepared.body.query)
+    key, recipe_hash = cache.keys(
+        build_structured_block(prepared.ranked),
+        query_norm,
+        prepared.language,
+        prepared.temperature,
+        model,
+        settings.MEAL_EMBEDDING_MODEL,
+    )
+    query_vec = embed_query(prepared.body.query)[0] if cache.semantic_enabled else None
+    return {"key": key, "recipe_hash": recipe_hash, "query_norm": query_norm, "query_vec": query_vec}
+
+
+def _llm_cache_get(entry: Optional[dict]) -> tuple[Optional[str], Optional[str]]:
+    if entry is None:
+        return None, None
+    return _get_llm_cache().get(entry["key"], entry["recipe_hash"], entry["query_vec"])
+
+
+def _llm_cache_put(entry: Optional[dict], response: str):
+    if entry is None or not response:
+        return
+    _get_llm_cache().put(entry["key"], entry["recipe_hash"], entry["query_norm"], response, entry["query_vec"])
+
+
+def cache_stats() -> dict:
+    llm_cache = _get_llm_cache()
+    return {
+        "indexVersion": index_version(),
+        "queryEmbedding": query_cache_stats(),
+        "recipeRecords": record_cache_stats(),
+        "retrievalRoutes": retrieval_stats(),
+        "gazetteer": get_gazetteer().stats(),
+        "feedback": _feedback_writer.stats() if _feedback_writer is not None else None,
+        "results": _result_cache.stats(),
+        "singleFlight": _result_flight.stats(),
+        "llm": llm_cache.stats() if llm_cache is not None else {"enabled": False},
+    }
+
+
+def meal_bootstrap():
+    """Biên dịch gazetteer NLU lúc khởi động (cần catalog đã nạp)."""
+    get_gazetteer()
+
+
+def reload_meal_index() -> dict:
+    try:
+        return {"success": True, "indexVersion": reload_index()}
+    except (FileNotFoundError, IndexMismatchError) as exc:
+        # Giữ index đang phục vụ
+        return {"success": False, "message": str(exc), "indexVersion": index_version()}
+
+
+def _build_products(recipe: dict, snapshot) -> list[MealAssistantProduct]:
     products = []
     for ing in recipe.get("ingredients", []):
+        item = snapshot.get(ing.get("reference_id") or "")
         products.append(
             MealAssistantProduct(
                 referenceId=ing.get("reference_id"),
-                name=ing.get("name"),
+                name=(item or {}).get("name") or ing.get("name"),
                 reason="Nguyên liệu bắt buộc",
                 quantity=ing.get("quantity"),
+                price=item.get("price") if item else None,
+                inStock=(item.get("stock", 0) or 0) > 0 if item else None,
             )
         )
     return products
 
 
-def suggest(body: MealAssistantRequest) -> MealAssistantResponse:
+@dataclass
+class PreparedSuggestion:
+    body: MealAssistantRequest
+    nlu: NLUResult
+    candidates: list[dict]
+    ranked: list[dict]
+    suggestions: list[MealAssistantSuggestion]
+
+    @property
+    def language(self) -> str:
+        return self.body.language or settings.MEAL_PROMPT_LANGUAGE
+
+    @property
+    def temperature(self) -> float:
+        return self.body.temperature if self.body.temperature is not None else settings.MEAL_TEMPERATURE
+
+    def nlu_payload(self) -> dict:
+        nlu = self.nlu
+        return {
+            "intent": nlu.intent,
+            "ingredients": ", ".join(nlu.ingredients) if nlu.ingredients else None,
+            "ingredient_refs": ", ".join(nlu.ingredient_refs) if nlu.ingredient_refs else None,
+            "servings": str(nlu.servings) if nlu.servings else None,
+            "diet_tags": ", ".join(nlu.diet_tags) if nlu.diet_tags else None,
+            "budget": str(nlu.budget) if nlu.budget else None,
+        }
+
+    def retrieval_debug(self) -> dict:
+        return {
+            "candidates": [
+                {"id": item.get("id"), "score": item.get("semantic_score"), "inventory": item.get("inventory")}
+                for item in self.candidates
+            ]
+        }
+
+
+def prepare_suggestions(body: MealAssistantRequest) -> PreparedSuggestion:
+    """NLU + retrieval + rerank + ghép sản phẩm catalog (phần chạy trong pool "meal")."""
     nlu = interpret(body.query, body.servings, body.budget, body.diet_tags, body.allergies)
-    candidates = retrieve_candidates(nlu, body.available_products)
-    ranked = rerank(candidates, nlu.budget)
+    candidates, ranked = _retrieve_ranked(nlu, body.available_products)
+    snapshot = catalog.snapshot
     suggestions = [
         MealAssistantSuggestion(
             dishId=item.get("id"),
@@ -36,43 +225,147 @@ def suggest(body: MealAssistantRequest) -> MealAssistantResponse:
             description=item.get("description"),
             prepTime=item.get("prep_time"),
             estimatedBudget=item.get("budget"),
-            products=_build_products(item),
+            products=_build_products(item, snapshot),
             score=item.get("score", 0.0),
         )
         for item in ranked
     ]
-    language = body.language or settings.MEAL_PROMPT_LANGUAGE
-    temperature = body.temperature if body.temperature is not None else settings.MEAL_TEMPERATURE
+    return PreparedSuggestion(body, nlu, candidates, ranked, suggestions)
+
+
+def suggest(body: MealAssistantRequest) -> MealAssistantResponse:
+    prepared = prepare_suggestions(body)
+    ranked = prepared.ranked
     llm_response = None
     llm_error = None
+    llm_cache = None
     if ranked:
-        try:
-            llm_response = call_gemini(ranked, body.query, language, temperature)
-        except Exception as exc:
-            llm_error = str(exc)
+        entry = _llm_cache_entry(prepared)
+        llm_response, llm_cache = _llm_cache_get(entry)
+        if llm_response is None:
+            try:
+                llm_response = call_llm(ranked, body.query, prepared.language, prepared.temperature)
+                _llm_cache_put(entry, llm_response)
+            except Exception as exc:
+                llm_error = str(exc)
 
     return MealAssistantResponse(
-        suggestions=suggestions,
+        suggestions=prepared.suggestions,
         llmResponse=llm_response or build_structured_block(ranked),
         prompt="Structured meal summary" if llm_response else build_structured_block(ranked),
-        nlu={
-            "intent": nlu.intent,
-            "servings": str(nlu.servings) if nlu.servings else None,
-            "diet_tags": ", ".join(nlu.diet_tags) if nlu.diet_tags else None,
-            "budget": str(nlu.budget) if nlu.budget else None,
-        },
-        retrievalDebug={
-            "candidates": [
-                {"id": item.get("id"), "score": item.get("semantic_score"), "inventory": item.get("inventory")}
-                for item in candidates
-            ]
-        },
+        nlu=prepared.nlu_payload(),
+        retrievalDebug=prepared.retrieval_debug(),
+        llmCache=llm_cache,
         error=llm_error,
     )
 
 
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+async def stream_suggestions(prepared: PreparedSuggestion) -> AsyncIterator[str]:
+    """
+    Server-sent events:
+      suggestions -> danh sách món (gửi ngay), token* -> từng đoạn text của LLM,
+      done -> kết thúc (error nếu có, số token, thời gian, fallback structured khi LLM lỗi).
+    """
+    started = time.perf_counter()
+    ranked = prepared.ranked
+    yield _sse("suggestions", {
+        "suggestions": [s.dict() for s in prepared.suggestions],
+        "nlu": prepared.nlu_payload(),
+        "retrievalDebug": prepared.retrieval_debug(),
+    })
+
+    if not ranked:
+        yield _sse("done", {"error": None, "tokens": 0, "llmResponse": build_structured_block(ranked)})
+        return
+
+    loop = asyncio.get_running_loop()
+    # Tra cache (SQLite + embedding nếu bật semantic) là việc blocking
+    entry = await loop.run_in_executor(None, _llm_cache_entry, prepared)
+    cached, cache_kind = await loop.run_in_executor(None, _llm_cache_get, entry)
+    if cached is not None:
+        yield _sse("token", {"text": cached})
+        yield _sse("done", {
+            "error": None,
+            "tokens": 1,
+            "provider": settings.MEAL_LLM_PROVIDER,
+            "llmCache": cache_kind,
+            "elapsedMs": round((time.perf_counter() - started) * 1000.0, 1),
+            "llmResponse": None,
+        })
+        return
+
+    queue: asyncio.Queue = asyncio.Queue()
+    stop = threading.Event()
+
+    def _pump():
+        # Gemini SDK stream là iterator blocking: đọc trong thread riêng, đẩy về event loop
+        try:
+            for chunk in stream_llm(ranked, prepared.body.query, prepared.language, prepared.temperature):
+                if stop.is_set():
+                    break
+                loop.call_soon_threadsafe(queue.put_nowait, ("token", chunk))
+        except Exception as exc:
+            loop.call_soon_threadsafe(queue.put_nowait, ("error", str(exc)))
+        finally:
+            loop.call_soon_threadsafe(queue.put_nowait, ("end", None))
+
+    threading.Thread(target=_pump, name="meal-llm-stream", daemon=True).start()
+    parts: list[str] = []
+    error = None
+    first_token_ms = None
+    completed = False
+    try:
+        while True:
+            kind, value = await queue.get()
+            if kind == "token":
+                parts.append(value)
+                if first_token_ms is None:
+                    first_token_ms = round((time.perf_counter() - started) * 1000.0, 1)
+                yield _sse("token", {"text": value})
+            elif kind == "error":
+                error = value
+            else:
+                completed = True
+                break
+    finally:
+        # Client ngắt kết nối: báo thread dừng đọc stream
+        stop.set()
+
+    if completed and error is None:
+        await loop.run_in_executor(None, _llm_cache_put, entry, "".join(parts).strip())
+
+    yield _sse("done", {
+        "error": error,
+        "tokens": len(parts),
+        "provider": settings.MEAL_LLM_PROVIDER,
+        "llmCache": None,
+        "firstTokenMs": first_token_ms,
+        "elapsedMs": round((time.perf_counter() - started) * 1000.0, 1),
+        "llmResponse": build_structured_block(ranked) if error and not parts else None,
+    })
+
+
+def _get_feedback_writer() -> FeedbackLogWriter:
+    global _feedback_writer
+    if _feedback_writer is None:
+        with _feedback_lock:
+            if _feedback_writer is None:
+                _feedback_writer = FeedbackLogWriter(
+                    settings.MEAL_FEEDBACK_PATH,
+                    flush_interval_s=settings.MEAL_FEEDBACK_FLUSH_INTERVAL_S,
+                    batch_size=settings.MEAL_FEEDBACK_BATCH_SIZE,
+                    queue_size=settings.MEAL_FEEDBACK_QUEUE_SIZE,
+                    rotate_bytes=int(settings.MEAL_FEEDBACK_ROTATE_MB * 1024 * 1024),
+                    rotate_interval_s=settings.MEAL_FEEDBACK_ROTATE_INTERVAL_S,
+                )
+    return _feedback_writer
+
+
 def log_feedback(feedback: MealAssistantFeedback) -> dict:
-    path = Path(settings.MEAL_FEEDBACK_PATH)
-    path.parent.mkdir(parents=True, exist_ok=True)
-    path.open("a", encoding="utf-8").write(json.dumps(feedback.dict(), ensure_ascii=False) + "\n")
-    return {"success": True}
+    """Đưa vào hàng đợi của writer nền; không ghi đĩa trong request."""
+    accepted = _get_feedback_writer().append({"ts": time.time(), **feedback.dict()})
+    return {"success": accepted}
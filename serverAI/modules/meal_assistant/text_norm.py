@@ -0,0 +1,45 @@
+from __future__ import annotations
+
+import re
+import unicodedata
+from typing import List
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+# Từ đệm thường gặp trong câu hỏi gợi ý món (dạng có dấu), không mang nghĩa khi so khớp từ vựng.
+# Giữ dấu vì nhiều từ đệm trùng dạng bỏ dấu với nguyên liệu: tôi/tỏi, để/dê, món/môn, vài/vai.
+STOPWORDS = frozenset(
+    "gợi ý món ăn nấu làm cho tôi mình em anh chị với và hoặc có gì nào hôm nay tối trưa sáng "
+    "muốn cần tìm kiếm một vài các những để được không nhé nha à ạ ơi đi thế "
+    # đơn vị khẩu phần / tiền đi kèm số
+    "người khẩu phần suất k nghìn ngàn triệu vnd đ đồng".split()
+)
+
+
+def normalize(text: str) -> str:
+    """lowercase + NFC: gộp các cách gõ dấu tổ hợp / dựng sẵn về cùng một dạng."""
+    return unicodedata.normalize("NFC", text.lower())
+
+
+def fold(text: str) -> str:
+    """Bỏ dấu tiếng Việt ("Phở bò" -> "pho bo"), đ -> d."""
+    decomposed = unicodedata.normalize("NFD", text.lower())
+    stripped = "".join(ch for ch in decomposed if unicodedata.category(ch) != "Mn")
+    return stripped.replace("đ", "d")
+
+
+def tokenize(text: str) -> List[str]:
+    return _TOKEN_RE.findall(normalize(text))
+
+
+def has_diacritics(text: str) -> bool:
+    return fold(text) != normalize(text)
+
+
+# Dạng bỏ dấu: chỉ dùng khi cả câu truy vấn gõ không dấu (không phân biệt được "toi" là tôi hay tỏi)
+FOLDED_STOPWORDS = frozenset(fold(w) for w in STOPWORDS)
+
+
+def is_stopword(token: str, folded_query: bool) -> bool:
+    """token đã qua tokenize(); folded_query: cả câu truy vấn không có dấu."""
+    return fold(token) in FOLDED_STOPWORDS if folded_query else token in STOPWORDS
@@ -0,0 +1,139 @@
+#serverAI/modules/product_recognition/batcher.py
+from typing import Any, Callable, Dict, List, Optional
+from collections import Counter, deque
+from concurrent.futures import Future
+import queue
+import threading
+import time
+
+
+class _Pending:
+    __slots__ = ("item", "enqueued_at", "future")
+
+    def __init__(self, item: Any):
+        self.item = item
+        self.enqueued_at = time.perf_counter()
+        self.future: Future = Future()
+
+
+class MicroBatcher:
+    """
+    Gom các request đồng thời thành 1 batch trong cửa sổ `max_wait_ms`
+    (hoặc tới khi đủ `max_batch_size`), chạy `batch_fn` một lần rồi trả
+    kết quả riêng cho từng request.
+
+    `batch_fn(items) -> results` phải trả về list cùng độ dài, cùng thứ tự với `items`.
+    """
+
+    def __init__(
+        self,
+        batch_fn: Callable[[List[Any]], List[Any]],
+        max_batch_size: int = 16,
+        max_wait_ms: float = 8.0,
+        name: str = "batcher",
+        wait_window: int = 2048,
+    ):
+        self._batch_fn = batch_fn
+        self._max_batch_size = max(1, int(max_batch_size))
+        self._max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+        self._name = name
+        self._queue: "queue.Queue[_Pending]" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+
+        self._stats_lock = threading.Lock()
+        self._histogram: Counter = Counter()
+        self._waits_ms: deque = deque(maxlen=wait_window)
+        self._total_requests = 0
+        self._total_batches = 0
+        self._max_wait_seen_ms = 0.0
+
+    def submit(self, item: Any, timeout: Optional[float] = None) -> Any:
+        """Đưa 1 item vào hàng đợi và chờ kết quả (blocking)."""
+        self._ensure_started()
+        pending = _Pending(item)
+        self._queue.put(pending)
+        return pending.future.result(timeout)
+
+    def _ensure_started(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._run, name=self._name, daemon=True)
+            self._thread.start()
+
+    def _collect(self) -> List[_Pending]:
+        first = self._queue.get()
+        batch = [first]
+        deadline = first.enqueued_at + self._max_wait
+        while len(batch) < self._max_batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                if remaining > 0:
+                    batch.append(self._queue.get(timeout=remaining))
+                else:
+                    # Hết cửa sổ chờ: chỉ gom thêm những request đã sẵn trong hàng đợi
+                    batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            started = time.perf_counter()
+            self._record(batch, started)
+            try:
+                results = self._batch_fn([p.item for p in batch])
+                if len(results) != len(batch):
+                    raise RuntimeError(
+                        f"batch_fn returned {len(results)} results for {len(batch)} items"
+                    )
+            except Exception as exc:
+                print(f"[{self._name}] batch failed:", exc)
+                for p in batch:
+                    p.future.set_exception(exc)
+                continue
+            for p, res in zip(batch, results):
+                p.future.set_result(res)
+
+    def _record(self, batch: List[_Pending], started: float):
+        waits = [(started - p.enqueued_at) * 1000.0 for p in batch]
+        with self._stats_lock:
+            self._histogram[len(batch)] += 1
+            self._total_batches += 1
+            self._total_requests += len(batch)
+            self._waits_ms.extend(waits)
+            self._max_wait_seen_ms = max(self._max_wait_seen_ms, max(waits))
+
+    def stats(self) -> Dict:
+        with self._stats_lock:
+            waits = sorted(self._waits_ms)
+            histogram = {str(k): v for k, v in sorted(self._histogram.items())}
+            total_batches = self._total_batches
+            total_requests = self._total_requests
+            max_wait = self._max_wait_seen_ms
+
+        def _pct(q: float) -> float:
+            if not waits:
+                return 0.0
+            return round(waits[min(len(waits) - 1, int(q * len(waits)))], 3)
+
+        return {
+            "maxBatchSize": self._max_batch_size,
+            "maxWaitMs": self._max_wait * 1000.0,
+            "batches": total_batches,
+            "requests": total_requests,
+            "avgBatchSize": round(total_requests / total_batches, 3) if total_batches else 0.0,
+            "batchSizeHistogram": histogram,
+            "queueWaitMs": {
+                "avg": round(sum(waits) / len(waits), 3) if waits else 0.0,
+                "p50": _pct(0.50),
+                "p95": _pct(0.95),
+                "p99": _pct(0.99),
+                "max": round(max_wait, 3),
+            },
+            "queueDepth": self._queue.qsize(),
+        }
@@ -0,0 +1,83 @@
+#serverAI/modules/product_recognition/cache.py
+from typing import Any, Dict, Optional
+from collections import OrderedDict
+import threading
+import time
+
+import cv2
+import numpy as np
+
+
+def dhash(image_bgr: np.ndarray, hash_size: int = 8) -> int:
+    """Difference hash 64-bit: thu nhỏ về (hash_size+1) x hash_size rồi so sánh điểm ảnh kề nhau."""
+    small = cv2.resize(image_bgr, (hash_size + 1, hash_size), interpolation=cv2.INTER_AREA)
+    if small.ndim == 3:
+        small = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+    bits = (small[:, 1:] > small[:, :-1]).flatten()
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+class PerceptualCache:
+    """
+    Cache LRU + TTL cho kết quả nhận diện, tra theo khoảng cách Hamming giữa các dHash.
+    Số entry nhỏ (vài trăm) nên quét tuyến tính vẫn rẻ hơn nhiều so với 1 lần inference.
+    """
+
+    def __init__(self, max_size: int = 256, ttl_s: float = 2.0, max_distance: int = 6):
+        self._max_size = max(1, int(max_size))
+        self._ttl = float(ttl_s)
+        self._max_distance = int(max_distance)
+        self._entries: "OrderedDict[int, tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._invalidations = 0
+
+    def get(self, key: int) -> Optional[Any]:
+        now = time.monotonic()
+        with self._lock:
+            best_key, best_dist = None, self._max_distance + 1
+            expired = []
+            for k, (stored_at, _) in self._entries.items():
+                if now - stored_at > self._ttl:
+                    expired.append(k)
+                    continue
+                dist = bin(k ^ key).count("1")
+                if dist < best_dist:
+                    best_key, best_dist = k, dist
+                    if dist == 0:
+                        break
+            for k in expired:
+                self._entries.pop(k, None)
+            if best_key is None:
+                self._misses += 1
+                return None
+            self._entries.move_to_end(best_key)
+            self._hits += 1
+            return self._entries[best_key][1]
+
+    def put(self, key: int, value: Any):
+        with self._lock:
+            self._entries[key] = (time.monotonic(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._invalidations += 1
+
+    def stats(self) -> Dict:
+        with self._lock:
+            total = self._hits + self._misses
+            return {
+                "size": len(self._entries),
+                "maxSize": self._max_size,
+                "ttlSeconds": self._ttl,
+                "maxHammingDistance": self._max_distance,
+                "hits": self._hits,
+                "misses": self._misses,
+                "hitRate": round(self._hits / total, 4) if total else 0.0,
+                "invalidations": self._invalidations,
+            }
@@ -0,0 +1,201 @@
+#serverAI/modules/product_recognition/embedding_index.py
+"""
+Nhận diện sản phẩm bằng k-NN trên embedding ảnh tham chiếu của catalog.
+
+- ProductEmbedder: open_clip image encoder -> vector L2-normalized (float32).
+- ProductEmbeddingIndex: FAISS IndexIDMap2(IndexFlatIP) + meta JSON (id -> reference_id),
+  thêm/xoá vector của từng SKU mà không cần build lại toàn bộ.
+"""
+from typing import Dict, List, Optional, Sequence, Tuple
+from pathlib import Path
+import json
+import os
+import threading
+
+import cv2
+import numpy as np
+
+from .preprocess import BatchPreprocessor
+
+_TORCH_ERROR: Optional[str] = None
+try:
+    import torch
+    import open_clip
+except Exception as _e:
+    torch = None
+    open_clip = None
+    _TORCH_ERROR = str(_e)
+
+_FAISS_ERROR: Optional[str] = None
+try:
+    import faiss
+except Exception as _e:
+    faiss = None
+    _FAISS_ERROR = str(_e)
+
+CLIP_MEAN = (0.48145466, 0.4578275, 0.40821073)
+CLIP_STD = (0.26862954, 0.26130258, 0.27577711)
+
+
+class ProductEmbedder:
+    def __init__(self, model_name: str, pretrained: str, batch_size: int = 32, preprocess_backend: str = "pil"):
+        if torch is None or open_clip is None:
+            raise RuntimeError(f"open_clip unavailable: {_TORCH_ERROR}")
+        model, _, _ = open_clip.create_model_and_transforms(model_name, pretrained=pretrained, device="cpu")
+        model.eval()
+        self.model = model
+        self.batch_size = max(1, int(batch_size))
+        size = model.visual.image_size
+        size = int(size[0] if isinstance(size, (tuple, list)) else size)
+        # open_clip: Resize(cạnh ngắn = size, bicubic) + CenterCrop(size)
+        self.preprocess = BatchPreprocessor(
+            resize=size, crop=size, mean=CLIP_MEAN, std=CLIP_STD, backend=preprocess_backend
+        )
+
+    def embed(self, images: Sequence[np.ndarray]) -> np.ndarray:
+        chunks = []
+        for start in range(0, len(images), self.batch_size):
+            batch = list(images[start:start + self.batch_size])
+            x = torch.from_numpy(self.preprocess(batch))
+            with torch.no_grad():
+                feats = self.model.encode_image(x)
+                feats = torch.nn.functional.normalize(feats, dim=-1)
+            chunks.append(feats.cpu().numpy().astype(np.float32))
+        if not chunks:
+            return np.zeros((0, 0), dtype=np.float32)
+        return np.concatenate(chunks, axis=0)
+
+
+def load_reference_images(paths: Sequence[str], root: str) -> List[np.ndarray]:
+    images = []
+    for rel in paths:
+        p = Path(rel)
+        if not p.is_absolute():
+            p = Path(root) / rel
+        img = cv2.imread(str(p), cv2.IMREAD_COLOR)
+        if img is None:
+            print("[product-index] cannot read:", p)
+            continue
+        images.append(img)
+    return images
+
+
+class ProductEmbeddingIndex:
+    def __init__(self, index_path: str, meta_path: str):
+        if faiss is None:
+            raise RuntimeError(f"faiss unavailable: {_FAISS_ERROR}")
+        self.index_path = Path(index_path)
+        self.meta_path = Path(meta_path)
+        self._lock = threading.RLock()
+        self._index = None
+        self._ref_by_id: Dict[int, str] = {}
+        self._next_id = 0
+        self.dim: Optional[int] = None
+        self.embedding_model: Optional[str] = None
+
+    # ---------- persistence ----------
+    def load(self) -> "ProductEmbeddingIndex":
+        if not self.index_path.exists() or not self.meta_path.exists():
+            raise FileNotFoundError(
+                f"Product index not found: {self.index_path}. Hãy chạy tools/build_product_index.py"
+            )
+        index = faiss.read_index(str(self.index_path))
+        meta = json.loads(self.meta_path.read_text(encoding="utf-8"))
+        with self._lock:
+            self._index = index
+            self._ref_by_id = {int(k): v for k, v in meta.get("ids", {}).items()}
+            self._next_id = int(meta.get("next_id", max(self._ref_by_id, default=-1) + 1))
+            self.dim = index.d
+            self.embedding_model = meta.get("embedding_model")
+        return self
+
+    def save(self):
+        with self._lock:
+            if self._index is None:
+                return
+            self.index_path.parent.mkdir(parents=True, exist_ok=True)
+            self.meta_path.parent.mkdir(parents=True, exist_ok=True)
+            # Ghi file tạm rồi os.replace: load() không bao giờ đọc file ghi dở.
+            # Meta (id -> reference_id) ghi sau cùng, nên không bao giờ trỏ tới id mà index chưa có
+            index_tmp = self.index_path.with_suffix(self.index_path.suffix + ".tmp")
+            faiss.write_index(self._index, str(index_tmp))
+            os.replace(index_tmp, self.index_path)
+            meta = {
+                "embedding_model": self.embedding_model,
+                "next_id": self._next_id,
+                "ids": {str(k): v for k, v in self._ref_by_id.items()},
+            }
+            meta_tmp = self.meta_path.with_suffix(self.meta_path.suffix + ".tmp")
+            meta_tmp.write_text(json.dumps(meta, ensure_ascii=False), encoding="utf-8")
+            os.replace(meta_tmp, self.meta_path)
+
+    def reset(self, dim: int, embedding_model: Optional[str] = None):
+        with self._lock:
+            self._index = faiss.IndexIDMap2(faiss.IndexFlatIP(dim))
+            self._ref_by_id = {}
+            self._next_id = 0
+            self.dim = dim
+            self.embedding_model = embedding_model
+
+    # ---------- incremental updates ----------
+    def add(self, reference_id: str, vectors: np.ndarray) -> int:
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        if vectors.ndim != 2 or len(vectors) == 0:
+            return 0
+        with self._lock:
+            if self._index is None:
+                self.reset(vectors.shape[1], self.embedding_model)
+            ids = np.arange(self._next_id, self._next_id + len(vectors), dtype=np.int64)
+            self._index.add_with_ids(vectors, ids)
+            for i in ids.tolist():
+                self._ref_by_id[i] = reference_id
+            self._next_id += len(vectors)
+        return len(vectors)
+
+    def remove(self, reference_id: str) -> int:
+        with self._lock:
+            ids = [i for i, ref in self._ref_by_id.items() if ref == reference_id]
+            if not ids or self._index is None:
+                return 0
+            self._index.remove_ids(faiss.IDSelectorBatch(np.asarray(ids, dtype=np.int64)))
+            for i in ids:
+                del self._ref_by_id[i]
+        return len(ids)
+
+    def replace(self, reference_id: str, vectors: np.ndarray) -> int:
+        with self._lock:
+            self.remove(reference_id)
+            return self.add(reference_id, vectors)
+
+    # ---------- query ----------
+    def search(self, vectors: np.ndarray, top_k: int) -> List[List[Tuple[str, float]]]:
+        """
+        k-NN rồi gộp theo reference_id (lấy similarity cao nhất của mỗi SKU).
+        Trả về cho mỗi query: list (reference_id, score) giảm dần.
+        """
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        with self._lock:
+            if self._index is None or self._index.ntotal == 0:
+                return [[] for _ in range(len(vectors))]
+            sims, ids = self._index.search(vectors, top_k)
+            refs = self._ref_by_id
+            out = []
+            for row_sims, row_ids in zip(sims, ids):
+                best: Dict[str, float] = {}
+                for score, i in zip(row_sims.tolist(), row_ids.tolist()):
+                    if i < 0:
+                        continue
+                    ref = refs.get(i)
+                    if ref is not None and score > best.get(ref, -1.0):
+                        best[ref] = score
+                out.append(sorted(best.items(), key=lambda kv: kv[1], reverse=True))
+            return out
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "vectors": int(self._index.ntotal) if self._index is not None else 0,
+                "products": len(set(self._ref_by_id.values())),
+                "dim": self.dim,
+                "embeddingModel": self.embedding_model,
+            }
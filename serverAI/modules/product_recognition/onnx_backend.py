@@ -0,0 +1,167 @@
+#serverAI/modules/product_recognition/onnx_backend.py
+"""
+ONNX Runtime (CPU) backend cho classifier và detector.
+
+File .onnx được tạo bởi tools/export_product_onnx.py, kèm file `<tên>.meta.json`
+mô tả tiền xử lý (resize/crop/mean/std), names và output đã softmax hay chưa.
+Nếu không có file meta, dùng metadata ultralytics nhúng trong model (names, imgsz).
+"""
+from typing import Any, Dict, List, Optional, Tuple
+from pathlib import Path
+import ast
+import json
+
+import cv2
+import numpy as np
+
+from core.onnx_runtime import load_onnx_session
+from .preprocess import BatchPreprocessor, IMAGENET_MEAN, IMAGENET_STD
+
+
+def meta_path_for(model_path: str) -> Path:
+    return Path(model_path).with_suffix(".meta.json")
+
+
+def _read_meta(model_path: str, session) -> Dict[str, Any]:
+    p = meta_path_for(model_path)
+    if p.exists():
+        return json.loads(p.read_text(encoding="utf-8"))
+    # Fallback: metadata do ultralytics nhúng khi export
+    custom = session.get_modelmeta().custom_metadata_map or {}
+    meta: Dict[str, Any] = {}
+    if "task" in custom:
+        meta["task"] = custom["task"]
+    if "names" in custom:
+        try:
+            meta["names"] = ast.literal_eval(custom["names"])
+        except Exception:
+            pass
+    if "imgsz" in custom:
+        try:
+            meta["imgsz"] = list(ast.literal_eval(custom["imgsz"]))
+        except Exception:
+            pass
+    if custom.get("author", "").lower().startswith("ultralytics"):
+        meta.setdefault("source", "ultralytics")
+    return meta
+
+
+def _names_from_meta(meta: Dict[str, Any]) -> Optional[Dict[int, str]]:
+    names = meta.get("names")
+    if isinstance(names, dict):
+        return {int(k): str(v) for k, v in names.items()}
+    if isinstance(names, list):
+        return {i: str(v) for i, v in enumerate(names)}
+    return None
+
+
+def _softmax(x: np.ndarray) -> np.ndarray:
+    x = x - x.max(axis=-1, keepdims=True)
+    np.exp(x, out=x)
+    x /= x.sum(axis=-1, keepdims=True)
+    return x
+
+
+class OnnxClassifier:
+    def __init__(self, path: str, session_options=None, preprocess_backend: str = "pil"):
+        self.session = load_onnx_session(path, session_options)
+        self.meta = _read_meta(path, self.session)
+        self.names = _names_from_meta(self.meta)
+        self.input_name = self.session.get_inputs()[0].name
+        pre = self.meta.get("preprocess")
+        if pre is None and self.meta.get("source") == "ultralytics":
+            # YOLO-cls: Resize(imgsz) + CenterCrop(imgsz), bilinear, chỉ /255
+            size = int((self.meta.get("imgsz") or [224])[0])
+            pre = {"resize": size, "crop": size, "mean": [0, 0, 0], "std": [1, 1, 1], "interpolation": "bilinear"}
+        pre = pre or {}
+        # Classify head của ultralytics đã softmax sẵn; model torch xuất logits
+        self.apply_softmax = bool(self.meta.get("softmax", self.meta.get("source") != "ultralytics"))
+        self.preprocess = BatchPreprocessor(
+            resize=pre.get("resize", 256),
+            crop=pre.get("crop", 224),
+            mean=pre.get("mean", IMAGENET_MEAN),
+            std=pre.get("std", IMAGENET_STD),
+            backend=preprocess_backend,
+            interpolation=pre.get("interpolation", "bicubic"),
+        )
+
+    def predict(self, images: List[np.ndarray]) -> Tuple[np.ndarray, np.ndarray]:
+        """Trả về (top1 index, top1 prob) cho từng ảnh."""
+        x = self.preprocess(images)
+        out = self.session.run(None, {self.input_name: x})[0]
+        out = np.asarray(out, dtype=np.float32).reshape(len(images), -1)
+        probs = _softmax(out.copy()) if self.apply_softmax else out
+        idxs = probs.argmax(axis=-1)
+        confs = probs[np.arange(len(images)), idxs]
+        return idxs, confs
+
+
+def letterbox(image_bgr: np.ndarray, size: int, pad_value: int = 114) -> Tuple[np.ndarray, float, Tuple[int, int]]:
+    """Resize giữ tỉ lệ + pad về size x size như ultralytics. Trả về (ảnh, gain, (pad_x, pad_y))."""
+    h, w = image_bgr.shape[:2]
+    gain = min(size / h, size / w)
+    new_w, new_h = int(round(w * gain)), int(round(h * gain))
+    pad_x, pad_y = (size - new_w) / 2, (size - new_h) / 2
+    if (new_w, new_h) != (w, h):
+        image_bgr = cv2.resize(image_bgr, (new_w, new_h), interpolation=cv2.INTER_LINEAR)
+    top, bottom = int(round(pad_y - 0.1)), int(round(pad_y + 0.1))
+    left, right = int(round(pad_x - 0.1)), int(round(pad_x + 0.1))
+    out = cv2.copyMakeBorder(image_bgr, top, bottom, left, right, cv2.BORDER_CONSTANT, value=(pad_value,) * 3)
+    return out, gain, (left, top)
+
+
+def detector_input(image_bgr: np.ndarray, size: int) -> Tuple[np.ndarray, float, Tuple[int, int]]:
+    boxed, gain, pad = letterbox(image_bgr, size)
+    x = np.empty((1, 3, size, size), dtype=np.float32)
+    np.copyto(x[0], boxed.transpose(2, 0, 1)[::-1], casting="unsafe")
+    x /= np.float32(255.0)
+    return x, gain, pad
+
+
+class OnnxDetector:
+    """YOLOv8 detect head export (output 1 x (4+nc) x N), NMS theo từng class như ultralytics."""
+
+    _MAX_WH = 7680
+
+    def __init__(self, path: str, session_options=None):
+        self.session = load_onnx_session(path, session_options)
+        self.meta = _read_meta(path, self.session)
+        self.names = _names_from_meta(self.meta)
+        inp = self.session.get_inputs()[0]
+        self.input_name = inp.name
+        imgsz = self.meta.get("imgsz")
+        if imgsz:
+            self.imgsz = int(imgsz[0])
+        elif isinstance(inp.shape[2], int):
+            self.imgsz = int(inp.shape[2])
+        else:
+            self.imgsz = 640
+
+    def detect(self, image_bgr: np.ndarray, conf: float, iou: float) -> Tuple[np.ndarray, np.ndarray]:
+        """Trả về (xyxy[N,4] theo toạ độ ảnh gốc, conf[N]) sau NMS."""
+        x, gain, (pad_x, pad_y) = detector_input(image_bgr, self.imgsz)
+        preds = self.session.run(None, {self.input_name: x})[0][0].T  # (N, 4 + nc)
+        scores = preds[:, 4:]
+        cls = scores.argmax(axis=1)
+        confs = scores[np.arange(len(scores)), cls]
+        keep = confs >= conf
+        if not np.any(keep):
+            return np.zeros((0, 4), dtype=np.float32), np.zeros((0,), dtype=np.float32)
+        boxes, confs, cls = preds[keep, :4], confs[keep], cls[keep]
+        xywh = boxes.copy()
+        xywh[:, 0] -= xywh[:, 2] / 2
+        xywh[:, 1] -= xywh[:, 3] / 2
+        # Dịch box theo class để NMS không gộp box khác class
+        offset = xywh.copy()
+        offset[:, :2] += cls[:, None] * self._MAX_WH
+        idx = cv2.dnn.NMSBoxes(offset.tolist(), confs.tolist(), conf, iou)
+        idx = np.asarray(idx, dtype=np.int64).reshape(-1)
+        xyxy = np.empty((len(idx), 4), dtype=np.float32)
+        xyxy[:, 0] = (xywh[idx, 0] - pad_x) / gain
+        xyxy[:, 1] = (xywh[idx, 1] - pad_y) / gain
+        xyxy[:, 2] = (xywh[idx, 0] + xywh[idx, 2] - pad_x) / gain
+        xyxy[:, 3] = (xywh[idx, 1] + xywh[idx, 3] - pad_y) / gain
+        h, w = image_bgr.shape[:2]
+        xyxy[:, [0, 2]] = xyxy[:, [0, 2]].clip(0, w)
+        xyxy[:, [1, 3]] = xyxy[:, [1, 3]].clip(0, h)
+        return xyxy, confs[idx].astype(np.float32)
@@ -1,18 +1,96 @@
-from fastapi import APIRouter
+import asyncio
+import json
+
+from fastapi import APIRouter, Request, WebSocket, WebSocketDisconnect
 from pydantic import BaseModel
 
-from utils.image_utils import decode_image_b64
-from modules.product_recognition.service import recognize
+from core.inference import run_inference, InferenceRejected, InferenceExpired
+from utils.image_utils import decode_image_b64, decode_image_bytes
+from utils.upload_utils import read_image_body
+from modules.product_recognition.service import (
+    recognize, recognize_multi, recognition_stats, index_add_product, index_remove_product
+)
+
+from modules.product_recognition.stream import LatestFrameSlot, ScanSession
 
 router = APIRouter()
 
 class ProductRecognizeBody(BaseModel):
     image_b64: str
     mime: str = "image/jpeg"
+    multi: bool = False
 
-@router.post("/product/recognize")
-def recognize_product(body: ProductRecognizeBody):
-    image = decode_image_b64(body.image_b64)
+def _recognize_image(image, multi: bool) -> dict:
     if image is None:
         return {"success": False, "detected": False, "message": "Invalid image payload"}
+    if multi:
+        return recognize_multi(image)
     return recognize(image)
+
+@router.post("/product/recognize")
+async def recognize_product(body: ProductRecognizeBody):
+    return await run_inference("product", lambda: _recognize_image(decode_image_b64(body.image_b64), body.multi))
+
+@router.post("/product/recognize/binary")
+async def recognize_product_binary(request: Request, multi: bool = False):
+    """Giống /product/recognize nhưng nhận ảnh multipart (field `file`) hoặc application/octet-stream."""
+    data = await read_image_body(request)
+    return await run_inference("product", lambda: _recognize_image(decode_image_bytes(data), multi))
+
+async def _receive_frames(ws: WebSocket, slot: LatestFrameSlot):
+    """Frame nhị phân = bytes ảnh; frame text = JSON {"image_b64": ...}."""
+    try:
+        while True:
+            msg = await ws.receive()
+            if msg["type"] == "websocket.disconnect":
+                break
+            if msg.get("bytes") is not None:
+                slot.put(("bytes", msg["bytes"]))
+            elif msg.get("text"):
+                try:
+                    slot.put(("b64", json.loads(msg["text"]).get("image_b64", "")))
+                except (ValueError, AttributeError):
+                    slot.put(("b64", ""))
+    finally:
+        slot.close()
+
+def _process_frame(session: ScanSession, frame) -> list:
+    kind, data = frame
+    image = decode_image_bytes(data) if kind == "bytes" else decode_image_b64(data)
+    return session.process(image)
+
+@router.websocket("/product/recognize/stream")
+async def recognize_stream(ws: WebSocket):
+    await ws.accept()
+    slot = LatestFrameSlot()
+    session = ScanSession()
+    receiver = asyncio.create_task(_receive_frames(ws, slot))
+    try:
+        while True:
+            frame = await slot.get()
+            if frame is None:
+                break
+            try:
+                events = await run_inference("product", _process_frame, session, frame)
+            except (InferenceRejected, InferenceExpired):
+                # Quá tải: bỏ frame này, client sẽ gửi frame mới hơn
+                slot.dropped += 1
+                continue
+            for event in events:
+                await ws.send_json({**event, "stats": session.stats(slot)})
+    except WebSocketDisconnect:
+        pass
+    finally:
+        receiver.cancel()
+
+@router.get("/product/recognize/stats")
+def recognize_stats():
+    return recognition_stats()
+
+@router.post("/product/index/{reference_id}")
+async def add_product_to_index(reference_id: str):
+    return await run_inference("product", index_add_product, reference_id)
+
+@router.delete("/product/index/{reference_id}")
+async def remove_product_from_index(reference_id: str):
+    return await run_inference("product", index_remove_product, reference_id)
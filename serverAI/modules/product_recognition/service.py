@@ -7,70 +7,60 @@ import numpy as np
 _TORCH_ERROR: Optional[str] = None
 try:
     import torch
-    from torchvision import transforms as T
 except Exception as _e:
     torch = None
-    T = None
     _TORCH_ERROR = str(_e)
 
 from modules.product_recognition.model_loader import (
     load_yolo_model, load_torchscript, load_torch_module
 )
-from modules.product_recognition.utils import crop_with_detector
-from utils.file_utils import read_json, read_lines
-from utils.image_utils import pil_from_bgr
+from modules.product_recognition.utils import crop_with_detector, crop_all_with_detector, best_box
+from modules.product_recognition.batcher import MicroBatcher
+from modules.product_recognition.cache import PerceptualCache, dhash
+from modules.product_recognition.preprocess import BatchPreprocessor
+from modules.product_recognition.onnx_backend import OnnxClassifier, OnnxDetector
+from core.onnx_runtime import make_session_options
+from modules.product_recognition.embedding_index import (
+    ProductEmbedder, ProductEmbeddingIndex, load_reference_images
+)
 from core.config import settings
+from core.catalog import catalog
 
 # --------- Global states ---------
 _detection_model = None
 _cls_model = None
-_cls_backend: Optional[str] = None  # "yolo-cls" | "torchscript" | "torch-module"
+_cls_backend: Optional[str] = None  # "onnx" | "yolo-cls" | "torchscript" | "torch-module"
 _model_names = None
 _cls_labels: Optional[List[str]] = None
+_batcher: Optional[MicroBatcher] = None
+_embedder: Optional[ProductEmbedder] = None
+_embedding_index: Optional[ProductEmbeddingIndex] = None
+_preprocess = BatchPreprocessor(backend=settings.PRODUCT_PREPROCESS_BACKEND)
+_result_cache: Optional[PerceptualCache] = (
+    PerceptualCache(
+        max_size=settings.PRODUCT_CACHE_SIZE,
+        ttl_s=settings.PRODUCT_CACHE_TTL_S,
+        max_distance=settings.PRODUCT_CACHE_MAX_HAMMING,
+    )
+    if settings.PRODUCT_CACHE_ENABLED
+    else None
+)
 
-_catalog_by_ref: Dict[str, Dict] = {}
-_ref_by_class: Dict[str, str] = {}
-
-def _load_catalog():
-    global _catalog_by_ref
-    payload = read_json(settings.PRODUCT_METADATA_PATH)
-    items = payload.get("items", payload) if isinstance(payload, dict) else payload
-    _catalog_by_ref = {}
-    for raw in items:
-        ref = str(raw.get("reference_id") or raw.get("id") or "").strip()
-        if not ref:
-            continue
-        _catalog_by_ref[ref] = {
-            "referenceId": ref,
-            "name": raw.get("name", ""),
-            "category": raw.get("category", ""),
-            "subCategory": raw.get("subCategory", ""),
-            "unit": raw.get("unit", ""),
-            "stock": raw.get("stock", 0),
-            "price": raw.get("price", 0),
-            "discount": raw.get("discount", 0),
-            "description": raw.get("description", ""),
-            "image": raw.get("image", []),
-            "reference_image": raw.get("reference_image", []),
-            "tags": raw.get("tags", []),
-        }
-    print(f"[catalog] Loaded {len(_catalog_by_ref)} items")
-
-def _load_class_map():
-    global _ref_by_class
-    _ref_by_class = {}
-    path = settings.PRODUCT_CLASS_MAP_PATH
-    if not path:
-        print("[mapping] No class_to_reference.json; assume class == reference_id")
-        return
-    p = Path(path)
-    if not p.exists():
-        print("[mapping] Not found:", p)
-        return
-    data = read_json(str(p))
-    if isinstance(data, dict):
-        _ref_by_class = {str(k): str(v) for k, v in data.items() if k is not None and v is not None}
-        print(f"[mapping] class→reference loaded: {len(_ref_by_class)} entries")
+def _invalidate_cache():
+    # Kết quả cũ không còn đúng khi catalog hoặc model thay đổi
+    if _result_cache is not None:
+        _result_cache.clear()
+
+def _is_onnx(path: Optional[str]) -> bool:
+    return bool(path) and str(path).lower().endswith(".onnx")
+
+def _ort_session_options():
+    return make_session_options(
+        intra_op_threads=settings.PRODUCT_ORT_INTRA_OP_THREADS,
+        inter_op_threads=settings.PRODUCT_ORT_INTER_OP_THREADS,
+        graph_opt_level=settings.PRODUCT_ORT_GRAPH_OPT_LEVEL,
+        execution_mode=settings.PRODUCT_ORT_EXECUTION_MODE,
+    )
 
 def _init_detection():
     global _detection_model
@@ -79,6 +69,10 @@ def _init_detection():
         print("[detector] Not configured; classify full image")
         return
     try:
+        if _is_onnx(path):
+            _detection_model = OnnxDetector(path, _ort_session_options())
+            print(f"[detector] ONNX Runtime loaded: {path}")
+            return
         _detection_model = load_yolo_model(path)
         print(f"[detector] loaded: {path}")
     except Exception as exc:
@@ -126,6 +120,24 @@ def _load_labels_if_needed():
 def _init_classifier():
     global _cls_model, _cls_backend, _model_names
 
+    # ONNX Runtime (file .onnx từ tools/export_product_onnx.py)
+    if _is_onnx(settings.PRODUCT_CLS_MODEL):
+        try:
+            m = OnnxClassifier(
+                settings.PRODUCT_CLS_MODEL,
+                _ort_session_options(),
+                preprocess_backend=settings.PRODUCT_PREPROCESS_BACKEND,
+            )
+        except Exception as exc:
+            raise RuntimeError(f"Cannot load ONNX classifier: {exc}")
+        _cls_model = m
+        _cls_backend = "onnx"
+        _model_names = m.names
+        print(f"[classifier] ONNX Runtime loaded: {settings.PRODUCT_CLS_MODEL}")
+        if _model_names is None:
+            _load_labels_if_needed()
+        return
+
     # Try YOLO classify first
     try:
         m = load_yolo_model(settings.PRODUCT_CLS_MODEL)
@@ -163,45 +175,102 @@ def _init_classifier():
     except Exception as exc:
         raise RuntimeError(f"Cannot load classifier: {exc}")
 
+def _use_embedding() -> bool:
+    return settings.PRODUCT_RECOGNITION_MODE.lower() == "embedding"
+
+def _embedder_name() -> str:
+    return f"{settings.PRODUCT_EMBED_MODEL}/{settings.PRODUCT_EMBED_PRETRAINED}"
+
+def _init_embedding():
+    global _embedder, _embedding_index
+    _embedder = ProductEmbedder(
+        settings.PRODUCT_EMBED_MODEL,
+        settings.PRODUCT_EMBED_PRETRAINED,
+        batch_size=settings.PRODUCT_EMBED_BATCH_SIZE,
+        preprocess_backend=settings.PRODUCT_PREPROCESS_BACKEND,
+    )
+    _embedding_index = ProductEmbeddingIndex(settings.PRODUCT_INDEX_PATH, settings.PRODUCT_INDEX_META_PATH).load()
+    stats = _embedding_index.stats()
+    if _embedding_index.embedding_model and _embedding_index.embedding_model != _embedder_name():
+        print(f"[product-index] WARNING: index built with {_embedding_index.embedding_model}, runtime uses {_embedder_name()}")
+    print(f"[product-index] loaded {stats['vectors']} vectors / {stats['products']} products")
+
+def _init_batcher():
+    global _batcher
+    if not settings.PRODUCT_BATCH_ENABLED or settings.PRODUCT_BATCH_MAX_SIZE <= 1:
+        print("[batcher] disabled; classify per request")
+        _batcher = None
+        return
+    _batcher = MicroBatcher(
+        _predict_batch,
+        max_batch_size=settings.PRODUCT_BATCH_MAX_SIZE,
+        max_wait_ms=settings.PRODUCT_BATCH_MAX_WAIT_MS,
+        name="product-batcher",
+    )
+    print(
+        f"[batcher] max_batch={settings.PRODUCT_BATCH_MAX_SIZE} "
+        f"max_wait={settings.PRODUCT_BATCH_MAX_WAIT_MS}ms"
+    )
+
 def product_bootstrap():
-    _load_catalog()
-    _load_class_map()
+    if catalog.snapshot.version == 0:
+        catalog.reload()
+    catalog.add_listener(lambda _snapshot: _invalidate_cache())
     _init_detection()
-    _init_classifier()
+    if _use_embedding():
+        _init_embedding()
+    else:
+        _init_classifier()
+    _init_batcher()
+    _invalidate_cache()
     print("[product] module ready")
 
-def _classify(image_bgr: np.ndarray) -> Tuple[Optional[str], float]:
-    if _cls_backend is None or _cls_model is None:
-        return None, 0.0
+def _label_for_index(idx: int) -> str:
+    if _cls_labels and 0 <= idx < len(_cls_labels):
+        return _cls_labels[idx]
+    return str(idx)
+
+def _classify_batch(images: List[np.ndarray]) -> List[Tuple[Optional[str], float]]:
+    """Phân loại nhiều ảnh trong 1 lần forward; kết quả giữ đúng thứ tự đầu vào."""
+    empty = [(None, 0.0)] * len(images)
+    if not images or _cls_backend is None or _cls_model is None:
+        return empty
+
+    if _cls_backend == "onnx":
+        try:
+            idxs, confs = _cls_model.predict(images)
+            return [
+                (_model_names.get(int(idx), str(int(idx))) if _model_names else _label_for_index(int(idx)), float(conf))
+                for idx, conf in zip(idxs, confs)
+            ]
+        except Exception as exc:
+            print("[classifier] ONNX inference failed:", exc)
+            return empty
 
     if _cls_backend == "yolo-cls":
         try:
-            res = _cls_model(image_bgr, verbose=False)
+            res = _cls_model(list(images), verbose=False)
             if not res:
-                return None, 0.0
-            r = res[0]
-            if getattr(r, "probs", None) is None:
-                return None, 0.0
-            idx = int(r.probs.top1)
-            conf = float(r.probs.top1conf)
-            name = _model_names.get(idx, str(idx)) if _model_names else str(idx)
-            return name, conf
+                return empty
+            out: List[Tuple[Optional[str], float]] = []
+            for r in res:
+                if getattr(r, "probs", None) is None:
+                    out.append((None, 0.0))
+                    continue
+                idx = int(r.probs.top1)
+                conf = float(r.probs.top1conf)
+                name = _model_names.get(idx, str(idx)) if _model_names else str(idx)
+                out.append((name, conf))
+            return out
         except Exception as exc:
             print("[classifier] YOLO-cls inference failed:", exc)
-            return None, 0.0
+            return empty
 
     # Torch backends
     try:
-        if torch is None or T is None:
-            return None, 0.0
-        pil = pil_from_bgr(image_bgr)
-        tfm = T.Compose([
-            T.Resize(256, interpolation=T.InterpolationMode.BICUBIC),
-            T.CenterCrop(224),
-            T.ToTensor(),
-            T.Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225]),
-        ])
-        x = tfm(pil).unsqueeze(0)
+        if torch is None:
+            return empty
+        x = torch.from_numpy(_preprocess(images))
         with torch.no_grad():
             logits = _cls_model(x)
             if isinstance(logits, (list, tuple)):
@@ -209,41 +278,83 @@ def _classify(image_bgr: np.ndarray) -> Tuple[Optional[str], float]:
             if isinstance(logits, dict) and "logits" in logits:
                 logits = logits["logits"]
             probs = torch.softmax(logits, dim=-1)
-            conf, idx = torch.max(probs, dim=-1)
-            idx = int(idx.item())
-            conf = float(conf.item())
-            if _cls_labels and 0 <= idx < len(_cls_labels):
-                name = _cls_labels[idx]
-            else:
-                name = str(idx)
-            return name, conf
+            confs, idxs = torch.max(probs, dim=-1)
+        return [
+            (_label_for_index(int(idx)), float(conf))
+            for idx, conf in zip(idxs.tolist(), confs.tolist())
+        ]
     except Exception as exc:
         print("[classifier] Torch inference failed:", exc)
-        return None, 0.0
+        return empty
 
-def _class_to_reference_id(cls_name: str) -> Optional[str]:
-    if cls_name in _ref_by_class:
-        return _ref_by_class[cls_name]
-    if cls_name in _catalog_by_ref:
-        return cls_name
-    return None
+def _match_batch(images: List[np.ndarray]) -> List[Tuple[Optional[str], float]]:
+    """Chế độ embedding: trả về (reference_id, cosine similarity) của SKU gần nhất."""
+    empty = [(None, 0.0)] * len(images)
+    if not images or _embedder is None or _embedding_index is None:
+        return empty
+    try:
+        vectors = _embedder.embed(images)
+        matches = _embedding_index.search(vectors, settings.PRODUCT_EMBED_TOP_K)
+    except Exception as exc:
+        print("[product-index] search failed:", exc)
+        return empty
+    return [m[0] if m else (None, 0.0) for m in matches]
 
-def recognize(image_bgr: np.ndarray) -> Dict:
-    roi = crop_with_detector(
-        _detection_model, image_bgr, settings.PRODUCT_DETECTION_CONF, settings.PRODUCT_DETECTION_IOU
-    )
-    cls_name, conf = _classify(roi)
+def _predict_batch(images: List[np.ndarray]) -> List[Tuple[Optional[str], float]]:
+    if _use_embedding():
+        return _match_batch(images)
+    return _classify_batch(images)
+
+def _classify(image_bgr: np.ndarray) -> Tuple[Optional[str], float]:
+    if _batcher is not None:
+        return _batcher.submit(image_bgr)
+    return _predict_batch([image_bgr])[0]
+
+def recognition_stats() -> Dict:
+    return {
+        "batcher": {"enabled": True, **_batcher.stats()} if _batcher is not None else {"enabled": False},
+        "cache": {"enabled": True, **_result_cache.stats()} if _result_cache is not None else {"enabled": False},
+        "embeddingIndex": _embedding_index.stats() if _embedding_index is not None else None,
+    }
+
+def index_add_product(reference_id: str) -> Dict:
+    """Embed ảnh tham chiếu của 1 SKU trong catalog và thay vector cũ trong index (có lưu đĩa)."""
+    if _embedder is None or _embedding_index is None:
+        return {"success": False, "message": "Embedding mode is not enabled"}
+    meta = catalog.snapshot.get(reference_id)
+    if not meta:
+        return {"success": False, "message": f"Không tìm thấy '{reference_id}' trong catalog"}
+    images = load_reference_images(meta.get("reference_image", []), settings.PRODUCT_REFERENCE_IMAGE_ROOT)
+    if not images:
+        return {"success": False, "message": f"'{reference_id}' không có ảnh tham chiếu đọc được"}
+    added = _embedding_index.replace(reference_id, _embedder.embed(images))
+    _embedding_index.save()
+    _invalidate_cache()
+    return {"success": True, "referenceId": reference_id, "vectors": added}
+
+def index_remove_product(reference_id: str) -> Dict:
+    if _embedding_index is None:
+        return {"success": False, "message": "Embedding mode is not enabled"}
+    removed = _embedding_index.remove(reference_id)
+    if removed:
+        _embedding_index.save()
+        _invalidate_cache()
+    return {"success": bool(removed), "referenceId": reference_id, "vectors": removed}
+
+def _build_result(cls_name: Optional[str], conf: float, snapshot=None) -> Dict:
     if not cls_name:
         return {"success": False, "detected": False, "message": "Không phân loại được sản phẩm", "confidence": 0.0}
 
-    if conf < settings.PRODUCT_RECOGNITION_THRESHOLD:
+    threshold = settings.PRODUCT_EMBED_THRESHOLD if _use_embedding() else settings.PRODUCT_RECOGNITION_THRESHOLD
+    if conf < threshold:
         return {"success": False, "detected": False, "message": f"Độ tin cậy thấp ({conf:.3f})", "confidence": conf, "class": cls_name}
 
-    ref_id = _class_to_reference_id(cls_name)
+    snapshot = snapshot or catalog.snapshot
+    ref_id = snapshot.resolve_class(cls_name)
     if not ref_id:
         return {"success": False, "detected": False, "message": f"Không ánh xạ được class '{cls_name}'", "confidence": conf, "class": cls_name}
 
-    meta = _catalog_by_ref.get(ref_id)
+    meta = snapshot.get(ref_id)
     if not meta:
         return {"success": False, "detected": False, "message": f"Không tìm thấy metadata cho '{ref_id}'", "confidence": conf, "class": cls_name}
 
@@ -251,3 +362,61 @@ def recognize(image_bgr: np.ndarray) -> Dict:
     payload["predictedClass"] = cls_name
     payload["confidence"] = conf
     return {"success": True, "detected": True, "message": "Product recognized", "product": payload, "confidence": conf}
+
+def recognize(image_bgr: np.ndarray) -> Dict:
+    key = None
+    if _result_cache is not None:
+        key = dhash(image_bgr)
+        cached = _result_cache.get(key)
+        if cached is not None:
+            return {**cached, "cached": True}
+
+    roi = crop_with_detector(
+        _detection_model, image_bgr, settings.PRODUCT_DETECTION_CONF, settings.PRODUCT_DETECTION_IOU
+    )
+    cls_name, conf = _classify(roi)
+    result = _build_result(cls_name, conf)
+    # Chỉ cache kết quả thành công: frame mờ/lệch đầu tiên không được chặn các frame tốt sau đó
+    if key is not None and result["success"]:
+        _result_cache.put(key, result)
+    return result
+
+def detect_primary_box(image_bgr: np.ndarray) -> Optional[Tuple[Tuple[int, int, int, int], float]]:
+    return best_box(
+        _detection_model, image_bgr, settings.PRODUCT_DETECTION_CONF, settings.PRODUCT_DETECTION_IOU
+    )
+
+def recognize_roi(roi_bgr: np.ndarray) -> Dict:
+    """Phân loại 1 vùng đã crop sẵn (bỏ qua detector và cache)."""
+    cls_name, conf = _classify(roi_bgr)
+    return _build_result(cls_name, conf)
+
+def recognize_multi(image_bgr: np.ndarray) -> Dict:
+    """Nhận diện mọi sản phẩm trong ảnh: 1 lần detector + 1 lần classifier theo batch."""
+    crops = crop_all_with_detector(
+        _detection_model,
+        image_bgr,
+        settings.PRODUCT_DETECTION_CONF,
+        settings.PRODUCT_DETECTION_IOU,
+        max_items=settings.PRODUCT_MULTI_MAX_ITEMS,
+    )
+    if not crops:
+        return {"success": False, "detected": False, "message": "Không phát hiện sản phẩm nào", "count": 0, "items": [], "rejected": []}
+
+    predictions = _predict_batch([crop for crop, _, _ in crops])
+    snapshot = catalog.snapshot
+    items, rejected = [], []
+    for (_, box, det_conf), (cls_name, conf) in zip(crops, predictions):
+        result = _build_result(cls_name, conf, snapshot)
+        result["box"] = list(box)
+        result["detectionConfidence"] = det_conf
+        (items if result["success"] else rejected).append(result)
+
+    return {
+        "success": bool(items),
+        "detected": bool(items),
+        "message": f"Recognized {len(items)}/{len(crops)} products" if items else "Không phân loại được sản phẩm",
+        "count": len(items),
+        "items": items,
+        "rejected": rejected,
+    }
@@ -0,0 +1,128 @@
+#serverAI/modules/product_recognition/stream.py
+"""
+Quét sản phẩm theo luồng frame (WebSocket).
+
+- LatestFrameSlot: chỉ giữ frame mới nhất; frame cũ chưa xử lý bị bỏ (đếm là dropped).
+- ScanSession: chạy detector mỗi frame, bám box qua các frame và chỉ gọi lại classifier
+  khi box thay đổi nhiều (IoU thấp), confidence detector giảm, hoặc kết quả đã quá cũ.
+  Kết quả chỉ được đẩy về client khi ổn định đủ PRODUCT_STREAM_STABLE_FRAMES frame.
+"""
+from typing import Dict, List, Optional, Tuple
+import asyncio
+
+import numpy as np
+
+from core.config import settings
+from modules.product_recognition.service import detect_primary_box, recognize_roi
+from modules.product_recognition.utils import box_iou
+
+
+class LatestFrameSlot:
+    def __init__(self):
+        self._frame = None
+        self._closed = False
+        self._event = asyncio.Event()
+        self.received = 0
+        self.dropped = 0
+
+    def put(self, frame):
+        self.received += 1
+        if self._frame is not None:
+            self.dropped += 1
+        self._frame = frame
+        self._event.set()
+
+    def close(self):
+        self._closed = True
+        self._event.set()
+
+    async def get(self):
+        """Chờ frame mới nhất; trả None khi đã đóng và không còn frame."""
+        while self._frame is None:
+            if self._closed:
+                return None
+            self._event.clear()
+            await self._event.wait()
+        frame, self._frame = self._frame, None
+        return frame
+
+
+class _Track:
+    __slots__ = ("box", "det_conf", "reference_id", "result", "age", "hits")
+
+    def __init__(self, box, det_conf: float, result: Dict):
+        self.box = box
+        self.det_conf = det_conf
+        self.result = result
+        self.reference_id = result["product"]["referenceId"] if result.get("success") else None
+        self.age = 0
+        self.hits = 1
+
+
+class ScanSession:
+    def __init__(self):
+        self._track: Optional[_Track] = None
+        self._published: Optional[str] = None
+        self._misses = 0
+        self.frames = 0
+        self.classifications = 0
+
+    def _needs_classify(self, box: Tuple[int, int, int, int], det_conf: float) -> bool:
+        t = self._track
+        if t is None or t.reference_id is None:
+            return True
+        if box_iou(box, t.box) < settings.PRODUCT_STREAM_IOU_THRESHOLD:
+            return True
+        if det_conf < t.det_conf - settings.PRODUCT_STREAM_CONF_DECAY:
+            return True
+        return t.age >= settings.PRODUCT_STREAM_MAX_AGE_FRAMES
+
+    def _on_lost(self) -> List[Dict]:
+        self._misses += 1
+        if self._track is None or self._misses < settings.PRODUCT_STREAM_LOST_FRAMES:
+            return []
+        self._track = None
+        if self._published is None:
+            return []
+        self._published = None
+        return [{"type": "lost", "frame": self.frames}]
+
+    def process(self, image_bgr: Optional[np.ndarray]) -> List[Dict]:
+        """Xử lý 1 frame, trả về các event cần đẩy cho client (thường là rỗng)."""
+        self.frames += 1
+        if image_bgr is None:
+            return [{"type": "error", "frame": self.frames, "message": "Invalid image payload"}]
+
+        found = detect_primary_box(image_bgr)
+        if found is None:
+            return self._on_lost()
+        self._misses = 0
+        box, det_conf = found
+
+        if self._needs_classify(box, det_conf):
+            x1, y1, x2, y2 = box
+            result = recognize_roi(image_bgr[y1:y2, x1:x2])
+            self.classifications += 1
+            previous = self._track
+            track = _Track(box, det_conf, result)
+            if previous is not None and previous.reference_id == track.reference_id:
+                track.hits = previous.hits + 1
+            self._track = track
+        else:
+            self._track.box = box
+            self._track.age += 1
+            self._track.hits += 1
+
+        t = self._track
+        if t.reference_id is None or t.hits < settings.PRODUCT_STREAM_STABLE_FRAMES:
+            return []
+        if self._published == t.reference_id:
+            return []
+        self._published = t.reference_id
+        return [{**t.result, "type": "result", "stable": True, "box": list(t.box), "frame": self.frames}]
+
+    def stats(self, slot: Optional[LatestFrameSlot] = None) -> Dict:
+        out = {"frames": self.frames, "classifications": self.classifications}
+        if slot is not None:
+            out.update({"received": slot.received, "dropped": slot.dropped})
+        return out
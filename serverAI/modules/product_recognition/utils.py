@@ -1,4 +1,4 @@
-from typing import Optional, Tuple
+from typing import List, Optional, Tuple
 import numpy as np
 
 _YOLO_ERROR: Optional[str] = None
@@ -8,24 +8,84 @@ except Exception as _e:
     YOLO = None
     _YOLO_ERROR = str(_e)
 
-def crop_with_detector(detector, image: np.ndarray, conf: float, iou: float) -> np.ndarray:
-    if detector is None:
-        return image
+def _detect_boxes(detector, image: np.ndarray, conf: float, iou: float) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+    """Chạy detector (ultralytics YOLO hoặc OnnxDetector) -> (xyxy[N,4], conf[N]); None nếu lỗi."""
     try:
+        if hasattr(detector, "detect"):
+            return detector.detect(image, conf, iou)
         results = detector.predict(image, conf=conf, iou=iou, verbose=False)
     except Exception as exc:
         print("[detector] inference failed:", exc)
-        return image
+        return None
+    empty = (np.zeros((0, 4), dtype=np.float32), np.zeros((0,), dtype=np.float32))
     if not results:
-        return image
+        return empty
     boxes = getattr(results[0], "boxes", None)
     if boxes is None or boxes.data is None or len(boxes.data) == 0:
-        return image
-    best_idx = int(np.argmax(boxes.conf.cpu().numpy()))
-    x1, y1, x2, y2 = map(int, boxes.xyxy[best_idx].cpu().numpy())
+        return empty
+    return boxes.xyxy.cpu().numpy(), boxes.conf.cpu().numpy()
+
+def best_box(detector, image: np.ndarray, conf: float, iou: float) -> Optional[Tuple[Tuple[int, int, int, int], float]]:
+    """Box có confidence cao nhất ((x1, y1, x2, y2), det_conf); không có detector -> cả ảnh; không thấy -> None."""
     h, w = image.shape[:2]
+    if detector is None:
+        return (0, 0, w, h), 1.0
+    detected = _detect_boxes(detector, image, conf, iou)
+    if detected is None:
+        return None
+    xyxy, confs = detected
+    if len(confs) == 0:
+        return None
+    best_idx = int(np.argmax(confs))
+    x1, y1, x2, y2 = map(int, xyxy[best_idx])
     x1, y1 = max(0, x1), max(0, y1)
     x2, y2 = min(w, x2), min(h, y2)
     if x2 <= x1 or y2 <= y1:
+        return None
+    return (x1, y1, x2, y2), float(confs[best_idx])
+
+def crop_with_detector(detector, image: np.ndarray, conf: float, iou: float) -> np.ndarray:
+    found = best_box(detector, image, conf, iou)
+    if found is None:
         return image
+    x1, y1, x2, y2 = found[0]
     return image[y1:y2, x1:x2]
+
+def box_iou(a: Tuple[int, int, int, int], b: Tuple[int, int, int, int]) -> float:
+    ix1, iy1 = max(a[0], b[0]), max(a[1], b[1])
+    ix2, iy2 = min(a[2], b[2]), min(a[3], b[3])
+    inter = max(0, ix2 - ix1) * max(0, iy2 - iy1)
+    if inter == 0:
+        return 0.0
+    area_a = (a[2] - a[0]) * (a[3] - a[1])
+    area_b = (b[2] - b[0]) * (b[3] - b[1])
+    return inter / float(area_a + area_b - inter)
+
+def crop_all_with_detector(
+    detector, image: np.ndarray, conf: float, iou: float, max_items: Optional[int] = None
+) -> List[Tuple[np.ndarray, Tuple[int, int, int, int], float]]:
+    """
+    Giữ mọi box có độ tin cậy >= conf (sắp giảm dần theo confidence).
+    Trả về list (crop, (x1, y1, x2, y2), det_conf). Không có detector -> cả ảnh.
+    """
+    h, w = image.shape[:2]
+    full = [(image, (0, 0, w, h), 1.0)]
+    if detector is None:
+        return full
+    detected = _detect_boxes(detector, image, conf, iou)
+    if detected is None:
+        return full
+    xyxy, confs = detected
+    crops = []
+    for i in np.argsort(-confs):
+        if confs[i] < conf:
+            continue
+        x1, y1, x2, y2 = map(int, xyxy[i])
+        x1, y1 = max(0, x1), max(0, y1)
+        x2, y2 = min(w, x2), min(h, y2)
+        if x2 <= x1 or y2 <= y1:
+            continue
+        crops.append((image[y1:y2, x1:x2], (x1, y1, x2, y2), float(confs[i])))
+        if max_items and len(crops) >= max_items:
+            break
+    return crops
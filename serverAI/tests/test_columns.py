@@ -0,0 +1,125 @@
+from typing import Dict, List
+
+import numpy as np
+import pytest
+
+from core.config import settings
+from modules.meal_assistant.columns import RecipeColumns, RecipeView
+from modules.meal_assistant.recipe_store import RecipeStore
+from modules.meal_assistant.rerank import rerank
+
+
+# ---------- công thức cũ (tính theo từng dict), giữ nguyên để so ----------
+def _old_inventory_coverage(recipe: Dict, available_refs: List[str]) -> float:
+    if not recipe.get("ingredients"):
+        return 0.0
+    have = sum(1 for ing in recipe["ingredients"] if ing.get("reference_id") in available_refs)
+    return have / len(recipe["ingredients"])
+
+
+def _old_calculate_score(recipe: Dict, nlu_budget) -> float:
+    weights = settings.MEAL_RERANK_WEIGHTS
+    semantic = recipe.get("semantic_score", 0.0)
+    preference = recipe.get("inventory", 0.0)
+    popularity = recipe.get("popularity", 0.5)
+    freshness = recipe.get("freshness", 0.5)
+    promo = 1.0 if recipe.get("promo") else 0.0
+    if nlu_budget and recipe.get("budget"):
+        diff = max(nlu_budget - recipe["budget"], 0)
+        preference += min(diff / (nlu_budget + 1e-6), 0.4)
+    score = (
+        weights.get("semantic", 0.4) * semantic
+        + weights.get("preference", 0.25) * preference
+        + weights.get("popularity", 0.2) * popularity
+        + weights.get("freshness", 0.1) * freshness
+        + weights.get("promo", 0.05) * promo
+    )
+    return float(min(score, 1.0))
+
+
+def _old_rerank(recipes: List[Dict], nlu_budget) -> List[Dict]:
+    for recipe in recipes:
+        recipe["score"] = _old_calculate_score(recipe, nlu_budget)
+    recipes.sort(key=lambda r: r.get("score", 0.0), reverse=True)
+    return recipes[: settings.MEAL_RETURN]
+
+
+# ---------- dữ liệu ----------
+REFS = [f"P{i}" for i in range(8)]
+
+
+def _random_recipes(rng: np.random.Generator, n: int) -> List[Dict]:
+    recipes = []
+    for i in range(n):
+        recipe: Dict = {"id": f"r{i}", "name": f"Món {i}"}
+        ingredients = []
+        for _ in range(int(rng.integers(0, 6))):
+            roll = rng.random()
+            if roll < 0.15:
+                ingredients.append({"name": "muối"})  # không có reference_id
+            else:
+                ingredients.append({"name": "x", "reference_id": str(rng.choice(REFS[:4] if roll < 0.5 else REFS))})
+        if ingredients or rng.random() < 0.5:
+            recipe["ingredients"] = ingredients  # [] / thiếu hẳn field
+        if rng.random() < 0.7:
+            recipe["popularity"] = float(rng.choice([0.3, 0.5, rng.random()]))
+        if rng.random() < 0.7:
+            recipe["freshness"] = float(rng.random())
+        if rng.random() < 0.5:
+            recipe["promo"] = bool(rng.random() < 0.5)
+        if rng.random() < 0.8:
+            recipe["budget"] = float(rng.choice([0, 50000, 120000, rng.integers(1, 400) * 1000]))
+        recipes.append(recipe)
+    return recipes
+
+
+def _columns(recipes: List[Dict], source: str) -> RecipeColumns:
+    if source == "store":
+        return RecipeColumns.from_store(RecipeStore.from_recipes(recipes))
+    return RecipeColumns.from_recipes(recipes)
+
+
+@pytest.mark.parametrize("source", ["recipes", "store"])
+def test_matches_per_dict_scoring(source):
+    rng = np.random.default_rng(0)
+    for trial in range(200):
+        recipes = _random_recipes(rng, int(rng.integers(1, 40)))
+        columns = _columns(recipes, source)
+        rows = rng.choice(len(recipes), size=int(rng.integers(1, len(recipes) + 1)), replace=False)
+        available = [str(r) for r in rng.choice(REFS, size=int(rng.integers(0, 6)))]
+        # semantic lặp giá trị để có điểm bằng nhau
+        semantic = rng.choice([0.2, 0.5, 0.8], size=rows.size) if trial % 2 else rng.random(rows.size)
+        budget = [None, 0, 100000.0, float(rng.integers(1, 500) * 1000)][trial % 4]
+
+        coverage = columns.coverage(rows, available)
+        expected_cov = [_old_inventory_coverage(recipes[r], available) for r in rows.tolist()]
+        assert coverage.tolist() == expected_cov
+
+        old = [
+            dict(recipes[r], semantic_score=float(s), inventory=c, _row=r)
+            for r, s, c in zip(rows.tolist(), semantic.tolist(), expected_cov)
+        ]
+        scores = columns.scores(rows, semantic, coverage, budget, settings.MEAL_RERANK_WEIGHTS)
+        assert scores.tolist() == [_old_calculate_score(d, budget) for d in old]
+
+        views = [RecipeView(r, recipes[r], float(s), c) for r, s, c in zip(rows.tolist(), semantic.tolist(), expected_cov)]
+        ranked = rerank(views, budget, columns)
+        expected = _old_rerank(old, budget)
+        assert [v.row for v in ranked] == [d["_row"] for d in expected]
+        assert [v.score for v in ranked] == [d["score"] for d in expected]
+
+
+def test_ties_keep_retrieval_order():
+    recipes = [{"id": f"r{i}", "ingredients": [{"reference_id": "P1"}, {"reference_id": "P1"}]} for i in range(5)]
+    columns = RecipeColumns.from_recipes(recipes)
+    rows = np.array([3, 1, 4, 0, 2])
+    assert columns.coverage(rows, ["P1"]).tolist() == [1.0] * 5
+    views = [RecipeView(r, recipes[r], 0.5, 1.0) for r in rows.tolist()]
+    assert [v.row for v in rerank(views, None, columns)] == rows.tolist()[: settings.MEAL_RETURN]
+
+
+def test_empty_inputs():
+    columns = RecipeColumns.from_recipes([{"id": "r0"}, {"id": "r1", "ingredients": []}])
+    assert columns.coverage(np.array([0, 1]), ["P1"]).tolist() == [0.0, 0.0]
+    assert columns.coverage(np.array([], dtype=np.int64), ["P1"]).size == 0
+    assert rerank([], None, columns) == []
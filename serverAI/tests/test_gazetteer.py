@@ -0,0 +1,44 @@
+from modules.meal_assistant.gazetteer import Gazetteer
+
+
+def _compile():
+    return Gazetteer.compile(
+        products=[("Cà tím", "P-CA-TIM"), ("Thịt bò", "P-BEEF")],
+        ingredients=[("cà", "P-CA-TIM"), ("cá", "P-FISH"), ("bò", "P-BEEF"), ("bơ", "P-BUTTER")],
+        diets={"vegetarian": ["ăn chay"]},
+        intents={"suggest": ["gợi ý"]},
+        serving_units=["người"],
+        budget_units={"k": 1000},
+    )
+
+
+def test_accented_query_keeps_distinct_words():
+    gz = _compile()
+    found = gz.scan("cá kho tộ")
+    assert found.ingredients == ["cá"]
+    assert found.reference_ids == ["P-FISH"]
+    found = gz.scan("bơ")
+    assert found.ingredients == ["bơ"]
+    assert found.reference_ids == ["P-BUTTER"]
+
+
+def test_accented_word_missing_from_gazetteer_does_not_fall_back():
+    gz = Gazetteer.compile(
+        products=[],
+        ingredients=[("cà", "P-CA-TIM"), ("bò", "P-BEEF")],
+        diets={},
+        intents={},
+        serving_units=[],
+        budget_units={},
+    )
+    assert gz.scan("cá kho tộ").reference_ids == []
+    assert gz.scan("bơ").reference_ids == []
+
+
+def test_unaccented_query_uses_folded_form():
+    gz = _compile()
+    found = gz.scan("an chay thit bo cho 2 nguoi 150k")
+    assert found.ingredients == ["thịt bò"]
+    assert found.diets == ["vegetarian"]
+    assert found.servings == 2
+    assert found.budget == 150000
@@ -0,0 +1,51 @@
+import cv2
+import numpy as np
+import pytest
+
+from modules.product_recognition.preprocess import BatchPreprocessor
+from utils.image_utils import pil_from_bgr
+
+T = pytest.importorskip("torchvision.transforms")
+
+SIZES = [(257, 301), (480, 640), (199, 173), (224, 224), (1023, 517)]
+
+
+def _reference(image_bgr: np.ndarray) -> np.ndarray:
+    """Pipeline cũ: PIL + torchvision Resize(256, bicubic) + CenterCrop(224) + ToTensor + Normalize."""
+    tfm = T.Compose([
+        T.Resize(256, interpolation=T.InterpolationMode.BICUBIC),
+        T.CenterCrop(224),
+        T.ToTensor(),
+        T.Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225]),
+    ])
+    return tfm(pil_from_bgr(image_bgr)).numpy()
+
+
+def _images():
+    rng = np.random.default_rng(0)
+    return [rng.integers(0, 256, size=(h, w, 3), dtype=np.uint8) for h, w in SIZES]
+
+
+def _smooth_images():
+    # Ảnh ít tần số cao (gần ảnh chụp thật hơn nhiễu trắng)
+    rng = np.random.default_rng(1)
+    return [
+        cv2.resize(rng.integers(0, 256, size=(h // 16, w // 16, 3), dtype=np.uint8), (w, h), interpolation=cv2.INTER_LINEAR)
+        for h, w in SIZES
+    ]
+
+
+def test_pil_backend_matches_torchvision():
+    images = _images()
+    batch = BatchPreprocessor(backend="pil")(images)
+    assert batch.shape == (len(images), 3, 224, 224)
+    for out, img in zip(batch, images):
+        np.testing.assert_allclose(out, _reference(img), atol=1e-5)
+
+
+def test_cv2_backend_is_close_to_torchvision():
+    images = _smooth_images()
+    batch = BatchPreprocessor(backend="cv2")(images)
+    for out, img in zip(batch, images):
+        # cv2 không antialias như PIL: chỉ so sai khác trung bình
+        assert float(np.abs(out - _reference(img)).mean()) < 0.02
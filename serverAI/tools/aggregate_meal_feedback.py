@@ -0,0 +1,114 @@
+"""Aggregate meal assistant feedback logs into a per-recipe popularity array used by rerank."""
+from __future__ import annotations
+
+import argparse
+import json
+import math
+import time
+from pathlib import Path
+from typing import Dict, Iterable, Tuple
+
+import numpy as np
+
+from serverAI.core.config import settings
+from serverAI.modules.meal_assistant.feedback_log import iter_records, rotated_files
+from serverAI.modules.meal_assistant.recipe_store import RecipeStore
+
+
+def open_store() -> RecipeStore:
+    path = Path(settings.MEAL_METADATA_PATH)
+    legacy = path.with_suffix(".json")
+    if not path.exists() and legacy.exists():
+        path = legacy
+    if not path.exists():
+        raise RuntimeError(f"Metadata not found: {path}; run tools/build_meal_index.py first")
+    return RecipeStore.open(str(path))
+
+
+def recipe_rows(store: RecipeStore) -> Dict[str, int]:
+    return {str(store.recipe(row).get("id")): row for row in range(len(store))}
+
+
+def aggregate(
+    records: Iterable[dict],
+    rows: Dict[str, int],
+    prior: np.ndarray,
+    half_life_days: float,
+    prior_weight: float,
+    now: float,
+) -> Tuple[np.ndarray, np.ndarray, dict]:
+    """
+    popularity = (prior_weight * popularity tĩnh + Σ w * rating/5) / (prior_weight + Σ w),
+    w = 0.5 ^ (tuổi feedback / half_life). Công thức ít feedback giữ gần giá trị tĩnh.
+    """
+    n = prior.shape[0]
+    weight_sum = np.zeros(n, dtype=np.float64)
+    rating_sum = np.zeros(n, dtype=np.float64)
+    counts = np.zeros(n, dtype=np.int32)
+    decay = math.log(2) / (half_life_days * 86400.0) if half_life_days > 0 else 0.0
+    report = {"records": 0, "invalid": 0, "unknown_recipe": 0}
+    for record in records:
+        report["records"] += 1
+        row = rows.get(str(record.get("chosen_recipe_id")))
+        if row is None:
+            report["unknown_recipe"] += 1
+            continue
+        try:
+            rating = min(max(float(record.get("rating")), 0.0), 5.0)
+        except (TypeError, ValueError):
+            report["invalid"] += 1
+            continue
+        ts = record.get("ts")
+        age = max(now - float(ts), 0.0) if isinstance(ts, (int, float)) else 0.0
+        weight = math.exp(-decay * age)
+        weight_sum[row] += weight
+        rating_sum[row] += weight * rating / 5.0
+        counts[row] += 1
+
+    popularity = (prior_weight * prior + rating_sum) / np.maximum(prior_weight + weight_sum, 1e-12)
+    report["recipes_with_feedback"] = int((counts > 0).sum())
+    return np.clip(popularity, 0.0, 1.0).astype(np.float32), counts, report
+
+
+def save_popularity(path: Path, popularity: np.ndarray, counts: np.ndarray, recipes_hash: str):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + ".tmp.npz")
+    np.savez(
+        tmp,
+        popularity=popularity,
+        counts=counts,
+        recipes_hash=np.asarray(recipes_hash),
+        generated_at=np.asarray(time.time()),
+    )
+    tmp.replace(path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Aggregate meal feedback into per-recipe popularity")
+    parser.add_argument("--half-life-days", type=float, default=settings.MEAL_POPULARITY_HALF_LIFE_DAYS)
+    parser.add_argument("--prior-weight", type=float, default=settings.MEAL_POPULARITY_PRIOR_WEIGHT)
+    parser.add_argument("--dry-run", action="store_true", help="Chỉ in báo cáo, không ghi file")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    store = open_store()
+    prior = np.asarray(store.arrays["popularity"], dtype=np.float64)
+    popularity, counts, report = aggregate(
+        iter_records(settings.MEAL_FEEDBACK_PATH),
+        recipe_rows(store),
+        prior,
+        args.half_life_days,
+        args.prior_weight,
+        time.time(),
+    )
+    report["files"] = len(rotated_files(settings.MEAL_FEEDBACK_PATH))
+    report["recipes"] = len(store)
+    report["elapsed_s"] = round(time.perf_counter() - started, 3)
+    if not args.dry_run:
+        save_popularity(Path(settings.MEAL_POPULARITY_PATH), popularity, counts, store.header.get("recipes_hash", ""))
+        print(f"[meal-feedback] popularity ({len(popularity)} recipes) -> {settings.MEAL_POPULARITY_PATH}")
+    print("[meal-feedback] report:", json.dumps(report, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
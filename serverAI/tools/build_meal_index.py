@@ -1,16 +1,19 @@
-"""Utility to preprocess recipes and build FAISS index for meal assistant."""
+"""Utility to preprocess recipes and build FAISS index for meal assistant (incremental, cached embeddings)."""
 from __future__ import annotations
 
 import argparse
+import hashlib
 import json
+import time
 from pathlib import Path
-from typing import List
+from typing import Dict, List, Tuple
 
 import faiss
 import numpy as np
 from sentence_transformers import SentenceTransformer
 
 from serverAI.core.config import settings
+from serverAI.modules.meal_assistant.recipe_store import FORMAT_VERSION, RecipeStore
 from serverAI.utils.file_utils import read_json
 
 
@@ -36,38 +39,280 @@ def load_recipes() -> List[dict]:
     return payload
 
 
-def save_metadata(recipes: List[dict]) -> None:
+def content_hash(model_name: str, text: str) -> str:
+    return hashlib.sha256(f"{model_name}\x1f{text}".encode("utf-8")).hexdigest()
+
+
+def recipes_hash(recipes: List[dict]) -> str:
+    return hashlib.sha256(json.dumps(recipes, ensure_ascii=False, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+# ---------- embedding cache ----------
+def load_embedding_cache(path: Path) -> Dict[str, np.ndarray]:
+    if not path.exists():
+        return {}
+    data = np.load(path, allow_pickle=False)
+    return {str(k): v for k, v in zip(data["keys"], data["vectors"])}
+
+
+def save_embedding_cache(path: Path, cache: Dict[str, np.ndarray]) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    keys = list(cache)
+    vectors = np.stack([cache[k] for k in keys]) if keys else np.zeros((0, 0), dtype=np.float32)
+    tmp = path.with_name(path.name + ".tmp.npz")
+    np.savez(tmp, keys=np.asarray(keys, dtype=str), vectors=vectors)
+    tmp.replace(path)
+
+
+def encode_texts(model: SentenceTransformer, texts: List[str], batch_size: int, workers: int) -> np.ndarray:
+    if not texts:
+        return np.zeros((0, model.get_sentence_embedding_dimension()), dtype=np.float32)
+    if workers > 1 and len(texts) > batch_size:
+        pool = model.start_multi_process_pool(target_devices=["cpu"] * workers)
+        try:
+            vectors = model.encode_multi_process(texts, pool, batch_size=batch_size)
+        finally:
+            model.stop_multi_process_pool(pool)
+        vectors = vectors / np.linalg.norm(vectors, axis=1, keepdims=True).clip(min=1e-12)
+    else:
+        vectors = model.encode(texts, batch_size=batch_size, normalize_embeddings=True)
+    return np.asarray(vectors, dtype=np.float32)
+
+
+def embed_corpus(corpus: List[str], args, report: dict) -> np.ndarray:
+    cache_path = Path(settings.MEAL_EMBED_CACHE_PATH)
+    cache = {} if args.no_cache else load_embedding_cache(cache_path)
+    keys = [content_hash(settings.MEAL_EMBEDDING_MODEL, text) for text in corpus]
+    missing = sorted({k for k in keys if k not in cache})
+    text_by_key = dict(zip(keys, corpus))
+
+    t0 = time.perf_counter()
+    if missing:
+        model = SentenceTransformer(settings.MEAL_EMBEDDING_MODEL)
+        vectors = encode_texts(model, [text_by_key[k] for k in missing], args.batch_size, args.workers)
+        cache.update(zip(missing, vectors))
+    report["embed_s"] = round(time.perf_counter() - t0, 3)
+    report["embedded"] = len(missing)
+    report["cached"] = len(set(keys)) - len(missing)
+
+    if not args.no_cache:
+        # Chỉ giữ embedding của corpus hiện tại để file cache không phình mãi
+        save_embedding_cache(cache_path, {k: cache[k] for k in set(keys)})
+    return np.stack([cache[k] for k in keys]).astype(np.float32)
+
+
+# ---------- index ----------
+def choose_index_type(requested: str, n: int) -> str:
+    if requested != "auto":
+        return requested
+    return "flat" if n < settings.MEAL_INDEX_AUTO_THRESHOLD else "hnsw"
+
+
+def build_faiss_index(vectors: np.ndarray, index_type: str) -> faiss.Index:
+    n, dim = vectors.shape
+    if index_type == "flat":
+        index = faiss.IndexFlatIP(dim)
+    elif index_type == "ivf":
+        nlist = settings.MEAL_IVF_NLIST or max(1, int(4 * np.sqrt(n)))
+        nlist = min(nlist, n)
+        quantizer = faiss.IndexFlatIP(dim)
+        index = faiss.IndexIVFFlat(quantizer, dim, nlist, faiss.METRIC_INNER_PRODUCT)
+        index.train(vectors)
+        index.nprobe = settings.MEAL_IVF_NPROBE
+    elif index_type == "hnsw":
+        index = faiss.IndexHNSWFlat(dim, settings.MEAL_HNSW_M, faiss.METRIC_INNER_PRODUCT)
+        index.hnsw.efConstruction = settings.MEAL_HNSW_EF_CONSTRUCTION
+        index.hnsw.efSearch = settings.MEAL_HNSW_EF_SEARCH
+    else:
+        raise ValueError(f"Unknown index type: {index_type}")
+    index.add(vectors)
+    return index
+
+
+def recall_queries(vectors: np.ndarray, samples: int, noise: float, seed: int = 0) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Truy vấn giả lập: vector corpus cộng nhiễu Gauss (chuẩn ~ `noise`) rồi chuẩn hoá lại,
+    để truy vấn không trùng khít vector đã có trong index. Trả về (queries, id vector gốc).
+    """
+    n, dim = vectors.shape
+    rng = np.random.default_rng(seed)
+    source = rng.choice(n, size=min(samples, n), replace=False)
+    queries = vectors[source] + rng.normal(scale=noise / np.sqrt(dim), size=(source.size, dim))
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True).clip(min=1e-12)
+    return queries.astype(np.float32), source
+
+
+def _drop_source(ids: np.ndarray, source: np.ndarray, k: int) -> List[set]:
+    # Bỏ chính vector gốc của truy vấn (hold-out): nó luôn ở top-1 của cả 2 index nên làm recall ảo
+    return [set([i for i in row.tolist() if i != src and i >= 0][:k]) for row, src in zip(ids, source.tolist())]
+
+
+def measure_recall(
+    index: faiss.Index, vectors: np.ndarray, k: int, samples: int, noise: float = 0.5
+) -> Tuple[float, float, float]:
+    """
+    recall@k so với IndexFlatIP trên `samples` truy vấn (vector corpus + nhiễu, không tính vector gốc);
+    kèm ms/truy vấn của 2 index.
+    """
+    n = vectors.shape[0]
+    k = max(1, min(k, n - 1))
+    queries, source = recall_queries(vectors, samples, noise)
+    flat = faiss.IndexFlatIP(vectors.shape[1])
+    flat.add(vectors)
+    t0 = time.perf_counter()
+    _, truth = flat.search(queries, k + 1)
+    flat_ms = (time.perf_counter() - t0) * 1000.0 / len(queries)
+    t0 = time.perf_counter()
+    _, found = index.search(queries, k + 1)
+    index_ms = (time.perf_counter() - t0) * 1000.0 / len(queries)
+    truth_sets = _drop_source(truth, source, k)
+    found_sets = _drop_source(found, source, k)
+    hits = sum(len(t & f) for t, f in zip(truth_sets, found_sets))
+    total = sum(len(t) for t in truth_sets)
+    return hits / float(total or 1), flat_ms, index_ms
+
+
+def save_metadata(recipes: List[dict], extra: dict) -> RecipeStore:
+    store = RecipeStore.from_recipes(recipes, {"embedding_model": settings.MEAL_EMBEDDING_MODEL, **extra})
+    store.write(settings.MEAL_METADATA_PATH)
+    return store
+
+
+def write_index(index: faiss.Index) -> None:
+    # Ghi file tạm rồi thay thế: worker đang mmap index cũ không bị đọc file ghi dở
+    index_path = Path(settings.MEAL_INDEX_PATH)
+    index_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = index_path.with_name(index_path.name + ".tmp")
+    faiss.write_index(index, str(tmp))
+    tmp.replace(index_path)
+
+
+def index_stamp() -> dict:
+    """Kích thước file index vừa ghi; server chỉ ghép index với metadata khi khớp (không nạp cặp ghi dở)."""
+    return {"index_bytes": Path(settings.MEAL_INDEX_PATH).stat().st_size}
+
+
+def load_previous_build() -> dict:
     meta_path = Path(settings.MEAL_METADATA_PATH)
-    meta_path.parent.mkdir(parents=True, exist_ok=True)
-    meta = {
-        "embedding_model": settings.MEAL_EMBEDDING_MODEL,
-        "recipes": recipes,
+    if not meta_path.exists() or not Path(settings.MEAL_INDEX_PATH).exists():
+        return {}
+    header = RecipeStore.read_header(str(meta_path)) or {}
+    return {k: header.get(k) for k in ("embedding_model", "recipes_hash", "index_type", "format_version")}
+
+
+def previous_index_type() -> str:
+    index = faiss.read_index(settings.MEAL_INDEX_PATH)
+    if isinstance(index, faiss.IndexIVF):
+        return "ivf"
+    if isinstance(index, faiss.IndexHNSW):
+        return "hnsw"
+    return "flat"
+
+
+def convert_legacy_metadata(current_digest: str, started: float) -> dict:
+    """
+    Chuyển meal_index_meta.json (đúng danh sách công thức index hiện có được build từ đó) sang
+    RecipeStore nhị phân, giữ nguyên FAISS index. Không dùng recipes.json: nếu file này đã đổi,
+    id FAISS sẽ trỏ sai công thức và lần build sau lại tưởng là "unchanged".
+    """
+    legacy = Path(settings.MEAL_METADATA_PATH).with_suffix(".json")
+    if not legacy.exists() or not Path(settings.MEAL_INDEX_PATH).exists():
+        raise RuntimeError(f"--metadata-only cần {legacy} và {settings.MEAL_INDEX_PATH}; hãy build lại toàn bộ")
+    payload = read_json(str(legacy))
+    recipes = payload.get("recipes", []) if isinstance(payload, dict) else payload
+    ntotal = faiss.read_index(settings.MEAL_INDEX_PATH).ntotal
+    if ntotal != len(recipes):
+        raise RuntimeError(f"{legacy} có {len(recipes)} công thức nhưng index có {ntotal} vector; hãy build lại toàn bộ")
+    digest = recipes_hash(recipes)
+    embedding_model = payload.get("embedding_model") if isinstance(payload, dict) else None
+    t0 = time.perf_counter()
+    store = RecipeStore.from_recipes(recipes, {
+        "embedding_model": embedding_model or settings.MEAL_EMBEDDING_MODEL,
+        "recipes_hash": digest,
+        "index_type": previous_index_type(),
+        **index_stamp(),
+    })
+    store.write(settings.MEAL_METADATA_PATH)
+    return {
+        "recipes": len(recipes),
+        "index_type": store.header.get("index_type"),
+        "status": "metadata",
+        "codec": store.codec,
+        # recipes.json đã khác danh sách trong index: lần chạy thường sau sẽ build lại
+        "recipes_json_changed": digest != current_digest,
+        "write_s": round(time.perf_counter() - t0, 3),
+        "total_s": round(time.perf_counter() - started, 3),
     }
-    meta_path.write_text(json.dumps(meta, ensure_ascii=False, indent=2), encoding="utf-8")
 
 
-def build_index() -> None:
+def build_index(args) -> dict:
+    report: dict = {}
+    started = time.perf_counter()
     recipes = load_recipes()
     if not recipes:
         raise RuntimeError("No recipes found; please populate data/recipes.json")
+    index_type = choose_index_type(args.index_type, len(recipes))
+    digest = recipes_hash(recipes)
+    report.update({"recipes": len(recipes), "index_type": index_type})
+
+    if args.metadata_only:
+        return convert_legacy_metadata(digest, started)
+
+    previous = load_previous_build()
+    if not args.force and previous == {
+        "embedding_model": settings.MEAL_EMBEDDING_MODEL,
+        "recipes_hash": digest,
+        "index_type": index_type,
+        "format_version": FORMAT_VERSION,
+    }:
+        report["status"] = "unchanged"
+        report["total_s"] = round(time.perf_counter() - started, 3)
+        return report
+
     corpus = build_corpus(recipes)
-    model = SentenceTransformer(settings.MEAL_EMBEDDING_MODEL)
-    embeddings = model.encode(corpus, normalize_embeddings=True)
-    vectors = np.asarray(embeddings, dtype=np.float32)
-    dim = vectors.shape[1]
-    index = faiss.IndexFlatIP(dim)
-    index.add(vectors)
-    index_path = Path(settings.MEAL_INDEX_PATH)
-    index_path.parent.mkdir(parents=True, exist_ok=True)
-    faiss.write_index(index, str(index_path))
-    save_metadata(recipes)
-    print(f"[meal-index] Built index for {len(recipes)} recipes -> {index_path}")
+    vectors = embed_corpus(corpus, args, report)
+
+    t0 = time.perf_counter()
+    index = build_faiss_index(vectors, index_type)
+    report["index_build_s"] = round(time.perf_counter() - t0, 3)
+
+    if index_type != "flat":
+        recall, flat_ms, index_ms = measure_recall(
+            index, vectors, args.recall_k, args.recall_samples, args.recall_noise
+        )
+        report.update({
+            f"recall@{max(1, min(args.recall_k, len(recipes) - 1))}": round(recall, 4),
+            "flat_query_ms": round(flat_ms, 3),
+            "index_query_ms": round(index_ms, 3),
+        })
+
+    t0 = time.perf_counter()
+    # Index trước, metadata sau (mang index_bytes của file vừa ghi)
+    write_index(index)
+    store = save_metadata(recipes, {"recipes_hash": digest, "index_type": index_type, **index_stamp()})
+    report["codec"] = store.codec
+    report["metadata_bytes"] = Path(settings.MEAL_METADATA_PATH).stat().st_size
+    report["write_s"] = round(time.perf_counter() - t0, 3)
+    report["status"] = "built"
+    report["total_s"] = round(time.perf_counter() - started, 3)
+    return report
 
 
 def main():
     parser = argparse.ArgumentParser(description="Build meal assistant FAISS index")
-    parser.parse_args()
-    build_index()
+    parser.add_argument("--index-type", choices=["auto", "flat", "ivf", "hnsw"], default=settings.MEAL_INDEX_TYPE)
+    parser.add_argument("--batch-size", type=int, default=settings.MEAL_EMBED_BATCH_SIZE)
+    parser.add_argument("--workers", type=int, default=settings.MEAL_EMBED_WORKERS, help="Số process encode (>1: multi-process)")
+    parser.add_argument("--no-cache", action="store_true", help="Bỏ qua cache embedding, encode lại toàn bộ")
+    parser.add_argument("--force", action="store_true", help="Build lại kể cả khi recipes không đổi")
+    parser.add_argument("--metadata-only", action="store_true", help="Chuyển meal_index_meta.json cũ sang metadata nhị phân, giữ index hiện có")
+    parser.add_argument("--recall-k", type=int, default=10)
+    parser.add_argument("--recall-samples", type=int, default=200)
+    parser.add_argument("--recall-noise", type=float, default=0.5, help="Độ lớn nhiễu cộng vào truy vấn đo recall")
+    args = parser.parse_args()
+    report = build_index(args)
+    print(f"[meal-index] {report['status']}: {report['recipes']} recipes ({report['index_type']}) -> {settings.MEAL_INDEX_PATH}")
+    print("[meal-index] report:", json.dumps(report, ensure_ascii=False))
 
 
 if __name__ == "__main__":
@@ -0,0 +1,82 @@
+"""Embed catalog reference images into the FAISS product index used by PRODUCT_RECOGNITION_MODE=embedding."""
+from __future__ import annotations
+
+import argparse
+from typing import Dict, List
+
+from serverAI.core.config import settings
+from serverAI.modules.product_recognition.embedding_index import (
+    ProductEmbedder,
+    ProductEmbeddingIndex,
+    load_reference_images,
+)
+from serverAI.utils.file_utils import read_json
+
+
+def load_catalog() -> Dict[str, dict]:
+    payload = read_json(settings.PRODUCT_METADATA_PATH)
+    items = payload.get("items", payload) if isinstance(payload, dict) else payload
+    catalog = {}
+    for raw in items:
+        ref = str(raw.get("reference_id") or raw.get("id") or "").strip()
+        if ref:
+            catalog[ref] = raw
+    return catalog
+
+
+def embed_product(embedder: ProductEmbedder, item: dict):
+    images = load_reference_images(item.get("reference_image", []), settings.PRODUCT_REFERENCE_IMAGE_ROOT)
+    if not images:
+        return None
+    return embedder.embed(images)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build / update product embedding index")
+    parser.add_argument("--add", nargs="*", default=None, metavar="REF", help="Thêm/cập nhật các SKU vào index hiện có")
+    parser.add_argument("--remove", nargs="*", default=None, metavar="REF", help="Xoá vector của các SKU")
+    args = parser.parse_args()
+
+    index = ProductEmbeddingIndex(settings.PRODUCT_INDEX_PATH, settings.PRODUCT_INDEX_META_PATH)
+    incremental = args.add is not None or args.remove is not None
+    embedder_name = f"{settings.PRODUCT_EMBED_MODEL}/{settings.PRODUCT_EMBED_PRETRAINED}"
+
+    if incremental:
+        index.load()
+        for ref in args.remove or []:
+            print(f"[product-index] removed {index.remove(ref)} vectors of {ref}")
+    else:
+        index.embedding_model = embedder_name
+
+    refs: List[str] = []
+    catalog = load_catalog()
+    if args.add:
+        refs = args.add
+    elif not incremental:
+        refs = list(catalog)
+
+    if refs:
+        embedder = ProductEmbedder(
+            settings.PRODUCT_EMBED_MODEL,
+            settings.PRODUCT_EMBED_PRETRAINED,
+            batch_size=settings.PRODUCT_EMBED_BATCH_SIZE,
+        )
+        for ref in refs:
+            item = catalog.get(ref)
+            if item is None:
+                print(f"[product-index] {ref} not in catalog, skipped")
+                continue
+            vectors = embed_product(embedder, item)
+            if vectors is None:
+                print(f"[product-index] {ref} has no readable reference images, skipped")
+                continue
+            added = index.replace(ref, vectors)
+            print(f"[product-index] {ref}: {added} vectors")
+
+    index.save()
+    stats = index.stats()
+    print(f"[product-index] {stats['vectors']} vectors / {stats['products']} products -> {settings.PRODUCT_INDEX_PATH}")
+
+
+if __name__ == "__main__":
+    main()
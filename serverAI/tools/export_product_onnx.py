@@ -0,0 +1,220 @@
+"""Export product classifier/detector (best.pt, yolov8n.pt) to ONNX, optionally int8-quantized."""
+from __future__ import annotations
+
+import argparse
+import json
+import sys
+from pathlib import Path
+from typing import Callable, Iterator, List, Optional
+
+import cv2
+import numpy as np
+
+# modules/* import tuyệt đối `core.*` (như khi chạy server trong serverAI/)
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from serverAI.core.config import settings
+from serverAI.modules.product_recognition.onnx_backend import detector_input, meta_path_for
+from serverAI.modules.product_recognition.preprocess import BatchPreprocessor, IMAGENET_MEAN, IMAGENET_STD
+
+IMAGE_EXTS = {".jpg", ".jpeg", ".png", ".bmp", ".webp"}
+
+
+def iter_images(folder: str, limit: int) -> Iterator[np.ndarray]:
+    paths = sorted(p for p in Path(folder).rglob("*") if p.suffix.lower() in IMAGE_EXTS)
+    count = 0
+    for p in paths:
+        img = cv2.imread(str(p), cv2.IMREAD_COLOR)
+        if img is None:
+            continue
+        yield img
+        count += 1
+        if count >= limit:
+            break
+
+
+def write_meta(onnx_path: Path, meta: dict) -> None:
+    meta_path_for(str(onnx_path)).write_text(json.dumps(meta, ensure_ascii=False, indent=2), encoding="utf-8")
+
+
+def export_classifier(model_path: str, out_dir: Path, imgsz: Optional[int], opset: int) -> tuple[Path, dict]:
+    """Ưu tiên YOLO-cls; nếu không phải thì export TorchScript / nn.Module bằng torch.onnx."""
+    try:
+        from ultralytics import YOLO
+
+        model = YOLO(model_path)
+        if getattr(model, "task", None) == "classify":
+            size = imgsz or int(getattr(model, "overrides", {}).get("imgsz", 224) or 224)
+            exported = Path(model.export(format="onnx", imgsz=size, dynamic=True, opset=opset, simplify=True))
+            out = out_dir / f"{Path(model_path).stem}.onnx"
+            if exported.resolve() != out.resolve():
+                exported.replace(out)
+            names = getattr(model, "names", None) or {}
+            meta = {
+                "task": "classify",
+                "source": "ultralytics",
+                "names": {str(k): v for k, v in dict(names).items()},
+                "imgsz": [size, size],
+                "softmax": False,
+                "preprocess": {
+                    "resize": size,
+                    "crop": size,
+                    "mean": [0.0, 0.0, 0.0],
+                    "std": [1.0, 1.0, 1.0],
+                    "interpolation": "bilinear",
+                },
+            }
+            return out, meta
+    except Exception as exc:
+        print("[export] YOLO-cls export skipped:", exc)
+
+    import torch
+    from serverAI.modules.product_recognition.model_loader import load_torch_module, load_torchscript
+
+    try:
+        model = load_torchscript(model_path)
+        source = "torchscript"
+    except Exception:
+        model = load_torch_module(model_path)
+        source = "torch-module"
+    size = imgsz or 224
+    out = out_dir / f"{Path(model_path).stem}.onnx"
+    dummy = torch.zeros(1, 3, size, size, dtype=torch.float32)
+    torch.onnx.export(
+        model,
+        dummy,
+        str(out),
+        input_names=["images"],
+        output_names=["logits"],
+        dynamic_axes={"images": {0: "batch"}, "logits": {0: "batch"}},
+        opset_version=opset,
+    )
+    meta = {
+        "task": "classify",
+        "source": source,
+        "imgsz": [size, size],
+        "softmax": True,
+        "preprocess": {
+            "resize": int(round(size * 256 / 224)),
+            "crop": size,
+            "mean": list(IMAGENET_MEAN),
+            "std": list(IMAGENET_STD),
+            "interpolation": "bicubic",
+        },
+    }
+    return out, meta
+
+
+def export_detector(model_path: str, out_dir: Path, imgsz: Optional[int], opset: int) -> tuple[Path, dict]:
+    from ultralytics import YOLO
+
+    model = YOLO(model_path)
+    size = imgsz or 640
+    exported = Path(model.export(format="onnx", imgsz=size, dynamic=False, opset=opset, simplify=True))
+    out = out_dir / f"{Path(model_path).stem}.onnx"
+    if exported.resolve() != out.resolve():
+        exported.replace(out)
+    names = getattr(model, "names", None) or {}
+    meta = {
+        "task": "detect",
+        "source": "ultralytics",
+        "names": {str(k): v for k, v in dict(names).items()},
+        "imgsz": [size, size],
+    }
+    return out, meta
+
+
+def classifier_calibration(meta: dict) -> Callable[[np.ndarray], np.ndarray]:
+    pre = meta["preprocess"]
+    tfm = BatchPreprocessor(
+        resize=pre["resize"],
+        crop=pre["crop"],
+        mean=pre["mean"],
+        std=pre["std"],
+        interpolation=pre["interpolation"],
+    )
+    return lambda img: tfm([img]).copy()
+
+
+def detector_calibration(meta: dict) -> Callable[[np.ndarray], np.ndarray]:
+    size = int(meta["imgsz"][0])
+    return lambda img: detector_input(img, size)[0]
+
+
+def quantize_int8(fp32_path: Path, calib_dir: str, limit: int, preprocess: Callable[[np.ndarray], np.ndarray]) -> Path:
+    """Static int8 (QDQ, per-channel weights) với dữ liệu calibration từ thư mục ảnh."""
+    import onnxruntime as ort
+    from onnxruntime.quantization import CalibrationDataReader, QuantFormat, QuantType, quantize_static
+    from onnxruntime.quantization.shape_inference import quant_pre_process
+
+    input_name = ort.InferenceSession(str(fp32_path), providers=["CPUExecutionProvider"]).get_inputs()[0].name
+
+    class _Reader(CalibrationDataReader):
+        def __init__(self):
+            self._it = iter_images(calib_dir, limit)
+
+        def get_next(self):
+            img = next(self._it, None)
+            if img is None:
+                return None
+            return {input_name: preprocess(img)}
+
+    prepped = fp32_path.with_name(f"{fp32_path.stem}.prep.onnx")
+    quant_pre_process(str(fp32_path), str(prepped))
+    out = fp32_path.with_name(f"{fp32_path.stem}.int8.onnx")
+    quantize_static(
+        str(prepped),
+        str(out),
+        _Reader(),
+        quant_format=QuantFormat.QDQ,
+        per_channel=True,
+        activation_type=QuantType.QUInt8,
+        weight_type=QuantType.QInt8,
+    )
+    prepped.unlink(missing_ok=True)
+    return out
+
+
+def run(which: List[str], out_dir: Path, args) -> None:
+    out_dir.mkdir(parents=True, exist_ok=True)
+    jobs = []
+    if "cls" in which:
+        jobs.append(("cls", args.cls_model, export_classifier, classifier_calibration, args.cls_imgsz))
+    if "det" in which:
+        if not args.det_model:
+            raise RuntimeError("PRODUCT_DET_MODEL is not configured")
+        jobs.append(("det", args.det_model, export_detector, detector_calibration, args.det_imgsz))
+
+    for tag, model_path, export_fn, calib_fn, imgsz in jobs:
+        onnx_path, meta = export_fn(model_path, out_dir, imgsz, args.opset)
+        write_meta(onnx_path, meta)
+        print(f"[export] {tag}: {model_path} -> {onnx_path}")
+        if args.quantize:
+            if not args.calib_dir:
+                raise RuntimeError("--quantize requires --calib-dir")
+            q_path = quantize_int8(onnx_path, args.calib_dir, args.calib_limit, calib_fn(meta))
+            write_meta(q_path, {**meta, "quantized": "int8-static"})
+            fp32_mb = onnx_path.stat().st_size / 1e6
+            int8_mb = q_path.stat().st_size / 1e6
+            print(f"[export] {tag}: int8 -> {q_path} ({fp32_mb:.1f}MB -> {int8_mb:.1f}MB)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export product recognition models to ONNX")
+    parser.add_argument("--which", choices=["cls", "det", "both"], default="both")
+    parser.add_argument("--cls-model", default=settings.PRODUCT_CLS_MODEL)
+    parser.add_argument("--det-model", default=settings.PRODUCT_DET_MODEL)
+    parser.add_argument("--cls-imgsz", type=int, default=None)
+    parser.add_argument("--det-imgsz", type=int, default=None)
+    parser.add_argument("--out-dir", default=str(Path(settings.PRODUCT_CLS_MODEL).parent))
+    parser.add_argument("--opset", type=int, default=17)
+    parser.add_argument("--quantize", action="store_true", help="Static int8 quantization")
+    parser.add_argument("--calib-dir", default=None, help="Thư mục ảnh calibration (quét đệ quy)")
+    parser.add_argument("--calib-limit", type=int, default=200)
+    args = parser.parse_args()
+    which = ["cls", "det"] if args.which == "both" else [args.which]
+    run(which, Path(args.out_dir), args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,244 @@
+"""Quantize buffalo_l detector + ArcFace recognizer to int8 for FACE_RUNTIME=cpu-int8, and check accuracy vs fp32."""
+from __future__ import annotations
+
+import argparse
+import json
+import shutil
+import sys
+import time
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import cv2
+import numpy as np
+from insightface.utils import face_align
+
+# modules/* import tuyệt đối `core.*` (như khi chạy server trong serverAI/)
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from serverAI.core.config import settings
+from serverAI.modules.face_auth.cpu_runtime import face_session_options, load_face_model
+
+IMAGE_EXTS = {".jpg", ".jpeg", ".png", ".bmp", ".webp"}
+# Tên file trong pack buffalo_l
+DEFAULT_DET = "det_10g.onnx"
+DEFAULT_REC = "w600k_r50.onnx"
+
+
+def iter_images(folder: str, limit: int) -> Iterator[np.ndarray]:
+    paths = sorted(p for p in Path(folder).rglob("*") if p.suffix.lower() in IMAGE_EXTS)
+    count = 0
+    for p in paths:
+        img = cv2.imread(str(p), cv2.IMREAD_COLOR)
+        if img is None:
+            continue
+        yield img
+        count += 1
+        if count >= limit:
+            break
+
+
+def retinaface_blob(img: np.ndarray, size: Tuple[int, int]) -> np.ndarray:
+    """Tiền xử lý giống RetinaFace.detect: resize giữ tỉ lệ, pad góc trên-trái, (x-127.5)/128, RGB."""
+    w, h = size
+    im_ratio = img.shape[0] / img.shape[1]
+    if im_ratio > h / w:
+        new_h, new_w = h, int(h / im_ratio)
+    else:
+        new_w, new_h = w, int(w * im_ratio)
+    canvas = np.zeros((h, w, 3), dtype=np.uint8)
+    canvas[:new_h, :new_w] = cv2.resize(img, (new_w, new_h))
+    return cv2.dnn.blobFromImage(canvas, 1.0 / 128.0, (w, h), (127.5, 127.5, 127.5), swapRB=True)
+
+
+def aligned_faces(det, images: List[np.ndarray], image_size: int) -> List[np.ndarray]:
+    crops = []
+    for img in images:
+        bboxes, kpss = det.detect(img, max_num=1, metric="default")
+        if bboxes is None or len(bboxes) == 0 or kpss is None:
+            continue
+        crops.append(face_align.norm_crop(img, landmark=kpss[0], image_size=image_size))
+    return crops
+
+
+def quantize(fp32_path: Path, out_path: Path, blobs: List[np.ndarray], per_channel: bool) -> None:
+    """Static int8 (QDQ) như tools/export_product_onnx.py, dữ liệu calibration là các blob đã tiền xử lý."""
+    import onnxruntime as ort
+    from onnxruntime.quantization import CalibrationDataReader, QuantFormat, QuantType, quantize_static
+    from onnxruntime.quantization.shape_inference import quant_pre_process
+
+    if not blobs:
+        raise RuntimeError(f"No calibration data for {fp32_path.name}")
+    input_name = ort.InferenceSession(str(fp32_path), providers=["CPUExecutionProvider"]).get_inputs()[0].name
+
+    class _Reader(CalibrationDataReader):
+        def __init__(self):
+            self._it = iter(blobs)
+
+        def get_next(self):
+            blob = next(self._it, None)
+            return None if blob is None else {input_name: blob}
+
+    prepped = out_path.with_name(f"{out_path.stem}.prep.onnx")
+    quant_pre_process(str(fp32_path), str(prepped))
+    quantize_static(
+        str(prepped),
+        str(out_path),
+        _Reader(),
+        quant_format=QuantFormat.QDQ,
+        per_channel=per_channel,
+        activation_type=QuantType.QUInt8,
+        weight_type=QuantType.QInt8,
+    )
+    prepped.unlink(missing_ok=True)
+
+
+def run_quantize(args) -> None:
+    out_dir = Path(args.out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    det_size = (args.det_size, args.det_size)
+    images = list(iter_images(args.calib_dir, args.calib_limit))
+    print(f"[face-quant] calibration images: {len(images)}")
+
+    det_out = out_dir / "detection.onnx"
+    if args.skip_det:
+        shutil.copyfile(args.det_model, det_out)
+        print(f"[face-quant] detection: copied fp32 -> {det_out}")
+    else:
+        quantize(Path(args.det_model), det_out, [retinaface_blob(img, det_size) for img in images], per_channel=False)
+        print(f"[face-quant] detection: int8 -> {det_out}")
+
+    # Calibration cho recognizer: mặt đã align bằng detector fp32
+    det = load_face_model("detection", args.det_model)
+    det.prepare(-1, input_size=det_size)
+    rec = load_face_model("recognition", args.rec_model)
+    crops = aligned_faces(det, images, rec.input_size[0])
+    print(f"[face-quant] aligned faces for recognizer calibration: {len(crops)}")
+    rec_blobs = [
+        cv2.dnn.blobFromImage(c, 1.0 / rec.input_std, rec.input_size, (rec.input_mean,) * 3, swapRB=True)
+        for c in crops
+    ]
+    rec_out = out_dir / "recognition.onnx"
+    quantize(Path(args.rec_model), rec_out, rec_blobs, per_channel=True)
+    print(f"[face-quant] recognition: int8 -> {rec_out}")
+
+    manifest = {
+        "source": {"detection": str(args.det_model), "recognition": str(args.rec_model)},
+        "det_size": list(det_size),
+        "calibration_images": len(images),
+        "calibration_faces": len(crops),
+        "detection_quantized": not args.skip_det,
+    }
+    (out_dir / "manifest.json").write_text(json.dumps(manifest, indent=2), encoding="utf-8")
+
+
+def _timed(fn, *args):
+    t0 = time.perf_counter()
+    out = fn(*args)
+    return out, (time.perf_counter() - t0) * 1000.0
+
+
+def _pipeline(det, rec, img) -> Tuple[Optional[np.ndarray], int, float, float]:
+    """Trả về (embedding đã normalize | None, số mặt, ms detect, ms recognize)."""
+    (bboxes, kpss), det_ms = _timed(det.detect, img, None, 0, "default")
+    n = 0 if bboxes is None else len(bboxes)
+    if n == 0 or kpss is None:
+        return None, n, det_ms, 0.0
+    crop = face_align.norm_crop(img, landmark=kpss[0], image_size=rec.input_size[0])
+    feat, rec_ms = _timed(rec.get_feat, [crop])
+    feat = np.asarray(feat, dtype=np.float32).reshape(-1)
+    return feat / (float(np.linalg.norm(feat)) or 1.0), n, det_ms, rec_ms
+
+
+def run_check(args) -> Dict:
+    """So sánh embedding int8 với fp32 trên tập mẫu (cùng ảnh, mỗi bên tự detect + align)."""
+    det_size = (args.det_size, args.det_size)
+    opts = face_session_options(
+        settings.FACE_ORT_INTRA_OP_THREADS,
+        settings.FACE_ORT_INTER_OP_THREADS,
+        settings.FACE_ORT_GRAPH_OPT_LEVEL,
+        settings.FACE_ORT_EXECUTION_MODE,
+    )
+    out_dir = Path(args.out_dir)
+    pairs = {
+        "fp32": (load_face_model("detection", args.det_model, opts), load_face_model("recognition", args.rec_model, opts)),
+        "int8": (
+            load_face_model("detection", str(out_dir / "detection.onnx"), opts),
+            load_face_model("recognition", str(out_dir / "recognition.onnx"), opts),
+        ),
+    }
+    for det, rec in pairs.values():
+        det.prepare(-1, input_size=det_size)
+        rec.prepare(-1)
+
+    cosines: List[float] = []
+    count_mismatch = 0
+    timings = {k: {"det": [], "rec": []} for k in pairs}
+    samples = 0
+    for img in iter_images(args.sample_dir, args.sample_limit):
+        samples += 1
+        results = {}
+        for name, (det, rec) in pairs.items():
+            emb, n, det_ms, rec_ms = _pipeline(det, rec, img)
+            results[name] = (emb, n)
+            timings[name]["det"].append(det_ms)
+            if emb is not None:
+                timings[name]["rec"].append(rec_ms)
+        if results["fp32"][1] != results["int8"][1]:
+            count_mismatch += 1
+        if results["fp32"][0] is not None and results["int8"][0] is not None:
+            cosines.append(float(np.dot(results["fp32"][0], results["int8"][0])))
+
+    def _ms(values: List[float]) -> float:
+        return round(float(np.mean(values)), 2) if values else 0.0
+
+    cos = np.asarray(cosines, dtype=np.float32)
+    report = {
+        "samples": samples,
+        "compared_faces": int(cos.size),
+        "face_count_mismatch": count_mismatch,
+        "cosine_mean": round(float(cos.mean()), 4) if cos.size else None,
+        "cosine_min": round(float(cos.min()), 4) if cos.size else None,
+        "cosine_p5": round(float(np.percentile(cos, 5)), 4) if cos.size else None,
+        "below_threshold": int((cos < args.min_cosine).sum()) if cos.size else 0,
+        "latency_ms": {
+            name: {"det": _ms(t["det"]), "rec": _ms(t["rec"])} for name, t in timings.items()
+        },
+    }
+    fp32, int8 = report["latency_ms"]["fp32"], report["latency_ms"]["int8"]
+    report["speedup"] = {
+        part: round(fp32[part] / int8[part], 2) if int8[part] else None for part in ("det", "rec")
+    }
+    print(json.dumps(report, indent=2))
+    return report
+
+
+def main():
+    pack = Path.home() / ".insightface" / "models" / settings.FACE_MODEL_NAME
+    parser = argparse.ArgumentParser(description="Int8 quantization + accuracy check for the face CPU runtime")
+    parser.add_argument("--det-model", default=str(pack / DEFAULT_DET))
+    parser.add_argument("--rec-model", default=str(pack / DEFAULT_REC))
+    parser.add_argument("--out-dir", default=settings.FACE_INT8_DIR)
+    parser.add_argument("--det-size", type=int, default=640)
+    parser.add_argument("--calib-dir", default=None, help="Thư mục ảnh chân dung để calibration (quét đệ quy)")
+    parser.add_argument("--calib-limit", type=int, default=200)
+    parser.add_argument("--skip-det", action="store_true", help="Giữ detector fp32, chỉ quantize recognizer")
+    parser.add_argument("--check", action="store_true", help="Chạy accuracy check int8 vs fp32")
+    parser.add_argument("--sample-dir", default=None, help="Tập ảnh mẫu cho --check (mặc định = --calib-dir)")
+    parser.add_argument("--sample-limit", type=int, default=200)
+    parser.add_argument("--min-cosine", type=float, default=0.98, help="Ngưỡng cosine để đếm mẫu lệch nhiều")
+    args = parser.parse_args()
+
+    if args.calib_dir:
+        run_quantize(args)
+    elif not args.check:
+        parser.error("--calib-dir is required unless running --check only")
+    if args.check:
+        args.sample_dir = args.sample_dir or args.calib_dir
+        if not args.sample_dir:
+            parser.error("--check requires --sample-dir")
+        run_check(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+import base64
+from typing import Dict, Iterable, Optional
+
+import numpy as np
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response
+
+_ORJSON_ERROR: Optional[str] = None
+try:
+    import orjson
+    from fastapi.responses import ORJSONResponse
+except Exception as _e:
+    orjson = None
+    ORJSONResponse = None
+    _ORJSON_ERROR = str(_e)
+
+_MSGPACK_ERROR: Optional[str] = None
+try:
+    import msgpack
+except Exception as _e:
+    msgpack = None
+    _MSGPACK_ERROR = str(_e)
+
+MSGPACK_MEDIA_TYPE = "application/msgpack"
+VECTOR_FORMATS = {"json": None, "f32": "<f4", "f16": "<f2"}
+
+
+def default_response_class():
+    """ORJSONResponse cho toàn API nếu có orjson, không thì JSONResponse chuẩn."""
+    return ORJSONResponse if ORJSONResponse is not None else JSONResponse
+
+
+def _accept_parts(request: Request):
+    for part in request.headers.get("accept", "").split(","):
+        media, *params = [p.strip() for p in part.split(";")]
+        yield media.lower(), dict(p.split("=", 1) for p in params if "=" in p)
+
+
+def negotiate(request: Request) -> Dict[str, str]:
+    """
+    Chọn định dạng trả về:
+      - body: "msgpack" nếu Accept có application/msgpack (và đã cài msgpack), ngược lại "json"
+      - vec: query `?vec=f32|f16|json` hoặc tham số Accept `vec=...` (vd. "application/json; vec=f16")
+    """
+    body, vec = "json", request.query_params.get("vec")
+    for media, params in _accept_parts(request):
+        if media == MSGPACK_MEDIA_TYPE and msgpack is not None:
+            body = "msgpack"
+        if vec is None and "vec" in params:
+            vec = params["vec"]
+    vec = (vec or "json").lower()
+    if vec not in VECTOR_FORMATS:
+        vec = "json"
+    return {"body": body, "vec": vec}
+
+
+def _encode_vector(values, vec: str, body: str):
+    arr = np.asarray(values, dtype=np.float32).reshape(-1)
+    dtype = VECTOR_FORMATS[vec]
+    if dtype is None:
+        return arr.tolist(), None
+    raw = arr.astype(dtype, copy=False).tobytes()
+    if body == "msgpack":
+        return raw, f"{vec}le"
+    return base64.b64encode(raw).decode("ascii"), f"{vec}le-b64"
+
+
+def vector_response(request: Request, payload: Dict, vector_fields: Iterable[str] = ("embedding",)) -> Response:
+    """
+    Trả `payload` theo định dạng client yêu cầu. Các field vector (list/ndarray) được giữ nguyên
+    dạng list float (mặc định) hoặc mã hoá little-endian float32/float16: base64 trong JSON,
+    bytes thô trong msgpack; kèm field `<tên>Encoding` để client decode.
+    """
+    fmt = negotiate(request)
+    out = dict(payload)
+    for key in vector_fields:
+        value = out.get(key)
+        if value is None:
+            continue
+        out[key], encoding = _encode_vector(value, fmt["vec"], fmt["body"])
+        if encoding is not None:
+            out[f"{key}Encoding"] = encoding
+    if fmt["body"] == "msgpack":
+        return Response(content=msgpack.packb(out, use_bin_type=True), media_type=MSGPACK_MEDIA_TYPE)
+    return default_response_class()(content=out)
@@ -0,0 +1,42 @@
+from typing import List, Optional, Tuple
+from starlette.requests import Request
+
+async def read_image_body(request: Request, field: str = "file") -> Optional[bytes]:
+    """
+    Đọc ảnh nhị phân từ request:
+      - multipart/form-data: lấy file ở field `field` (mặc định "file")
+      - còn lại (application/octet-stream, image/*): toàn bộ body
+    """
+    content_type = request.headers.get("content-type", "").lower()
+    if content_type.startswith("multipart/form-data"):
+        form = await request.form()
+        upload = form.get(field)
+        if upload is None or isinstance(upload, str):
+            return None
+        try:
+            return await upload.read()
+        finally:
+            await upload.close()
+    return await request.body()
+
+async def read_upload_parts(request: Request, fields=("frames", "file")) -> List[Tuple[bytes, str]]:
+    """
+    Đọc nhiều file từ 1 request, trả về [(bytes, content_type)]:
+      - multipart/form-data: mọi file ở các field `fields` (field lặp lại được)
+      - còn lại: toàn bộ body là 1 phần duy nhất
+    """
+    content_type = request.headers.get("content-type", "").lower()
+    if not content_type.startswith("multipart/form-data"):
+        body = await request.body()
+        return [(body, content_type)] if body else []
+    form = await request.form()
+    parts: List[Tuple[bytes, str]] = []
+    for field in fields:
+        for upload in form.getlist(field):
+            if isinstance(upload, str):
+                continue
+            try:
+                parts.append((await upload.read(), (upload.content_type or "").lower()))
+            finally:
+                await upload.close()
+    return parts